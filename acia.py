@@ -0,0 +1,227 @@
+import os
+import select
+from devices import Device
+from clock import Clock
+
+# Register offsets
+DATA = 0x0
+STATUS = 0x1
+COMMAND = 0x2
+CONTROL = 0x3
+
+# Status bits
+STATUS_RDRF = 0x08
+STATUS_TDRE = 0x10
+STATUS_IRQ = 0x80
+
+# Command bits
+COMMAND_DTR = 0x01
+COMMAND_RX_IRQ_DISABLED = 0x02
+COMMAND_TX_CONTROL = 0x0C
+COMMAND_TX_IRQ = 0x04
+
+
+def _fileno(stream):
+    return stream if isinstance(stream, int) else stream.fileno()
+
+
+class ACIA6551(Device):
+    """
+    6551 Asynchronous Communications Interface Adapter connected to host file descriptors.
+
+    rx and tx can be file descriptors or anything with fileno(): sys.stdin/sys.stdout, a pipe or a local socket. Both
+    are switched to non-blocking mode until close(), which puts back the mode they had, or the end of a with block.
+    Transmitted bytes are collected in a buffer and written out with one syscall
+    per tx_buffer_size bytes, or flush_interval cycles after the first unflushed byte. Received bytes are read in
+    chunks of up to rx_chunk_size, and an empty receive buffer polls the host at most once every poll_interval
+    cycles, so a guest spinning on the status register does not turn into a syscall per read.
+
+    The transmitter is always ready, bytes leave the moment they are written. Baud rate, parity and framing set up in
+    the control register are ignored. irq is called as irq(source, asserted), e.g. CPU6502.set_irq.
+    """
+    stable_registers = frozenset({COMMAND, CONTROL})
+
+    def __init__(self, clock: Clock, base: int, rx=None, tx=None, irq=None, tx_buffer_size: int = 4096,
+                 rx_chunk_size: int = 4096, poll_interval: int = 1000, flush_interval: int = 100_000):
+        super().__init__(clock, base, 4)
+        self.irq = irq
+        # Keep the stream objects alive, closing them would close the descriptors under us.
+        self._rx_stream = rx
+        self._tx_stream = tx
+        self.rx_fd = None if rx is None else _fileno(rx)
+        self.tx_fd = None if tx is None else _fileno(tx)
+        # Blocking mode of each descriptor before we took it, for close() to put back.
+        self._blocking = {}
+        for fd in (self.rx_fd, self.tx_fd):
+            if fd is not None and fd not in self._blocking:
+                self._blocking[fd] = os.get_blocking(fd)
+                os.set_blocking(fd, False)
+        self.tx_buffer_size = tx_buffer_size
+        self.rx_chunk_size = rx_chunk_size
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+
+        self.command = 0
+        self.control = 0
+        self._rx_buffer = b''
+        self._rx_position = 0
+        self._rx_eof = rx is None
+        self._last_poll = None
+        self._tx_buffer = bytearray()
+        self._flush_event = None
+        self._irq_asserted = False
+
+        # Throughput counters
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.rx_syscalls = 0
+        self.tx_syscalls = 0
+
+    def stats(self) -> dict:
+        return {
+            'rx_bytes': self.rx_bytes,
+            'tx_bytes': self.tx_bytes,
+            'rx_syscalls': self.rx_syscalls,
+            'tx_syscalls': self.tx_syscalls,
+            'tx_buffered': len(self._tx_buffer),
+        }
+
+    def _rx_ready(self) -> bool:
+        return self._rx_position < len(self._rx_buffer)
+
+    def _poll(self, force: bool = False):
+        if self._rx_ready() or self._rx_eof:
+            return
+        cycle = self.synced_cycle
+        if not force and self._last_poll is not None and cycle - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = cycle
+        self.rx_syscalls += 1
+        try:
+            data = os.read(self.rx_fd, self.rx_chunk_size)
+        except BlockingIOError:
+            return
+        if not data:
+            self._rx_eof = True
+            return
+        self._rx_buffer = data
+        self._rx_position = 0
+
+    def _status(self) -> int:
+        status = STATUS_TDRE
+        if self._rx_ready():
+            status |= STATUS_RDRF
+        if self._irq_asserted:
+            status |= STATUS_IRQ
+        return status
+
+    def read(self, offset: int) -> int:
+        if offset == DATA:
+            self._poll()
+            if not self._rx_ready():
+                return 0
+            value = self._rx_buffer[self._rx_position]
+            self._rx_position += 1
+            self.rx_bytes += 1
+            self._update_irq()
+            if not self._rx_ready():
+                self._reschedule()
+            return value
+        if offset == STATUS:
+            self._poll()
+            self._update_irq()
+            return self._status()
+        if offset == COMMAND:
+            return self.command
+        return self.control
+
+    def write(self, offset: int, value: int):
+        if offset == DATA:
+            self.tx_bytes += 1
+            if self.tx_fd is None:
+                return
+            self._tx_buffer.append(value)
+            if len(self._tx_buffer) >= self.tx_buffer_size:
+                self.flush()
+            elif self._flush_event is None:
+                self._flush_event = self.clock.events.schedule(self.synced_cycle + self.flush_interval,
+                                                               self._flush_due)
+        elif offset == STATUS:
+            # Programmed reset
+            self.command &= 0xE0
+            self._update_irq()
+            self._reschedule()
+        elif offset == COMMAND:
+            self.command = value
+            self._update_irq()
+            self._reschedule()
+        else:
+            self.control = value
+
+    def _update_irq(self):
+        asserted = False
+        if self.command & COMMAND_DTR:
+            if self._rx_ready() and not self.command & COMMAND_RX_IRQ_DISABLED:
+                asserted = True
+            if self.command & COMMAND_TX_CONTROL == COMMAND_TX_IRQ:
+                asserted = True
+        if asserted != self._irq_asserted:
+            self._irq_asserted = asserted
+            if self.irq is not None:
+                self.irq(self, asserted)
+
+    def _rx_irq_enabled(self) -> bool:
+        return self.command & (COMMAND_DTR | COMMAND_RX_IRQ_DISABLED) == COMMAND_DTR
+
+    def _reschedule(self):
+        # Interrupt driven receivers never read the status register, so poll the host for them.
+        if self._rx_irq_enabled() and not self._rx_eof and not self._rx_ready():
+            self.schedule_deadline(self.synced_cycle + self.poll_interval)
+        else:
+            self.cancel_deadline()
+
+    def on_deadline(self, cycle: int):
+        self._poll(force=True)
+        self._update_irq()
+        self._reschedule()
+
+    def _flush_due(self):
+        self._flush_event = None
+        self.flush()
+
+    def flush(self):
+        """Write out as much buffered output as the host will take without blocking."""
+        if self._flush_event is not None:
+            self.clock.events.cancel(self._flush_event)
+            self._flush_event = None
+        while self._tx_buffer:
+            self.tx_syscalls += 1
+            try:
+                written = os.write(self.tx_fd, self._tx_buffer)
+            except BlockingIOError:
+                break
+            del self._tx_buffer[:written]
+        if self._tx_buffer and self._flush_event is None:
+            # The host is not keeping up, try again later rather than stalling the guest.
+            self._flush_event = self.clock.events.schedule(self.clock.cycles + self.flush_interval, self._flush_due)
+
+    def close(self):
+        """Block until all buffered output has been written, then give the descriptors back their blocking mode."""
+        while self._tx_buffer:
+            self.flush()
+            if self._tx_buffer:
+                select.select([], [self.tx_fd], [])
+        if self._flush_event is not None:
+            self.clock.events.cancel(self._flush_event)
+            self._flush_event = None
+        self.cancel_deadline()
+        # Shared with the host, stdin and stdout left non-blocking break ordinary reads and print()s after we exit.
+        for fd, blocking in self._blocking.items():
+            os.set_blocking(fd, blocking)
+        self._blocking = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -14,5 +14,28 @@ addressing_modes_6502 = {
             'indirect_y': 12,
             'relative': 13,
             'indexed_indirect': 14,
-            'indirect_indexed': 15
-        }
\ No newline at end of file
+            'indirect_indexed': 15,
+            'zero_page_indirect': 16,
+            'absolute_indirect_x': 17
+        }
+# Number of operand bytes that follow the opcode for each addressing mode.
+operand_lengths_6502 = {
+            'immediate': 1,
+            'zero_page': 1,
+            'zero_page_x': 1,
+            'zero_page_y': 1,
+            'absolute': 2,
+            'absolute_x': 2,
+            'absolute_y': 2,
+            'implied': 0,
+            'accumulator': 0,
+            'indexed': 2,
+            'indirect': 2,
+            'indirect_x': 1,
+            'indirect_y': 1,
+            'relative': 1,
+            'indexed_indirect': 1,
+            'indirect_indexed': 1,
+            'zero_page_indirect': 1,
+            'absolute_indirect_x': 2
+        }
@@ -0,0 +1,176 @@
+import gc
+import tracemalloc
+from collections import Counter
+from clock import UnthrottledClock
+from cpu import CPU6502, NMOS_6502, Variant
+from data_types import DType, Word, Byte, Bit
+from exceptions import InterruptError
+from memory import RAM64K
+
+# Executions before measuring, enough for the interpreter to finish specializing the handler.
+WARMUP = 64
+
+# Branches are measured taken, flags set to the value each one branches on.
+_BRANCH_FLAGS = {
+    'bpl': ('N', 0), 'bmi': ('N', 1), 'bvc': ('V', 0), 'bvs': ('V', 1),
+    'bcc': ('C', 0), 'bcs': ('C', 1), 'bne': ('Z', 0), 'beq': ('Z', 1),
+}
+
+
+class AllocationCounter:
+    """
+    Counts DType objects created while entered, per class, in created.
+
+    DType.__init__ is patched for the whole process while entered, so only count one thing at a time.
+    """
+    def __init__(self):
+        self.created = Counter()
+        self._init = None
+
+    @property
+    def total(self) -> int:
+        return sum(self.created.values())
+
+    def __enter__(self):
+        self._init = init = DType.__init__
+        created = self.created
+
+        def counted_init(obj, value):
+            created[type(obj).__name__] += 1
+            init(obj, value)
+
+        DType.__init__ = counted_init
+        return self
+
+    def __exit__(self, *exc_info):
+        DType.__init__ = self._init
+
+
+def _instruction_cpu(opcode: int, crossing: bool, variant: Variant) -> CPU6502:
+    """
+    A variant CPU about to run opcode at $0200, with operands that cross a page in indexed and branch modes if
+    crossing.
+    """
+    memory = RAM64K()
+    operand = 0xF0 if crossing else 0x10
+    memory.load(0x0200, bytes([opcode, operand, 0x20]))
+    # Pointers for the indirect modes, whichever zero page address they end up at.
+    for pointer in (0x10, 0xF0):
+        memory.load(pointer, bytes([operand, 0x20]))
+    cpu = CPU6502(memory, UnthrottledClock(), variant=variant)
+    cpu.x = Byte(0x20 if crossing else 0)
+    cpu.y = Byte(0x20 if crossing else 0)
+    return cpu
+
+
+def _prepare(cpu: CPU6502, name: str, start: Word):
+    cpu.pc = start
+    cpu.sp = Byte(0xF0)
+    if name in _BRANCH_FLAGS:
+        flag, value = _BRANCH_FLAGS[name]
+        cpu.flags[flag] = Bit(value)
+    else:
+        # Keep PLP/RTI from enabling interrupts, none are pending anyway.
+        cpu.flags['I'] = Bit(1)
+
+
+def measure_instruction(opcode: int, crossing: bool = False, repeat: int = 20, variant: Variant = NMOS_6502) -> dict:
+    """
+    Allocations made by executing opcode on a variant CPU, once warmed up.
+
+    Returns a dict of
+    objects: most DType objects created by one execute(), opcode fetch included,
+    by_type: those objects per class, for the execute() that created the most,
+    peak_bytes: most memory tracemalloc saw in use above the starting point during one execute(),
+    retained_bytes: growth in memory held, per execute(), with garbage collection off,
+    retained_objects: growth of the gc's generation 0 count per execute(), objects that outlived the instruction.
+
+    objects is measured by counting DType constructions, the sizes by tracemalloc, which is started if needed.
+    """
+    name = variant.instructions[opcode][0]
+    cpu = _instruction_cpu(opcode, crossing, variant)
+    start = Word(0x0200)
+    objects, by_type, peak_bytes = 0, Counter(), 0
+
+    def execute():
+        try:
+            cpu.execute()
+        except InterruptError:
+            pass
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        # Warm up first, anything created once and kept, like the interpreter's specialized code, is not the handler's.
+        for _ in range(WARMUP):
+            _prepare(cpu, name, start)
+            execute()
+        # Nothing an instruction creates should outlive it, registers and memory replace what they held.
+        retained_before = tracemalloc.get_traced_memory()[0]
+        gc_before = gc.get_count()[0]
+        for _ in range(repeat):
+            _prepare(cpu, name, start)
+            execute()
+        retained_bytes = (tracemalloc.get_traced_memory()[0] - retained_before) / repeat
+        retained_objects = (gc.get_count()[0] - gc_before) / repeat
+
+        for _ in range(repeat):
+            _prepare(cpu, name, start)
+            counter = AllocationCounter()
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            with counter:
+                execute()
+            peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1] - current)
+            if counter.total > objects:
+                objects, by_type = counter.total, counter.created
+    finally:
+        if enabled:
+            gc.enable()
+        if not tracing:
+            tracemalloc.stop()
+    return {
+        'objects': objects,
+        'by_type': dict(by_type),
+        'peak_bytes': peak_bytes,
+        'retained_bytes': retained_bytes,
+        'retained_objects': retained_objects,
+    }
+
+
+def measure_all(repeat: int = 20, variant: Variant = NMOS_6502) -> dict:
+    """
+    measure_instruction() for every opcode of variant, with and without page crossing, keyed by (name, mode, crossing).
+    """
+    results = {}
+    for opcode, (name, mode, _) in variant.instructions.items():
+        for crossing in (False, True):
+            results[name, mode, crossing] = measure_instruction(opcode, crossing, repeat, variant)
+    return results
+
+
+def over_budget(results: dict, budgets: dict) -> list:
+    """
+    (name, mode, crossing, objects, budget) for every measurement above budgets[name, mode].
+
+    Instructions without a declared budget are reported with a budget of None, every handler needs one.
+    """
+    failures = []
+    for (name, mode, crossing), result in sorted(results.items()):
+        budget = budgets.get((name, mode))
+        if budget is None or result['objects'] > budget:
+            failures.append((name, mode, crossing, result['objects'], budget))
+    return failures
+
+
+def report(results: dict) -> str:
+    lines = [f'{"instr":<8}{"mode":<13}{"cross":<6}{"objects":>8} {"peak B":>7} {"kept B":>7}  by type']
+    for (name, mode, crossing), result in sorted(results.items()):
+        by_type = ', '.join(f'{count} {kind}' for kind, count in sorted(result['by_type'].items()))
+        lines.append(f'{name.upper():<8}{mode:<13}{"yes" if crossing else "":<6}{result["objects"]:>8} '
+                     f'{result["peak_bytes"]:>7} {result["retained_bytes"]:>7.0f}  {by_type}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,494 @@
+import hashlib
+import json
+import os
+import re
+from addressing_modes import operand_lengths_6502
+from cpu import INSTRUCTIONS_6502
+from exceptions import AssemblerError
+from memory import Memory
+
+# Part of every cache key, bump it whenever the same source would assemble differently.
+CACHE_VERSION = 1
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<number>\$[0-9A-Fa-f]+|0[xX][0-9A-Fa-f]+|%[01]+|0[bB][01]+|\d+)
+  | '(?P<char>[^'])'
+  | (?P<name>[A-Za-z_.@][\w.@]*)
+  | (?P<op><<|>>|[-+*/%&|^~<>()])
+)""", re.VERBOSE)
+
+# Binary operators from loosest to tightest binding.
+_BINARY = (
+    {'|': int.__or__},
+    {'^': int.__xor__},
+    {'&': int.__and__},
+    {'<<': int.__lshift__, '>>': int.__rshift__},
+    {'+': int.__add__, '-': int.__sub__},
+    {'*': int.__mul__, '/': int.__floordiv__, '%': int.__mod__},
+)
+_UNARY = {
+    '-': int.__neg__,
+    '~': int.__invert__,
+    # Low and high byte
+    '<': lambda value: value & 0xFF,
+    '>': lambda value: (value >> 8) & 0xFF,
+}
+
+_SYMBOL = r'[A-Za-z_.@][\w.@]*'
+_CONSTANT = re.compile(rf'^({_SYMBOL})\s*(?:=|\.equ\b|\.set\b)\s*(.+)$', re.IGNORECASE)
+_ORIGIN = re.compile(r'^\*\s*=\s*(.+)$')
+_LABEL = re.compile(rf'^({_SYMBOL}):\s*(.*)$')
+_INDIRECT_X = re.compile(r'^\((.+),\s*[xX]\s*\)$')
+_INDIRECT_Y = re.compile(r'^\((.+)\)\s*,\s*[yY]$')
+_INDIRECT = re.compile(r'^\((.+)\)$')
+_INDEXED = re.compile(r'^(.+),\s*([xXyY])$')
+
+_DIRECTIVES = {
+    '.org': 'org',
+    '.byte': 'byte', '.db': 'byte', '.text': 'byte',
+    '.word': 'word', '.dw': 'word',
+    '.res': 'res', '.ds': 'res',
+    '.align': 'align',
+    '.end': 'end',
+}
+
+
+class _Unresolved(Exception):
+    """A symbol that is not defined yet, fine in the first pass."""
+    def __init__(self, name):
+        super().__init__(name)
+        self.name = name
+
+
+def _evaluate(text: str, symbols: dict, pc: int) -> int:
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise AssemblerError(f'cannot parse expression {text!r}')
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    if not tokens:
+        raise AssemblerError('missing expression')
+    tokens.append((None, None))
+    index = 0
+
+    def take():
+        nonlocal index
+        token = tokens[index]
+        index += 1
+        return token
+
+    def binary(level: int) -> int:
+        if level == len(_BINARY):
+            return unary()
+        value = binary(level + 1)
+        while tokens[index][0] == 'op' and tokens[index][1] in _BINARY[level]:
+            operator = _BINARY[level][take()[1]]
+            right = binary(level + 1)
+            if operator is int.__floordiv__ and right == 0 or operator is int.__mod__ and right == 0:
+                raise AssemblerError(f'division by zero in {text!r}')
+            value = operator(value, right)
+        return value
+
+    def unary() -> int:
+        kind, value = take()
+        if kind == 'op' and value in _UNARY:
+            return _UNARY[value](unary())
+        if kind == 'op' and value == '(':
+            result = binary(0)
+            if take() != ('op', ')'):
+                raise AssemblerError(f'missing ) in {text!r}')
+            return result
+        if kind == 'op' and value == '*':
+            return pc
+        if kind == 'number':
+            if value[0] == '$':
+                return int(value[1:], 16)
+            if value[0] == '%':
+                return int(value[1:], 2)
+            return int(value, 0) if value[:2].lower() in ('0x', '0b') else int(value)
+        if kind == 'char':
+            return ord(value)
+        if kind == 'name':
+            if value not in symbols:
+                raise _Unresolved(value)
+            return symbols[value]
+        raise AssemblerError(f'unexpected {value or "end"} in {text!r}')
+
+    result = binary(0)
+    if tokens[index][0] is not None:
+        raise AssemblerError(f'unexpected {tokens[index][1]} in {text!r}')
+    return result
+
+
+def _strip_comment(line: str) -> str:
+    quote = None
+    for position, char in enumerate(line):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            # 'x' is a character, a lone ' is left alone.
+            if char == '"' or line[position + 2:position + 3] == "'":
+                quote = char
+        elif char == ';':
+            return line[:position]
+    return line
+
+
+def _split_list(text: str) -> list:
+    """Split on commas outside strings and parentheses."""
+    items, depth, quote, start = [], 0, None, 0
+    for position, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char == '"':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            items.append(text[start:position].strip())
+            start = position + 1
+    items.append(text[start:].strip())
+    return items
+
+
+def _check_byte(value: int, text: str) -> int:
+    if not -0x80 <= value <= 0xFF:
+        raise AssemblerError(f'{text} = {value} does not fit in a byte')
+    return value & 0xFF
+
+
+def _check_word(value: int, text: str) -> int:
+    if not -0x8000 <= value <= 0xFFFF:
+        raise AssemblerError(f'{text} = {value} does not fit in a word')
+    return value & 0xFFFF
+
+
+class Program:
+    """Assembled bytes, as (address, data) segments in source order, and the symbols defined on the way."""
+    def __init__(self, segments, symbols: dict):
+        self.segments = [(address, bytes(data)) for address, data in segments]
+        self.symbols = dict(symbols)
+
+    def __eq__(self, other):
+        return isinstance(other, Program) and (self.segments, self.symbols) == (other.segments, other.symbols)
+
+    @property
+    def start(self) -> int | None:
+        return self.segments[0][0] if self.segments else None
+
+    def load(self, memory: Memory):
+        for address, data in self.segments:
+            memory.load(address, data)
+
+    def image(self, fill: int = 0) -> bytes:
+        """Every segment in one block from the lowest address to the highest, gaps filled with fill."""
+        if not self.segments:
+            return b''
+        low = min(address for address, _ in self.segments)
+        high = max(address + len(data) for address, data in self.segments)
+        image = bytearray([fill]) * (high - low)
+        for address, data in self.segments:
+            image[address - low:address - low + len(data)] = data
+        return bytes(image)
+
+    def to_json(self) -> str:
+        return json.dumps({'segments': [[address, data.hex()] for address, data in self.segments],
+                           'symbols': self.symbols})
+
+    @classmethod
+    def from_json(cls, text: str) -> 'Program':
+        fields = json.loads(text)
+        return cls(((address, bytes.fromhex(data)) for address, data in fields['segments']), fields['symbols'])
+
+
+class Assembler:
+    """
+    Two pass 6502 assembler over an opcode table, INSTRUCTIONS_6502 by default.
+
+    Source is one statement per line, ';' starts a comment:
+        label:                      defines label as the current address
+        name = expr, name .equ expr defines a constant
+        LDA #expr                   immediate, #<expr and #>expr for the low and high byte
+        LDA expr / expr,X / expr,Y  zero page if expr is known and below $100 by then, absolute otherwise
+        LDA (expr,X) / (expr),Y     indexed indirect and indirect indexed
+        JMP (expr)                  indirect
+        LDA (expr) / JMP (expr,X)   zero page indirect and absolute indexed indirect, in tables that have them
+        LSR / LSR A                 implied and accumulator
+        BNE label                   relative
+    Directives: .org expr (or *= expr), .byte/.db/.text with expressions and "strings", .word/.dw, .res/.ds count
+    [, fill], .align n [, fill] and .end. Expressions take $hex, 0xhex, %binary, decimal and 'c' numbers, symbols,
+    * for the current address, unary - ~ < > and binary | ^ & << >> + - * / % with the usual precedence.
+
+    With cache_dir, assembled programs are kept there keyed by a hash of the source, origin and opcode table, and
+    later assemblies of the same source read them back instead of assembling again.
+    """
+    def __init__(self, instructions: dict = INSTRUCTIONS_6502, cache_dir: str | None = None):
+        self.instructions = instructions
+        self.cache_dir = cache_dir
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._opcodes = {}
+        for opcode, (name, mode, _) in instructions.items():
+            self._opcodes.setdefault((name, mode), opcode)
+        self._mnemonics = {name for name, _ in self._opcodes}
+        table = repr(sorted((opcode, name, mode) for opcode, (name, mode, _) in instructions.items()))
+        self._table_digest = hashlib.sha256(table.encode()).hexdigest()
+
+    def cache_path(self, source: str, origin: int) -> str:
+        key = hashlib.sha256(f'{CACHE_VERSION}\n{self._table_digest}\n{origin}\n{source}'.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def assemble(self, source: str, origin: int = 0x0200) -> Program:
+        if self.cache_dir is None:
+            return self._assemble(source, origin)
+        path = self.cache_path(source, origin)
+        try:
+            with open(path) as f:
+                program = Program.from_json(f.read())
+        except (OSError, ValueError, KeyError):
+            # Missing, or a write that never finished, assemble it again.
+            pass
+        else:
+            self.cache_hits += 1
+            return program
+        self.cache_misses += 1
+        program = self._assemble(source, origin)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as f:
+            f.write(program.to_json())
+        os.replace(temporary, path)
+        return program
+
+    def assemble_file(self, path: str, origin: int = 0x0200) -> Program:
+        with open(path) as f:
+            return self.assemble(f.read(), origin)
+
+    def _parse(self, source: str) -> list:
+        """(line number, label, operation, operand) per statement, constants as (line, name, '=', expr)."""
+        statements = []
+        for number, line in enumerate(source.splitlines(), 1):
+            text = _strip_comment(line).strip()
+            if not text:
+                continue
+            match = _ORIGIN.match(text)
+            if match:
+                statements.append((number, None, '.org', match.group(1)))
+                continue
+            match = _CONSTANT.match(text)
+            if match and match.group(1).lower() not in _DIRECTIVES:
+                statements.append((number, match.group(1), '=', match.group(2)))
+                continue
+            label = None
+            match = _LABEL.match(text)
+            if match:
+                label, text = match.groups()
+            operation, operand = (text.split(None, 1) + ['', ''])[:2]
+            operation = operation.lower()
+            if operation and operation not in _DIRECTIVES and operation not in self._mnemonics:
+                raise AssemblerError(f'unknown instruction {operation.upper()}', number)
+            statements.append((number, label, operation, operand.strip()))
+        return statements
+
+    def _mode(self, name: str, operand: str, symbols: dict, pc: int) -> tuple:
+        """Addressing mode and operand expression, picking zero page only if the value is already known to fit."""
+        def has(mode):
+            return (name, mode) in self._opcodes
+
+        def fits_zero_page(expression):
+            try:
+                return 0 <= _evaluate(expression, symbols, pc) <= 0xFF
+            except _Unresolved:
+                return False
+
+        def sized(expression, zero_page, absolute):
+            if has(zero_page) and (not has(absolute) or fits_zero_page(expression)):
+                return zero_page, expression
+            return absolute, expression
+
+        if not operand:
+            return ('implied' if has('implied') else 'accumulator'), None
+        if operand.lower() == 'a' and has('accumulator'):
+            return 'accumulator', None
+        if operand.startswith('#'):
+            return 'immediate', operand[1:]
+        match = _INDIRECT_X.match(operand)
+        if match:
+            if has('absolute_indirect_x') and not has('indirect_x'):
+                return 'absolute_indirect_x', match.group(1)
+            return 'indirect_x', match.group(1)
+        match = _INDIRECT_Y.match(operand)
+        if match:
+            return 'indirect_y', match.group(1)
+        match = _INDIRECT.match(operand)
+        if match and has('indirect'):
+            return 'indirect', match.group(1)
+        if match and has('zero_page_indirect'):
+            return 'zero_page_indirect', match.group(1)
+        if match:
+            # Parentheses around the whole operand always mean indirect, never a plain zero page or absolute address.
+            return 'indirect', match.group(1)
+        match = _INDEXED.match(operand)
+        if match:
+            expression, register = match.group(1), match.group(2).lower()
+            return sized(expression, f'zero_page_{register}', f'absolute_{register}')
+        if has('relative'):
+            return 'relative', operand
+        return sized(operand, 'zero_page', 'absolute')
+
+    def _assemble(self, source: str, origin: int) -> Program:
+        statements = self._parse(source)
+        symbols = {}
+        modes = {}
+        pending = []
+
+        def define(name, value, line):
+            if name in symbols:
+                raise AssemblerError(f'{name} is already defined', line)
+            symbols[name] = value
+
+        # Pass 1: addresses of every label, sizes of every statement.
+        pc = origin
+        for index, (line, label, operation, operand) in enumerate(statements):
+            try:
+                if operation == '=':
+                    try:
+                        define(label, _evaluate(operand, symbols, pc), line)
+                    except _Unresolved:
+                        pending.append((line, label, operand, pc))
+                    continue
+                if label is not None:
+                    define(label, pc, line)
+                if not operation:
+                    continue
+                directive = _DIRECTIVES.get(operation)
+                if directive == 'end':
+                    break
+                elif directive is not None:
+                    pc = self._directive(directive, operand, symbols, pc, None)
+                else:
+                    mode, _ = modes[index] = self._mode(operation, operand, symbols, pc)
+                    if (operation, mode) not in self._opcodes:
+                        raise AssemblerError(f'{operation.upper()} has no {mode} mode')
+                    pc += 1 + operand_lengths_6502[mode]
+                if pc > 0x10000:
+                    raise AssemblerError('program runs past $FFFF')
+            except _Unresolved as error:
+                raise AssemblerError(f'{error.name} must be defined before it is used here', line) from None
+            except AssemblerError as error:
+                if error.line is None:
+                    error.line = line
+                raise
+
+        # Constants using labels defined further down.
+        while pending:
+            unresolved = []
+            for line, name, operand, at in pending:
+                try:
+                    define(name, _evaluate(operand, symbols, at), line)
+                except _Unresolved:
+                    unresolved.append((line, name, operand, at))
+            if len(unresolved) == len(pending):
+                line, name, operand, at = unresolved[0]
+                raise AssemblerError(f'cannot resolve {name} = {operand}', line)
+            pending = unresolved
+
+        # Pass 2: emit, every symbol is known now.
+        segments = []
+        pc = origin
+        for index, (line, label, operation, operand) in enumerate(statements):
+            if operation in ('=', ''):
+                continue
+            output = bytearray()
+            try:
+                directive = _DIRECTIVES.get(operation)
+                if directive == 'end':
+                    break
+                elif directive is not None:
+                    end = self._directive(directive, operand, symbols, pc, output)
+                else:
+                    mode, expression = modes[index]
+                    output += self._encode(operation, mode, expression, symbols, pc)
+                    end = pc + len(output)
+            except _Unresolved as error:
+                raise AssemblerError(f'undefined symbol {error.name}', line) from None
+            except AssemblerError as error:
+                if error.line is None:
+                    error.line = line
+                raise
+            if output:
+                if segments and segments[-1][0] + len(segments[-1][1]) == pc:
+                    segments[-1][1].extend(output)
+                else:
+                    segments.append((pc, output))
+            pc = end
+        return Program(segments, symbols)
+
+    def _directive(self, directive: str, operand: str, symbols: dict, pc: int, output: bytearray | None) -> int:
+        """Run a directive, emitting into output unless it is None (the first pass). Returns the next address."""
+        if directive == 'org':
+            address = _evaluate(operand, symbols, pc)
+            if not 0 <= address <= 0xFFFF:
+                raise AssemblerError(f'.org {address:#x} is outside the address space')
+            return address
+        if directive in ('byte', 'word'):
+            items = _split_list(operand)
+            size = 0
+            for item in items:
+                if item.startswith('"') and directive == 'byte':
+                    if len(item) < 2 or not item.endswith('"'):
+                        raise AssemblerError(f'unterminated string {item}')
+                    data = item[1:-1].encode('ascii')
+                    size += len(data)
+                    if output is not None:
+                        output += data
+                elif directive == 'byte':
+                    size += 1
+                    if output is not None:
+                        output.append(_check_byte(_evaluate(item, symbols, pc), item))
+                else:
+                    size += 2
+                    if output is not None:
+                        output += _check_word(_evaluate(item, symbols, pc), item).to_bytes(2, 'little')
+            return pc + size
+        if directive in ('res', 'align'):
+            items = _split_list(operand)
+            amount = _evaluate(items[0], symbols, pc)
+            fill = _check_byte(_evaluate(items[1], symbols, pc), items[1]) if len(items) > 1 else 0
+            if amount <= 0:
+                raise AssemblerError(f'.{directive} needs a positive amount, got {amount}')
+            size = amount if directive == 'res' else -pc % amount
+            if output is not None:
+                output += bytes([fill]) * size
+            return pc + size
+        raise AssemblerError(f'unknown directive {directive}')
+
+    def _encode(self, name: str, mode: str, expression: str | None, symbols: dict, pc: int) -> bytes:
+        opcode = self._opcodes[name, mode]
+        length = operand_lengths_6502[mode]
+        if length == 0:
+            return bytes([opcode])
+        value = _evaluate(expression, symbols, pc)
+        if mode == 'relative':
+            offset = value - (pc + 2)
+            if not -0x80 <= offset <= 0x7F:
+                raise AssemblerError(f'branch to {value:#06x} is out of range')
+            return bytes([opcode, offset & 0xFF])
+        if length == 1:
+            if mode != 'immediate' and not 0 <= value <= 0xFF:
+                raise AssemblerError(f'{expression} = {value:#x} is not a zero page address')
+            return bytes([opcode, _check_byte(value, expression)])
+        return bytes([opcode]) + _check_word(value, expression).to_bytes(2, 'little')
+
+
+def assemble(source: str, origin: int = 0x0200, cache_dir: str | None = None) -> Program:
+    """Assemble source with the 6502 opcode table, see Assembler."""
+    return Assembler(cache_dir=cache_dir).assemble(source, origin)
@@ -0,0 +1,134 @@
+import asyncio
+from acia import ACIA6551, DATA
+from clock import Clock, UnthrottledClock
+from cpu import CPU6502
+
+
+class AsyncACIA6551(ACIA6551):
+    """
+    6551 ACIA connected to an asyncio stream pair instead of file descriptors, e.g. from asyncio.open_connection or
+    asyncio.start_unix_server.
+
+    A pump task started by run_async reads the host side into a buffer, guest reads only ever look at that buffer.
+    When the guest finds it empty the device is marked starved and run_async awaits input for it between slices
+    rather than letting the guest spin. Transmitted bytes are handed to the writer once per slice.
+    """
+    def __init__(self, clock: Clock, base: int, reader: asyncio.StreamReader | None = None,
+                 writer: asyncio.StreamWriter | None = None, irq=None, rx_chunk_size: int = 4096,
+                 poll_interval: int = 1000):
+        super().__init__(clock, base, irq=irq, rx_chunk_size=rx_chunk_size, poll_interval=poll_interval)
+        self.reader = reader
+        self.writer = writer
+        self._rx_eof = reader is None
+        self._pending = bytearray()
+        self._pending_eof = False
+        self._input = asyncio.Event()
+        self.starved = False
+
+    async def pump(self):
+        """Move host input into the receive buffer until the reader hits EOF."""
+        while True:
+            data = await self.reader.read(self.rx_chunk_size)
+            self.rx_syscalls += 1
+            if not data:
+                self._pending_eof = True
+                self._input.set()
+                return
+            self._pending += data
+            self._input.set()
+
+    def _poll(self, force: bool = False):
+        if self._rx_ready() or self._rx_eof:
+            return
+        if self._pending:
+            self._rx_buffer = bytes(self._pending)
+            self._rx_position = 0
+            self._pending.clear()
+            self._input.clear()
+            self.starved = False
+        elif self._pending_eof:
+            self._rx_eof = True
+        else:
+            self.starved = True
+
+    async def wait_input(self, timeout: float):
+        """Wait up to timeout seconds for host input, returns straight away if some is already buffered."""
+        self.starved = False
+        try:
+            await asyncio.wait_for(self._input.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def write(self, offset: int, value: int):
+        if offset == DATA:
+            self.tx_bytes += 1
+            if self.writer is not None:
+                self._tx_buffer.append(value)
+        else:
+            super().write(offset, value)
+
+    def flush(self):
+        if self._tx_buffer:
+            self.tx_syscalls += 1
+            self.writer.write(bytes(self._tx_buffer))
+            self._tx_buffer.clear()
+
+    async def drain(self):
+        self.flush()
+        if self.writer is not None:
+            await self.writer.drain()
+
+    def close(self):
+        self.flush()
+        self.cancel_deadline()
+
+
+async def run_async(cpu: CPU6502, slice_cycles: int = 10_000, until: int | None = None, frequency: int | None = None,
+                    devices=(), idle_timeout: float = 0.05):
+    """
+    Run cpu on the current event loop in slices of slice_cycles, yielding to other tasks between slices.
+
+    The CPU needs an UnthrottledClock, there are no clock or CPU threads. Without frequency slices follow each other
+    as fast as the loop allows, with it the driver sleeps between slices to keep to frequency cycles per second.
+    devices are AsyncACIA6551s (or anything with pump/drain/wait_input and a starved flag) serviced between slices.
+    Runs until the clock reaches until, forever if it is None, or until the guest executes BRK.
+    """
+    if not isinstance(cpu.clock, UnthrottledClock):
+        raise ValueError('run_async needs a CPU driven by an UnthrottledClock')
+    loop = asyncio.get_running_loop()
+    clock = cpu.clock
+    pumps = [asyncio.create_task(device.pump()) for device in devices if device.reader is not None]
+    start_cycle = clock.cycles
+    start_time = loop.time()
+    try:
+        while until is None or clock.cycles < until:
+            target = clock.cycles + slice_cycles
+            if until is not None:
+                target = min(target, until)
+            cpu.run_until(target)
+
+            starved = []
+            for device in devices:
+                await device.drain()
+                if device.starved:
+                    starved.append(device)
+            if frequency is not None:
+                delay = start_time + (clock.cycles - start_cycle) / frequency - loop.time()
+            else:
+                delay = 0
+            if starved:
+                # The guest is polling for input that is not there, let it wait for the host instead of spinning.
+                waits = [asyncio.ensure_future(device.wait_input(max(delay, idle_timeout))) for device in starved]
+                _, pending = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+                for wait in pending:
+                    wait.cancel()
+                if frequency is not None:
+                    # The guest was paused while it waited, do not race to make the time up afterwards.
+                    start_time = loop.time() - (clock.cycles - start_cycle) / frequency
+            else:
+                await asyncio.sleep(max(delay, 0))
+    finally:
+        for device in devices:
+            device.flush()
+        for pump in pumps:
+            pump.cancel()
@@ -0,0 +1,67 @@
+"""
+Instructions per second with no breakpoints, after adding and removing some, and with a breakpoint and a watchpoint
+that never trigger. The first two must match within TOLERANCE, breakpoints only cost anything while they are set.
+
+    python benchmarks/bench_breakpoints.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clock import UnthrottledClock
+from cpu import CPU6502
+from data_types import Word, Byte
+from memory import RAM64K
+
+INSTRUCTIONS = 200_000
+# Best of this many rounds, each running every CPU once, so drift in machine load hits all of them alike.
+ROUNDS = 5
+# How much slower than no breakpoints at all the added and removed CPU may run, timing noise included.
+TOLERANCE = 0.10
+# LDA #$05, STA $3000, JMP $0200
+PROGRAM = [0xA9, 0x05, 0x8D, 0x00, 0x30, 0x4C, 0x00, 0x02]
+
+
+def make_cpu():
+    memory = RAM64K()
+    for offset, value in enumerate(PROGRAM):
+        memory[Word(0x0200 + offset)] = Byte(value)
+    return CPU6502(memory, UnthrottledClock())
+
+
+def measure(cpu) -> float:
+    start = time.perf_counter()
+    for _ in range(INSTRUCTIONS):
+        cpu.execute()
+    return INSTRUCTIONS / (time.perf_counter() - start)
+
+
+def main():
+    plain = make_cpu()
+
+    removed = make_cpu()
+    removed.add_breakpoint(0x1000)
+    removed.remove_watchpoint(removed.add_watchpoint(0x3000))
+    removed.remove_breakpoint(0x1000)
+
+    armed = make_cpu()
+    armed.add_breakpoint(0x1000)
+    armed.add_watchpoint(0x4000)
+
+    cpus = {'no breakpoints': plain, 'added and removed': removed, 'armed, not hit': armed}
+    speeds = dict.fromkeys(cpus, 0.0)
+    for _ in range(ROUNDS):
+        for name, cpu in cpus.items():
+            speeds[name] = max(speeds[name], measure(cpu))
+    for name, speed in speeds.items():
+        print(f'{name:>20}: {speed:12,.0f} instructions/s')
+
+    ratio = speeds['added and removed'] / speeds['no breakpoints']
+    assert ratio >= 1 - TOLERANCE, f'added and removed breakpoints run at {ratio:.1%} of the speed of none'
+    print(f'added and removed at {ratio:.1%} of the speed of no breakpoints, at least {1 - TOLERANCE:.0%} required')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Instructions per second with the decode cache alone and with a fusion table learned from a short profiling run.
+
+    python benchmarks/bench_fusion.py [fusion.json]
+
+The learned table is written to fusion.json, or the path given, and both runs must end in the same state.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clock import UnthrottledClock
+from cpu import CPU6502
+from fusion import FusionTable, profile_pairs
+from memory import RAM64K
+
+CYCLES = 1_000_000
+PROGRAM = bytes([
+    0xA5, 0x10,        # LDA $10
+    0x09, 0x01,        # ORA #$01
+    0x48,              # PHA
+    0x68,              # PLA
+    0x85, 0x11,        # STA $11
+    0xA6, 0x11,        # LDX $11
+    0x4C, 0x00, 0x02,  # JMP $0200
+])
+
+
+def make_cpu(**options):
+    memory = RAM64K()
+    memory.load(0x0200, PROGRAM)
+    return CPU6502(memory, UnthrottledClock(), **options)
+
+
+def measure(cpu) -> float:
+    start = time.perf_counter()
+    cpu.run_until(CYCLES)
+    elapsed = time.perf_counter() - start
+    return cpu.stats()['instructions_retired'] / elapsed
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'fusion.json'
+    table = FusionTable.learn(profile_pairs(make_cpu(), 10_000), size=8)
+    table.save(path)
+    print(f'learned {len(table)} pairs: {", ".join(f"{a:02X}+{b:02X}" for a, b in table)}')
+
+    plain = make_cpu(decode_cache=True)
+    fused = make_cpu(fusion=FusionTable.load(path))
+    print(f'{"decode cache":>14}: {measure(plain):12,.0f} instructions/s')
+    print(f'{"fused":>14}: {measure(fused):12,.0f} instructions/s')
+
+    state = plain.save_state()
+    assert fused.save_state() == state, 'fused run diverged'
+    print(f'{fused.fused_pairs:,} pairs fused, final state identical')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import threading
-from time import sleep
+from time import sleep, perf_counter
+from events import EventQueue
 
 
 class Clock:
@@ -11,6 +12,8 @@ class Clock:
         self.period = 1 / frequency
         self.half_period = self.period / 2
         self.cycles = -1
+        self.events = EventQueue()
+        self.started = None
 
         self._clock_thread = threading.Thread(target=self.run)
 
@@ -22,6 +25,7 @@ class Clock:
         self._clock_thread.start()
 
     def run(self):
+        self.started = perf_counter()
         self.clock_activated.set()
         while self.clock_activated.is_set():
             self._clock_high.set()
@@ -43,11 +47,63 @@ class Clock:
 
         self._clock_high.wait()
 
+    def advance(self, cycles: int):
+        """Let cycles pulses go by without doing any work in them."""
+        for _ in range(cycles):
+            self.wait_for_pulse()
+
     def stop(self):
         self.clock_activated.clear()
 
+    def stats(self) -> dict:
+        elapsed = perf_counter() - self.started if self.started is not None else 0.0
+        return {
+            'cycles': self.cycles,
+            'frequency': self.frequency,
+            'elapsed_seconds': elapsed,
+            # Sleeping half periods overshoots, so this tends to come out under frequency.
+            'achieved_hz': self.cycles / elapsed if elapsed else 0.0,
+            'events_fired': self.events.fired,
+            'events_pending': len(self.events),
+        }
+
 
 class Clock1Hz(Clock):
     """1Hz clock. 1 cycle per second. 1-second period."""
     def __init__(self):
         super().__init__(1)
+
+
+class UnthrottledClock(Clock):
+    """
+    Clock that never sleeps.
+
+    Every pulse completes immediately, so the CPU runs as fast as the host allows while cycles are still counted
+    exactly. There is no clock thread, everything runs on the thread driving the CPU.
+    """
+    def __init__(self):
+        # No period or thread to set up.
+        self.frequency = None
+        self.cycles = 0
+        self.events = EventQueue()
+        self.running = False
+        self.started = None
+
+    def start(self):
+        self.run()
+
+    def run(self):
+        self.started = perf_counter()
+        self.running = True
+
+    def schedule(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def wait_for_pulse(self):
+        self.cycles += 1
+
+    def advance(self, cycles: int):
+        self.cycles += cycles
+
+    def stop(self):
+        self.running = False
@@ -1,5 +1,6 @@
+import time
 from exceptions import *
-from addressing_modes import addressing_modes_6502
+from addressing_modes import addressing_modes_6502, operand_lengths_6502
 from tools import *
 from collections import OrderedDict
 from data_types import Word, Byte, Bit, DType
@@ -7,9 +8,147 @@ from memory import Memory
 from clock import Clock
 from threading import Thread
 
+# Opcode -> (instruction, addressing mode, base cycles).
+# Base cycles are the documented counts and exclude page crossing penalties.
+INSTRUCTIONS_6502 = {
+    # BRK
+    0x00: ('brk', 'implied', 7),
+    # LDA
+    0xA9: ('lda', 'immediate', 2),
+    0xA5: ('lda', 'zero_page', 3),
+    0xB5: ('lda', 'zero_page_x', 4),
+    0xAD: ('lda', 'absolute', 4),
+    0xBD: ('lda', 'absolute_x', 4),
+    0xB9: ('lda', 'absolute_y', 4),
+    0xA1: ('lda', 'indirect_x', 6),
+    0xB1: ('lda', 'indirect_y', 5),
+    # LDX
+    0xA2: ('ldx', 'immediate', 2),
+    0xA6: ('ldx', 'zero_page', 3),
+    0xB6: ('ldx', 'zero_page_y', 4),
+    0xAE: ('ldx', 'absolute', 4),
+    0xBE: ('ldx', 'absolute_y', 4),
+    # LDY
+    0xA0: ('ldy', 'immediate', 2),
+    0xA4: ('ldy', 'zero_page', 3),
+    0xB4: ('ldy', 'zero_page_x', 4),
+    0xAC: ('ldy', 'absolute', 4),
+    0xBC: ('ldy', 'absolute_x', 4),
+    # LSR
+    0x4A: ('lsr', 'accumulator', 2),
+    0x46: ('lsr', 'zero_page', 5),
+    0x56: ('lsr', 'zero_page_x', 6),
+    0x4E: ('lsr', 'absolute', 6),
+    0x5E: ('lsr', 'absolute_x', 7),
+    # NOP
+    0xEA: ('nop', 'implied', 2),
+    # ORA
+    0x09: ('ora', 'immediate', 2),
+    0x05: ('ora', 'zero_page', 3),
+    0x15: ('ora', 'zero_page_x', 4),
+    0x0D: ('ora', 'absolute', 4),
+    0x1D: ('ora', 'absolute_x', 4),
+    0x19: ('ora', 'absolute_y', 4),
+    0x01: ('ora', 'indirect_x', 6),
+    0x11: ('ora', 'indirect_y', 5),
+    # PHA
+    0x48: ('pha', 'implied', 3),
+    # PLA
+    0x68: ('pla', 'implied', 4),
+    # PHP
+    0x08: ('php', 'implied', 3),
+    # PLP
+    0x28: ('plp', 'implied', 4),
+    # JMP
+    0x4C: ('jmp', 'absolute', 3),
+    0x6C: ('jmp', 'indirect', 5),
+    # Branches, +1 cycle if taken and +1 more if the target is on another page
+    0x10: ('bpl', 'relative', 2),
+    0x30: ('bmi', 'relative', 2),
+    0x50: ('bvc', 'relative', 2),
+    0x70: ('bvs', 'relative', 2),
+    0x90: ('bcc', 'relative', 2),
+    0xB0: ('bcs', 'relative', 2),
+    0xD0: ('bne', 'relative', 2),
+    0xF0: ('beq', 'relative', 2),
+    # RTI
+    0x40: ('rti', 'implied', 6),
+    # SEI
+    0x78: ('sei', 'implied', 2),
+    # CLI
+    0x58: ('cli', 'implied', 2),
+    # STA
+    0x85: ('sta', 'zero_page', 3),
+    0x95: ('sta', 'zero_page_x', 4),
+    0x8D: ('sta', 'absolute', 4),
+    0x9D: ('sta', 'absolute_x', 5),
+    0x99: ('sta', 'absolute_y', 5),
+    0x81: ('sta', 'indirect_x', 6),
+    0x91: ('sta', 'indirect_y', 6),
+}
+
+
+class Variant:
+    """
+    A member of the 6502 family, described by how it differs from the NMOS 6502.
+
+    instructions holds opcode table entries added or replaced on top of INSTRUCTIONS_6502, None removes an opcode.
+    handlers maps an instruction name to the CPU6502 method that runs it where the behaviour differs, not just the
+    cycle count. interrupt_clears_decimal clears D on BRK and on entering an interrupt, as CMOS parts do.
+
+    A CPU resolves its variant once when built, into its dispatch table and interrupt flags, so running one variant
+    costs the same as running any other.
+    """
+    def __init__(self, name: str, instructions: dict | None = None, handlers: dict | None = None,
+                 interrupt_clears_decimal: bool = False):
+        self.name = name
+        self.instructions = dict(INSTRUCTIONS_6502)
+        for opcode, entry in (instructions or {}).items():
+            if entry is None:
+                self.instructions.pop(opcode, None)
+            else:
+                self.instructions[opcode] = entry
+        self.handlers = dict(handlers or {})
+        self.interrupt_clears_decimal = interrupt_clears_decimal
+
+    def __repr__(self):
+        return f'Variant({self.name!r})'
+
+
+NMOS_6502 = Variant('nmos')
+
+CMOS_65C02 = Variant('65c02', instructions={
+    # BRA, always taken so always at least 3 cycles
+    0x80: ('bra', 'relative', 2),
+    # PHX, PHY, PLX, PLY
+    0xDA: ('phx', 'implied', 3),
+    0x5A: ('phy', 'implied', 3),
+    0xFA: ('plx', 'implied', 4),
+    0x7A: ('ply', 'implied', 4),
+    # (zp) without indexing
+    0xB2: ('lda', 'zero_page_indirect', 5),
+    0x12: ('ora', 'zero_page_indirect', 5),
+    0x92: ('sta', 'zero_page_indirect', 5),
+    # JMP ($xxFF) reads the msb from the next page, one cycle more than NMOS
+    0x6C: ('jmp', 'indirect', 6),
+    0x7C: ('jmp', 'absolute_indirect_x', 6),
+}, handlers={'jmp': 'jmp_65c02'}, interrupt_clears_decimal=True)
+
+VARIANTS = {variant.name: variant for variant in (NMOS_6502, CMOS_65C02)}
+
+IRQ_VECTOR = 0xFFFE
+NMI_VECTOR = 0xFFFA
+
+# run() executes in slices of this many cycles so stats() stays current without counting in the hot loop.
+STATS_SLICE = 100_000
+
+# Accuracy levels, see CPU6502.set_accuracy.
+ACCURACY_LEVELS = ('bus', 'cycle', 'instruction')
+
 
 class CPU6502:
-    def __init__(self, memory: Memory, clock: Clock):
+    def __init__(self, memory: Memory, clock: Clock, decode_cache: bool = False, idle_skip: bool = False,
+                 fusion=None, accuracy: str = 'cycle', variant: str | Variant = 'nmos'):
         # Registers
         self.a = Byte(0)
         self.x = Byte(0x42)
@@ -31,62 +170,137 @@ class CPU6502:
         })
         self.memory = memory
         self.clock = clock
+        self._events = clock.events
+        self.memory_reads = 0
+        self.memory_writes = 0
+
+        # Totals over run()/run_until(), updated once per call.
+        self.instructions_retired = 0
+        self.run_cycles = 0
+        self.run_seconds = 0.0
+        self.busy_seconds = 0.0
 
         self._cpu_thread = Thread(target=self.run)
 
         self.addressing_mode = addressing_modes_6502
 
-        self.OPCODES = {
-            # BRK
-            0x00: (self.brk, self.addressing_mode['implied']),
-            # LDA
-            0xA9: (self.lda, self.addressing_mode['immediate']),
-            0xA5: (self.lda, self.addressing_mode['zero_page']),
-            0xB5: (self.lda, self.addressing_mode['zero_page_x']),
-            0xAD: (self.lda, self.addressing_mode['absolute']),
-            0xBD: (self.lda, self.addressing_mode['absolute_x']),
-            0xB9: (self.lda, self.addressing_mode['absolute_y']),
-            0xA1: (self.lda, self.addressing_mode['indirect_x']),
-            0xB1: (self.lda, self.addressing_mode['indirect_y']),
-            # LDX
-            0xA2: (self.ldx, self.addressing_mode['immediate']),
-            0xA6: (self.ldx, self.addressing_mode['zero_page']),
-            0xB6: (self.ldx, self.addressing_mode['zero_page_y']),
-            0xAE: (self.ldx, self.addressing_mode['absolute']),
-            0xBE: (self.ldx, self.addressing_mode['absolute_y']),
-            # LDY
-            0xA0: (self.ldy, self.addressing_mode['immediate']),
-            0xA4: (self.ldy, self.addressing_mode['zero_page']),
-            0xB4: (self.ldy, self.addressing_mode['zero_page_x']),
-            0xAC: (self.ldy, self.addressing_mode['absolute']),
-            0xBC: (self.ldy, self.addressing_mode['absolute_x']),
-            # LSR
-            0x4A: (self.lsr, self.addressing_mode['accumulator']),
-            0x46: (self.lsr, self.addressing_mode['zero_page']),
-            0x56: (self.lsr, self.addressing_mode['zero_page_x']),
-            0x4E: (self.lsr, self.addressing_mode['absolute']),
-            0x5E: (self.lsr, self.addressing_mode['absolute_x']),
-            # NOP
-            0xEA: (self.nop, self.addressing_mode['implied']),
-            # ORA
-            0x09: (self.ora, self.addressing_mode['immediate']),
-            0x05: (self.ora, self.addressing_mode['zero_page']),
-            0x15: (self.ora, self.addressing_mode['zero_page_x']),
-            0x0D: (self.ora, self.addressing_mode['absolute']),
-            0x1D: (self.ora, self.addressing_mode['absolute_x']),
-            0x19: (self.ora, self.addressing_mode['absolute_y']),
-            0x01: (self.ora, self.addressing_mode['indirect_x']),
-            0x11: (self.ora, self.addressing_mode['indirect_y']),
-            # PHA
-            0x48: (self.pha, self.addressing_mode['implied']),
-            # PLA
-            0x68: (self.pla, self.addressing_mode['implied']),
-            # PHP
-            0x08: (self.php, self.addressing_mode['implied']),
-            # PLP
-            0x28: (self.plp, self.addressing_mode['implied']),
+        # The chip this CPU is, resolved here into the opcode table and interrupt flags and never looked at again.
+        if isinstance(variant, str):
+            if variant not in VARIANTS:
+                raise ValueError(f'Variant must be one of {", ".join(VARIANTS)}, got {variant!r}')
+            variant = VARIANTS[variant]
+        self.variant = variant
+        self.instructions = variant.instructions
+        self._handlers = variant.handlers
+        # Flags BRK sets on top of B, and flags set on entering an interrupt.
+        self._break_flags = (('D', 0),) if variant.interrupt_clears_decimal else ()
+        self._interrupt_flags = (('I', 1),) + self._break_flags
+
+        # Predecoded instructions, one dict per page mapping pc ->
+        # (func, addressing mode, operand, length, next pc, opcode, cycles).
+        # The operand is what the handler's one operand fetch returns, a Byte or an absolute address Word.
+        self._decode_cache = [{} for _ in range(0x100)]
+        self._operand = None
+        self.decode_cache_hits = 0
+        self.decode_cache_misses = 0
+        self.decode_cache_invalidations = 0
+        # Opcode pairs to predecode as one fused entry, see _fuse. Fusion lives in the decode cache.
+        self._fusion = frozenset(tuple(pair) for pair in fusion) if fusion is not None else frozenset()
+        self.fused_pairs = 0
+        if decode_cache or self._fusion:
+            self.execute = self._execute_cached
+            self.get_bytePC = self._get_bytePC_cached
+            self.get_absolute_address = self._get_absolute_address_cached
+            self.store_byteADDR = self._store_byteADDR_cached
+
+        # Idle loop fast-forwarding, see _check_idle_loop.
+        self._idle_skip = idle_skip
+        self._idle_candidate = None
+        self._run_limit = float('inf')
+        self.idle_cycles_skipped = 0
+
+        # Interrupt lines. IRQ is level triggered and shared, every source holding it low is kept in _irq_sources.
+        # NMI is edge triggered. execute() only looks at _interrupt_pending.
+        self._irq_sources = set()
+        self._nmi_pending = False
+        self._interrupt_pending = False
+        self.interrupts_serviced = 0
+
+        # Breakpoints and watchpoints. The instrumented methods are only swapped in while some are set, otherwise
+        # the plain ones below run untouched.
+        self._plain_execute = self.execute
+        # execute() as built, fused pairs only run while nothing wraps it, see _fuse.
+        self._unwrapped_execute = self.execute
+        self._plain_get_byteADDR = self.get_byteADDR
+        self._plain_store_byteADDR = self.store_byteADDR
+        self._breakpoints = set()
+        self._breakpoint_resume = None
+        self._watchpoints = []
+        self._watch_read_pages = set()
+        self._watch_write_pages = set()
+        self._watch_hit = None
+        self._count_reads = False
+        self._unwatched_get_byteADDR = self._plain_get_byteADDR
+
+        # Binds the shared instruction table to this CPU's handlers in OPCODES.
+        self.accuracy = None
+        self._instruction_level = False
+        self.set_accuracy(accuracy)
+
+    def set_accuracy(self, accuracy: str):
+        """
+        Choose how closely this CPU follows the bus, can be changed between instructions.
+
+        'cycle' waits for a clock pulse on every cycle but only touches memory when the instruction needs the data.
+        'bus' makes the accesses real hardware makes on the cycles in between as well, the dummy reads of the next
+        byte, the stack and unfixed indexed addresses and the dummy write of read-modify-write instructions, so
+        devices with read or write side effects see every one of them. These count in memory_writes, and in
+        memory_reads while counting reads.
+        'instruction' skips the per cycle waits and moves the clock on by the whole instruction's count at once, page
+        crossing and branch penalties included. Devices and events see each instruction's final cycle.
+
+        All three run the same instruction handlers, only the cycle and dummy access hooks differ.
+        """
+        if accuracy not in ACCURACY_LEVELS:
+            raise ValueError(f'Accuracy must be one of {", ".join(ACCURACY_LEVELS)}, got {accuracy!r}')
+        self.accuracy = accuracy
+        self._instruction_level = accuracy == 'instruction'
+        if accuracy == 'bus':
+            self._dummy_read = self._dummy_read_bus
+            self._dummy_write = self._dummy_write_bus
+            self._extra_cycle = self._dummy_read_bus
+        else:
+            self._dummy_read = self._idle_cycle
+            self._dummy_write = self._idle_write
+            self._extra_cycle = self._advance_cycle if self._instruction_level else self._idle_cycle
+        if self._instruction_level:
+            self.wait_for_pulse = self._no_pulse
+            self._fetch_cycles = self._no_fetch_cycles
+            self.OPCODES = {opcode: (self._timed(func, cycles), mode, cycles)
+                            for opcode, (func, mode, cycles) in self._bind_opcodes().items()}
+        else:
+            self.wait_for_pulse = self.clock.wait_for_pulse
+            self._fetch_cycles = self.clock.advance
+            self.OPCODES = self._bind_opcodes()
+        # Cached entries hold handlers out of the old table.
+        self.invalidate_decode_cache()
+
+    def _bind_opcodes(self) -> dict:
+        return {
+            opcode: (getattr(self, self._handlers.get(name, name)), self.addressing_mode[mode], cycles)
+            for opcode, (name, mode, cycles) in self.instructions.items()
         }
 
+    def _timed(self, func, cycles: int):
+        """Handler for instruction level accuracy, the clock moves on by the base cycles before it runs."""
+        advance = self.clock.advance
+
+        def timed(addressing_mode: int):
+            advance(cycles)
+            func(addressing_mode)
+        timed.__name__ = func.__name__
+        return timed
+
     def reset(self):
         lsb_addr = self.clock.schedule(self.get_byteADDR, Word(0xFFFC))
         self.wait_for_pulse()
@@ -94,6 +308,47 @@ class CPU6502:
         self.wait_for_pulse()
         self.pc = make_addr(lsb_addr, msb_addr)
         self.sp.value = 0xFF
+        if self._instruction_level:
+            self.clock.advance(4)
+
+    def save_state(self) -> dict:
+        """
+        Snapshot registers, pending interrupts, the cycle count and the contents of memory.
+
+        Device internals and scheduled events are not included, restoring only rewinds what the CPU and RAM hold.
+        """
+        return {
+            'a': self.a.value,
+            'x': self.x.value,
+            'y': self.y.value,
+            'pc': self.pc.value,
+            'sp': self.sp.value,
+            'status': self.get_status_register().value,
+            'cycles': self.clock.cycles,
+            'irq_sources': frozenset(self._irq_sources),
+            'nmi_pending': self._nmi_pending,
+            'memory_writes': self.memory_writes,
+            'memory': self.memory.dump(0, self.memory.memory_size),
+        }
+
+    def restore_state(self, state: dict):
+        self.a = Byte(state['a'])
+        self.x = Byte(state['x'])
+        self.y = Byte(state['y'])
+        self.pc = Word(state['pc'])
+        self.sp = Byte(state['sp'])
+        for bit, flag in enumerate(self.flags.keys()):
+            self.flags[flag] = Bit((state['status'] >> bit) & 1)
+        self.clock.cycles = state['cycles']
+        self._irq_sources = set(state['irq_sources'])
+        self._nmi_pending = state['nmi_pending']
+        self._interrupt_pending = self._nmi_pending or bool(self._irq_sources)
+        self.memory_writes = state['memory_writes']
+        self.memory.load(0, state['memory'])
+        self._idle_candidate = None
+        self._breakpoint_resume = None
+        self._watch_hit = None
+        self.invalidate_decode_cache()
 
     def start(self):
         self._cpu_thread.start()
@@ -101,18 +356,336 @@ class CPU6502:
     def run(self):
         # self.clock.schedule(self.reset)
         while True:
-            self.clock.schedule(self.execute)
+            self.run_until(self.clock.cycles + STATS_SLICE)
+
+    def run_until(self, cycle: int):
+        """Execute whole instructions until the clock reaches cycle."""
+        self._run_limit = cycle
+        start_cycle = self.clock.cycles
+        interrupts = self.interrupts_serviced
+        started = time.perf_counter()
+        busy = time.thread_time()
+        fused = self.fused_pairs
+        executed = 0
+        try:
+            while self.clock.cycles < cycle:
+                self.clock.schedule(self.execute)
+                executed += 1
+        finally:
+            self._run_limit = float('inf')
+            # execute() calls that took an interrupt did not run an instruction.
+            self.instructions_retired += executed - (self.interrupts_serviced - interrupts) + self.fused_pairs - fused
+            self.run_cycles += self.clock.cycles - start_cycle
+            self.run_seconds += time.perf_counter() - started
+            self.busy_seconds += time.thread_time() - busy
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the CPU's counters.
+
+        Instructions, timings and the achieved clock rate cover run() and run_until(), instructions executed by
+        calling execute() directly are not counted. blocked_seconds is the part of the run time this thread spent
+        waiting, mostly on clock pulses. memory_reads and memory_writes count data accesses, not instruction fetches,
+        reads only while count_memory_reads() is on.
+        """
+        stats = {
+            'instructions_retired': self.instructions_retired,
+            'cycles': self.clock.cycles,
+            'run_cycles': self.run_cycles,
+            'run_seconds': self.run_seconds,
+            'blocked_seconds': max(self.run_seconds - self.busy_seconds, 0.0),
+            'mhz': self.run_cycles / self.run_seconds / 1e6 if self.run_seconds else 0.0,
+            'memory_reads': self.memory_reads,
+            'memory_writes': self.memory_writes,
+            'interrupts_serviced': self.interrupts_serviced,
+            'idle_cycles_skipped': self.idle_cycles_skipped,
+        }
+        for key, value in self.decode_cache_stats().items():
+            stats[f'decode_cache_{key}'] = value
+        return stats
+
+    def set_irq(self, source, asserted: bool = True):
+        """
+        Assert or release the IRQ line on behalf of source.
+
+        Devices call this from scheduled events, e.g. clock.events.schedule(cycle, cpu.set_irq, 'via', True), and the
+        CPU takes the interrupt at the next instruction boundary if the I flag is clear.
+        """
+        if asserted:
+            self._irq_sources.add(source)
+        else:
+            self._irq_sources.discard(source)
+        self._interrupt_pending = self._nmi_pending or bool(self._irq_sources)
+
+    def nmi(self):
+        """Signal a falling edge on the NMI line, taken at the next instruction boundary regardless of the I flag."""
+        self._nmi_pending = True
+        self._interrupt_pending = True
+
+    def _service_interrupt(self) -> bool:
+        if self._nmi_pending:
+            self._nmi_pending = False
+            vector = NMI_VECTOR
+        elif self._irq_sources and not self.flags['I'].value:
+            vector = IRQ_VECTOR
+        else:
+            # IRQ is masked, it stays pending until the I flag is cleared or the line released.
+            return False
+        self._interrupt_pending = bool(self._irq_sources)
+
+        # 7 Cycles
+        if self._instruction_level:
+            self.clock.advance(7)
+        self._dummy_read(self.pc)
+        self._dummy_read(self.pc)
+        self.push(Byte(self.pc.value >> 8))
+        self.push(Byte(self.pc.value & 0xFF))
+        # B is only set in the copy pushed by BRK/PHP, the unused bit always reads as 1.
+        self.push(Byte((self.get_status_register().value & 0xEF) | 0x20))
+        for flag, value in self._interrupt_flags:
+            self.flags[flag] = Bit(value)
+        lsb = self.clock.schedule(self.get_byteADDR, Word(vector))
+        msb = self.clock.schedule(self.get_byteADDR, Word(vector + 1))
+        self.pc = make_addr(lsb, msb)
+        self.interrupts_serviced += 1
+        return True
+
+    def count_memory_reads(self, enabled: bool = True):
+        """
+        Count data reads in memory_reads from now on, or stop counting.
+
+        Off by default so reads cost nothing extra, the counting accessor is only swapped in while enabled.
+        """
+        self._count_reads = enabled
+        self._update_instrumentation()
+
+    def add_breakpoint(self, address: int | DType):
+        """Stop with BreakpointHit before executing the instruction at address. Executing again resumes."""
+        self._breakpoints.add(int(address))
+        self._update_instrumentation()
+
+    def remove_breakpoint(self, address: int | DType):
+        self._breakpoints.discard(int(address))
+        self._update_instrumentation()
+
+    def add_watchpoint(self, start: int | DType, end: int | DType | None = None, read: bool = False,
+                       write: bool = True) -> tuple:
+        """
+        Stop with WatchpointHit after an instruction reads or writes an address from start to end inclusive.
+
+        Returns a handle for remove_watchpoint().
+        """
+        start = int(start)
+        end = start if end is None else int(end)
+        watchpoint = (start, end, read, write)
+        self._watchpoints.append(watchpoint)
+        self._update_instrumentation()
+        return watchpoint
+
+    def remove_watchpoint(self, watchpoint: tuple):
+        self._watchpoints.remove(watchpoint)
+        self._update_instrumentation()
+
+    def _update_instrumentation(self):
+        pages = {access: set() for access in ('read', 'write')}
+        for start, end, read, write in self._watchpoints:
+            for page in range(start >> 8, (end >> 8) + 1):
+                if read:
+                    pages['read'].add(page)
+                if write:
+                    pages['write'].add(page)
+        self._watch_read_pages = pages['read']
+        self._watch_write_pages = pages['write']
+
+        self.execute = self._execute_debug if self._breakpoints or self._watchpoints else self._plain_execute
+        self._unwatched_get_byteADDR = self._get_byteADDR_counted if self._count_reads else self._plain_get_byteADDR
+        self.get_byteADDR = self._get_byteADDR_watched if pages['read'] else self._unwatched_get_byteADDR
+        self.store_byteADDR = self._store_byteADDR_watched if pages['write'] else self._plain_store_byteADDR
+
+    def _execute_debug(self):
+        pc = self.pc.value
+        if pc in self._breakpoints and self._breakpoint_resume != pc:
+            self._breakpoint_resume = pc
+            raise BreakpointHit(f'Breakpoint at {pc:#06x}', pc)
+        self._plain_execute()
+        self._breakpoint_resume = None
+        if self._watch_hit is not None:
+            access, address, value = self._watch_hit
+            self._watch_hit = None
+            raise WatchpointHit(f'Watchpoint {access} of {value:#04x} at {address:#06x}', access, address, value)
+
+    def _check_watchpoints(self, access: str, address: int, value: Byte):
+        for start, end, read, write in self._watchpoints:
+            if start <= address <= end and (read if access == 'read' else write):
+                # Let the instruction finish, _execute_debug raises at the boundary.
+                if self._watch_hit is None:
+                    self._watch_hit = (access, address, value.value)
+                return
+
+    def _get_byteADDR_counted(self, address: Word | Byte) -> Byte:
+        self.memory_reads += 1
+        return self._plain_get_byteADDR(address)
+
+    def _get_byteADDR_watched(self, address: Word | Byte) -> Byte:
+        value = self._unwatched_get_byteADDR(address)
+        if address.value >> 8 in self._watch_read_pages:
+            self._check_watchpoints('read', address.value, value)
+        return value
+
+    def _store_byteADDR_watched(self, address: Word | Byte, value: Byte):
+        self._plain_store_byteADDR(address, value)
+        if address.value >> 8 in self._watch_write_pages:
+            self._check_watchpoints('write', address.value, value)
 
     def execute(self):
+        if self.clock.cycles >= self._events.next_cycle:
+            self._events.run_due(self.clock.cycles)
+        if self._interrupt_pending and self._service_interrupt():
+            return
         # Fetch the opcode
         opcode = self.clock.schedule(self.get_bytePC)
-        func, addressing_mode = self.OPCODES[opcode.value]
-        print(f'running {func.__name__}')
+        func, addressing_mode, _ = self.OPCODES[opcode.value]
+        self.clock.schedule(func, addressing_mode)
+
+    def _execute_cached(self):
+        if self.clock.cycles >= self._events.next_cycle:
+            self._events.run_due(self.clock.cycles)
+        if self._interrupt_pending and self._service_interrupt():
+            return
+        pc = self.pc.value
+        entry = self._decode_cache[pc >> 8].get(pc)
+        if entry is None:
+            self.decode_cache_misses += 1
+            entry = self._decode(pc)
+            if entry is None:
+                # Not cacheable, take the normal fetch and decode path.
+                self._operand = None
+                return CPU6502.execute(self)
+        else:
+            self.decode_cache_hits += 1
+        func, addressing_mode, self._operand, length, self.pc, _, _ = entry
+        # Every byte still costs its fetch cycle, counted in one step, the handler gets the operand already decoded.
+        self._fetch_cycles(length)
         self.clock.schedule(func, addressing_mode)
 
+    def _decode(self, pc: int):
+        opcode = self.memory[pc].value
+        if opcode not in self.OPCODES:
+            return None
+        length = 1 + operand_lengths_6502[self.instructions[opcode][1]]
+        # Instructions straddling a page boundary would need invalidating from two pages, don't cache them.
+        # Neither is code running out of device registers.
+        if (pc >> 8) != ((pc + length - 1) >> 8) or self.memory.is_device_page(pc):
+            return None
+        func, addressing_mode, cycles = self.OPCODES[opcode]
+        entry = (func, addressing_mode, self._decode_operand(pc, length), length, Word(pc + length), opcode, cycles)
+        if self._fusion:
+            entry = self._decode_fused(pc + length, entry)
+        self._decode_cache[pc >> 8][pc] = entry
+        return entry
+
+    def _decode_fused(self, pc: int, first: tuple) -> tuple:
+        """Fuse first with the instruction at pc if the pair is in the fusion table and pc is on the same page."""
+        if pc >> 8 != (pc - 1) >> 8:
+            return first
+        opcode = self.memory[pc].value
+        if (first[5], opcode) not in self._fusion:
+            return first
+        length = 1 + operand_lengths_6502[self.instructions[opcode][1]]
+        if (pc >> 8) != ((pc + length - 1) >> 8):
+            return first
+        func, addressing_mode, cycles = self.OPCODES[opcode]
+        second = (func, addressing_mode, self._decode_operand(pc, length), length, Word(pc + length))
+        return (self._fuse(first[0], first[1], pc, second), None) + first[2:6] + (first[6] + cycles,)
+
+    def _decode_operand(self, pc: int, length: int) -> Byte | Word | None:
+        if length == 2:
+            return self.memory[pc + 1]
+        if length == 3:
+            return make_addr(self.memory[pc + 1], self.memory[pc + 2])
+        return None
+
+    def _fuse(self, first, first_mode: int, second_pc: int, second_entry: tuple):
+        """
+        Handler running two instructions back to back without going through execute() in between.
+
+        Anything that would have acted on the boundary between them, an event coming due, run_until() reaching its
+        cycle, an interrupt, a jump away, a write into the cached page, or anything wrapping execute(), breakpoints,
+        watchpoints, coverage, profilers and tracers, leaves the second instruction to the next execute() instead.
+        Cycles and flags are the same as running the pair unfused.
+        """
+        second, second_mode, second_operand, second_length, second_next = second_entry
+
+        def fused(_):
+            invalidations = self.decode_cache_invalidations
+            first(first_mode)
+            cycle = self.clock.cycles
+            if (self.pc.value != second_pc or cycle >= self._events.next_cycle or cycle >= self._run_limit
+                    or self._interrupt_pending or self.decode_cache_invalidations != invalidations
+                    or self.execute is not self._unwrapped_execute):
+                return
+            self.fused_pairs += 1
+            self._fetch_cycles(second_length)
+            self._operand = second_operand
+            self.pc = second_next
+            second(second_mode)
+        fused.__name__ = f'{first.__name__}+{second.__name__}'
+        return fused
+
+    def invalidate_decode_cache(self, address: int | DType | None = None):
+        """
+        Drop predecoded instructions for the page containing address, or for every page if no address is given.
+
+        Writes made by the CPU invalidate automatically, call this after writing to memory from outside the CPU.
+        """
+        if address is None:
+            if not self.decode_cache_misses:
+                # Nothing was ever decoded.
+                return
+            for page in self._decode_cache:
+                if page:
+                    page.clear()
+        else:
+            page = self._decode_cache[int(address) >> 8]
+            if page:
+                page.clear()
+                self.decode_cache_invalidations += 1
+
+    def decode_cache_stats(self) -> dict:
+        lookups = self.decode_cache_hits + self.decode_cache_misses
+        return {
+            'hits': self.decode_cache_hits,
+            'misses': self.decode_cache_misses,
+            'invalidations': self.decode_cache_invalidations,
+            'entries': sum(len(page) for page in self._decode_cache),
+            'hit_rate': self.decode_cache_hits / lookups if lookups else 0.0,
+        }
+
     def wait_for_pulse(self):
         self.clock.wait_for_pulse()
 
+    def _no_pulse(self):
+        pass
+
+    def _no_fetch_cycles(self, cycles: int):
+        # Instruction accuracy counted them with the rest of the instruction.
+        pass
+
+    def _idle_cycle(self, address: Word | Byte):
+        self.wait_for_pulse()
+
+    def _idle_write(self, address: Word | Byte, value: Byte):
+        self.wait_for_pulse()
+
+    def _advance_cycle(self, address: Word | Byte):
+        self.clock.advance(1)
+
+    def _dummy_read_bus(self, address: Word | Byte):
+        self.get_byteADDR(address)
+
+    def _dummy_write_bus(self, address: Word | Byte, value: Byte):
+        self.store_byteADDR(address, value)
+
     def get_bytePC(self) -> Byte:
         # Getting a byte from memory will always take a full cycle
         self.wait_for_pulse()
@@ -120,6 +693,19 @@ class CPU6502:
         self.pc += 1
         return data
 
+    def _get_bytePC_cached(self) -> Byte:
+        # A cached instruction's one operand fetch, already counted and decoded by _execute_cached.
+        operand = self._operand
+        if operand is None:
+            return CPU6502.get_bytePC(self)
+        return operand
+
+    def _get_absolute_address_cached(self) -> Word:
+        operand = self._operand
+        if operand is None:
+            return CPU6502.get_absolute_address(self)
+        return operand
+
     def get_byteADDR(self, address: Word | Byte) -> Byte:
         self.wait_for_pulse()
         return self.memory[address]
@@ -127,6 +713,42 @@ class CPU6502:
     def store_byteADDR(self, address: Word | Byte, value: Byte):
         self.wait_for_pulse()
         self.memory[address] = value
+        self.memory_writes += 1
+
+    def _store_byteADDR_cached(self, address: Word | Byte, value: Byte):
+        self.wait_for_pulse()
+        self.memory[address] = value
+        self.memory_writes += 1
+        page = self._decode_cache[address.value >> 8]
+        if page:
+            page.clear()
+            self.decode_cache_invalidations += 1
+
+    def _check_idle_loop(self, target: int):
+        """
+        Called when a jump or branch goes backwards to target.
+
+        If the machine arrives back at target in exactly the same state, with no memory writes, no reads of volatile
+        device registers and no events in between, every further iteration is identical until the next event can
+        change something. Those iterations are skipped by advancing the clock by whole loop periods, so execution
+        resumes at the same instruction boundary, on the same cycle, that interpreting them would have reached.
+        """
+        state = (target, self.a.value, self.x.value, self.y.value, self.sp.value, self.get_status_register().value,
+                 self.memory_writes, self.memory.volatile_reads, self._events.fired)
+        cycle = self.clock.cycles
+        candidate, self._idle_candidate = self._idle_candidate, (state, cycle)
+        if candidate is None or candidate[0] != state:
+            return
+        deadline = min(self._events.next_cycle, self._run_limit)
+        if deadline == float('inf'):
+            # Nothing can ever break the loop, keep interpreting it.
+            return
+        period = cycle - candidate[1]
+        skipped = (deadline - cycle) // period * period
+        if skipped > 0:
+            self.clock.advance(skipped)
+            self.idle_cycles_skipped += skipped
+            self._idle_candidate = (state, self.clock.cycles)
 
     def get_absolute_address(self) -> Word:
         # Takes 2 cycles
@@ -150,6 +772,23 @@ class CPU6502:
         address = self.clock.schedule(self.add_y, address, do_cycle=False)
         return address
 
+    def get_zero_page_indirect_address(self) -> Word:
+        # 65C02 (zp), the pointer's msb wraps around within the zero page.
+        pointer = self.clock.schedule(self.get_bytePC)
+        lsb = self.clock.schedule(self.get_byteADDR, pointer)
+        msb = self.clock.schedule(self.get_byteADDR, pointer + 1)
+        return make_addr(lsb, msb)
+
+    def push(self, value: Byte):
+        # 1 Cycle
+        self.clock.schedule(self.store_byteADDR, Word(0x0100) + self.sp, value)
+        self.sp = Byte((self.sp.value - 1) & 0xFF)
+
+    def pull(self) -> Byte:
+        # 1 Cycle
+        self.sp = Byte((self.sp.value + 1) & 0xFF)
+        return self.clock.schedule(self.get_byteADDR, Word(0x0100) + self.sp)
+
     def get_status_register(self) -> Byte:
         status = 0
         for bit in reversed(self.flags.values()):
@@ -162,11 +801,15 @@ class CPU6502:
         # takes 1 cycle to add x register
         if not isinstance(value, DType):
             raise TypeError(f'Expected DType, got {value.__class__.__name__}')
-        if do_cycle:
-            self.wait_for_pulse()
-        if not zero_page and (self.x.value + value.value) % (Byte.max_value + 1) < self.x.value:
-            # + 1 cycle for page crossing
-            self.wait_for_pulse()
+        crossed = not zero_page and (self.x.value + value.value) % (Byte.max_value + 1) < self.x.value
+        if do_cycle or crossed:
+            # The bus sees the unfixed address, the low byte already indexed but without the carry into the high byte.
+            address = self.unfixed_address(value, self.x)
+            if do_cycle:
+                self._dummy_read(address)
+            if crossed:
+                # + 1 cycle for page crossing
+                self._extra_cycle(address)
 
         return value + self.x
 
@@ -174,14 +817,25 @@ class CPU6502:
         # takes 1 cycle to add y register
         if not isinstance(value, DType):
             raise TypeError(f'Expected DType, got {value.__class__.__name__}')
-        if do_cycle:
-            self.wait_for_pulse()
-        if not zero_page and (self.y.value + value.value) % (Byte.max_value + 1) < self.y.value:
-            # + 1 cycle for page crossing
-            self.wait_for_pulse()
+        crossed = not zero_page and (self.y.value + value.value) % (Byte.max_value + 1) < self.y.value
+        if do_cycle or crossed:
+            # The bus sees the unfixed address, the low byte already indexed but without the carry into the high byte.
+            address = self.unfixed_address(value, self.y)
+            if do_cycle:
+                self._dummy_read(address)
+            if crossed:
+                # + 1 cycle for page crossing
+                self._extra_cycle(address)
 
         return value + self.y
 
+    @staticmethod
+    def unfixed_address(value: DType, index: Byte) -> DType:
+        if isinstance(value, Word):
+            return Word((value.value & 0xFF00) | ((value.value + index.value) & 0xFF))
+        # Zero page indexing reads the base address while adding.
+        return value
+
     def lda(self, addressing_mode: int):
         if addressing_mode == self.addressing_mode['immediate']:
             # 2 Cycles
@@ -229,6 +883,11 @@ class CPU6502:
             address = self.clock.schedule(self.get_indirect_y_address)
             value = self.clock.schedule(self.get_byteADDR, address)
             self.a = value
+        elif addressing_mode == self.addressing_mode['zero_page_indirect']:
+            # 5 Cycles
+            address = self.clock.schedule(self.get_zero_page_indirect_address)
+            value = self.clock.schedule(self.get_byteADDR, address)
+            self.a = value
         else:
             raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
 
@@ -303,7 +962,7 @@ class CPU6502:
         if addressing_mode == self.addressing_mode['accumulator']:
             # shift value in accumulator right.
             # 2 cycles
-            self.wait_for_pulse()
+            self._dummy_read(self.pc)
             self.flags['C'] = self.a & 1 == 1
             self.a >>= 1
             value = self.a
@@ -312,7 +971,8 @@ class CPU6502:
             # 5 cycles
             address = self.clock.schedule(self.get_bytePC)
             value = self.clock.schedule(self.get_byteADDR, address)
-            self.wait_for_pulse()
+            # Read-modify-write puts the unmodified value back before the result.
+            self._dummy_write(address, value)
             self.flags['C'] = value & 1 == 1
             value >>= 1
             self.clock.schedule(self.store_byteADDR, address, value)
@@ -322,7 +982,8 @@ class CPU6502:
             address = self.clock.schedule(self.get_bytePC)
             address = self.clock.schedule(self.add_x, address, zero_page=True, do_cycle=True)
             value = self.clock.schedule(self.get_byteADDR, address)
-            self.wait_for_pulse()
+            # Read-modify-write puts the unmodified value back before the result.
+            self._dummy_write(address, value)
             self.flags['C'] = value & 1 == 1
             value >>= 1
             self.clock.schedule(self.store_byteADDR, address, value)
@@ -331,7 +992,8 @@ class CPU6502:
             # 6 Cycles
             address = self.clock.schedule(self.get_absolute_address)
             value = self.clock.schedule(self.get_byteADDR, address)
-            self.wait_for_pulse()
+            # Read-modify-write puts the unmodified value back before the result.
+            self._dummy_write(address, value)
             self.flags['C'] = value & 1 == 1
             value >>= 1
             self.clock.schedule(self.store_byteADDR, address, value)
@@ -342,7 +1004,8 @@ class CPU6502:
             # Use zero page mode in add as this instruction does not incur an extra cycle for page crossing.
             address = self.clock.schedule(self.add_x, address, zero_page=True, do_cycle=True)
             value = self.clock.schedule(self.get_byteADDR, address)
-            self.wait_for_pulse()
+            # Read-modify-write puts the unmodified value back before the result.
+            self._dummy_write(address, value)
             self.flags['C'] = value & 1 == 1
             value >>= 1
             self.clock.schedule(self.store_byteADDR, address, value)
@@ -355,7 +1018,8 @@ class CPU6502:
 
     def nop(self, addressing_mode: int):
         if addressing_mode == self.addressing_mode['implied']:
-            pass
+            # 2 Cycles
+            self._dummy_read(self.pc)
         else:
             raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
 
@@ -394,6 +1058,10 @@ class CPU6502:
             address = self.clock.schedule(self.get_indirect_y_address)
             value = self.clock.schedule(self.get_byteADDR, address)
             self.a |= value
+        elif addressing_mode == self.addressing_mode['zero_page_indirect']:
+            address = self.clock.schedule(self.get_zero_page_indirect_address)
+            value = self.clock.schedule(self.get_byteADDR, address)
+            self.a |= value
         else:
             raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
 
@@ -401,21 +1069,57 @@ class CPU6502:
         self.flags['Z'] = self.a == 0
         self.flags['N'] = self.a & 0x80 > 0
 
+    def sta(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['zero_page']:
+            # 3 Cycles
+            address = self.clock.schedule(self.get_bytePC)
+        elif addressing_mode == self.addressing_mode['zero_page_x']:
+            # 4 Cycles
+            address = self.clock.schedule(self.get_bytePC)
+            address = self.clock.schedule(self.add_x, address, zero_page=True)
+        elif addressing_mode == self.addressing_mode['absolute']:
+            # 4 Cycles
+            address = self.clock.schedule(self.get_absolute_address)
+        elif addressing_mode == self.addressing_mode['absolute_x']:
+            # 5 Cycles, stores always take the extra cycle so zero page mode is used to skip the page crossing one.
+            address = self.clock.schedule(self.get_absolute_address)
+            address = self.clock.schedule(self.add_x, address, zero_page=True, do_cycle=True)
+        elif addressing_mode == self.addressing_mode['absolute_y']:
+            # 5 Cycles
+            address = self.clock.schedule(self.get_absolute_address)
+            address = self.clock.schedule(self.add_y, address, zero_page=True, do_cycle=True)
+        elif addressing_mode == self.addressing_mode['indirect_x']:
+            # 6 Cycles
+            address = self.clock.schedule(self.get_indirect_x_address)
+        elif addressing_mode == self.addressing_mode['indirect_y']:
+            # 6 Cycles
+            address = self.clock.schedule(self.get_bytePC)
+            address = Word(address.value)
+            lsb = self.clock.schedule(self.get_byteADDR, address)
+            msb = self.clock.schedule(self.get_byteADDR, address + 1)
+            address = self.clock.schedule(self.add_y, make_addr(lsb, msb), zero_page=True, do_cycle=True)
+        elif addressing_mode == self.addressing_mode['zero_page_indirect']:
+            # 5 Cycles
+            address = self.clock.schedule(self.get_zero_page_indirect_address)
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+        self.clock.schedule(self.store_byteADDR, address, self.a)
+
     def pha(self, addressing_mode: int):
         if addressing_mode == self.addressing_mode['implied']:
+            self._dummy_read(self.pc)
             self.clock.schedule(self.store_byteADDR, Word(0x0100) + self.sp, self.a)
-            self.wait_for_pulse()
             if self.sp == 0:
                 self.sp = Byte(0xFF)
             else:
                 self.sp.value -= 1
-                print(self.sp)
         else:
             raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
 
     def pla(self, addressing_mode: int):
         if addressing_mode == self.addressing_mode['implied']:
-            self.wait_for_pulse()
+            self._dummy_read(self.pc)
+            self._dummy_read(Word(0x0100) + self.sp)
             if self.sp == 0xFF:
                 # Loop stack around to 0x0100
                 self.sp.value = 0
@@ -424,7 +1128,6 @@ class CPU6502:
             self.a = self.clock.schedule(self.get_byteADDR, Word(0x0100) + self.sp)
         else:
             raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
-        self.wait_for_pulse()
         # Update flags
         self.flags['Z'] = self.a == 0
         self.flags['N'] = self.a & 0x80 > 0
@@ -432,8 +1135,8 @@ class CPU6502:
     def php(self, addressing_mode: int):
         if addressing_mode == self.addressing_mode['implied']:
             # Push status register to stack
+            self._dummy_read(self.pc)
             self.clock.schedule(self.store_byteADDR, Word(self.sp.value + 0x0100), self.get_status_register())
-            self.wait_for_pulse()
             if self.sp == 0:
                 self.sp.value = 0xFF
             else:
@@ -443,22 +1146,176 @@ class CPU6502:
 
     def plp(self, addressing_mode: int):
         if addressing_mode == self.addressing_mode['implied']:
-            self.wait_for_pulse()
+            self._dummy_read(self.pc)
+            self._dummy_read(Word(0x0100) + self.sp)
             if self.sp == 0xFF:
                 self.sp.value = 0
             else:
                 self.sp.value += 1
             status = self.clock.schedule(self.get_byteADDR, Word(0x0100) + self.sp)
-            self.wait_for_pulse()
             for flag in self.flags.keys():
                 self.flags[flag] = status & 1
                 status >>= 1
         else:
             raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
 
+    def phx(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['implied']:
+            self._dummy_read(self.pc)
+            self.push(self.x)
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+
+    def phy(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['implied']:
+            self._dummy_read(self.pc)
+            self.push(self.y)
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+
+    def plx(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['implied']:
+            self._dummy_read(self.pc)
+            self._dummy_read(Word(0x0100) + self.sp)
+            self.x = self.pull()
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+        self.flags['Z'] = self.x == 0
+        self.flags['N'] = self.x & 0x80 > 0
+
+    def ply(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['implied']:
+            self._dummy_read(self.pc)
+            self._dummy_read(Word(0x0100) + self.sp)
+            self.y = self.pull()
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+        self.flags['Z'] = self.y == 0
+        self.flags['N'] = self.y & 0x80 > 0
+
+    def rti(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['implied']:
+            # 6 Cycles
+            self._dummy_read(self.pc)
+            self._dummy_read(Word(0x0100) + self.sp)
+            status = self.pull()
+            for flag in self.flags.keys():
+                self.flags[flag] = status & 1
+                status >>= 1
+            lsb = self.pull()
+            msb = self.pull()
+            self.pc = make_addr(lsb, msb)
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+
+    def sei(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['implied']:
+            self._dummy_read(self.pc)
+            self.flags['I'] = Bit(1)
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+
+    def cli(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['implied']:
+            self._dummy_read(self.pc)
+            self.flags['I'] = Bit(0)
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+
+    def jmp(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['absolute']:
+            # 3 Cycles
+            target = self.clock.schedule(self.get_absolute_address)
+            origin = self.pc.value - 3
+            self.pc = target
+            if self._idle_skip and self.pc.value <= origin:
+                self._check_idle_loop(self.pc.value)
+        elif addressing_mode == self.addressing_mode['indirect']:
+            # 5 Cycles
+            pointer = self.clock.schedule(self.get_absolute_address)
+            lsb = self.clock.schedule(self.get_byteADDR, pointer)
+            # The msb is read without carrying into the pointer's high byte, so JMP ($xxFF) wraps within the page.
+            pointer = Word((pointer.value & 0xFF00) | ((pointer.value + 1) & 0xFF))
+            msb = self.clock.schedule(self.get_byteADDR, pointer)
+            self.pc = make_addr(lsb, msb)
+        else:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+
+    def jmp_65c02(self, addressing_mode: int):
+        if addressing_mode == self.addressing_mode['indirect']:
+            # 6 Cycles, the extra one carries into the pointer's high byte so JMP ($xxFF) doesn't wrap.
+            pointer = self.clock.schedule(self.get_absolute_address)
+            self._dummy_read(Word(self.pc.value - 1))
+            lsb = self.clock.schedule(self.get_byteADDR, pointer)
+            msb = self.clock.schedule(self.get_byteADDR, pointer + 1)
+            self.pc = make_addr(lsb, msb)
+        elif addressing_mode == self.addressing_mode['absolute_indirect_x']:
+            # 6 Cycles
+            pointer = self.clock.schedule(self.get_absolute_address)
+            self._dummy_read(Word(self.pc.value - 1))
+            pointer = pointer + self.x
+            lsb = self.clock.schedule(self.get_byteADDR, pointer)
+            msb = self.clock.schedule(self.get_byteADDR, pointer + 1)
+            self.pc = make_addr(lsb, msb)
+        else:
+            self.jmp(addressing_mode)
+
+    def branch(self, addressing_mode: int, flag: str, value: int):
+        if addressing_mode != self.addressing_mode['relative']:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+        # 2 Cycles, +1 if taken, +1 if the target is on another page
+        offset = self.clock.schedule(self.get_bytePC)
+        if self.flags[flag].value != value:
+            return
+        self._take_branch(offset)
+
+    def bra(self, addressing_mode: int):
+        if addressing_mode != self.addressing_mode['relative']:
+            raise AddressModeError(f'Addressing mode {addressing_mode} not implemented')
+        # 3 Cycles, +1 if the target is on another page
+        self._take_branch(self.clock.schedule(self.get_bytePC))
+
+    def _take_branch(self, offset: Byte):
+        # Taken, the next opcode is read and thrown away while the offset is added.
+        self._extra_cycle(self.pc)
+        origin = self.pc.value
+        # The offset is signed and relative to the next instruction.
+        target = (origin + offset.value - (0x100 if offset.value & 0x80 else 0)) & 0xFFFF
+        if (origin ^ target) & 0xFF00:
+            self._extra_cycle(Word((origin & 0xFF00) | (target & 0xFF)))
+        self.pc = Word(target)
+        if self._idle_skip and target < origin:
+            self._check_idle_loop(target)
+
+    def bpl(self, addressing_mode: int):
+        self.branch(addressing_mode, 'N', 0)
+
+    def bmi(self, addressing_mode: int):
+        self.branch(addressing_mode, 'N', 1)
+
+    def bvc(self, addressing_mode: int):
+        self.branch(addressing_mode, 'V', 0)
+
+    def bvs(self, addressing_mode: int):
+        self.branch(addressing_mode, 'V', 1)
+
+    def bcc(self, addressing_mode: int):
+        self.branch(addressing_mode, 'C', 0)
+
+    def bcs(self, addressing_mode: int):
+        self.branch(addressing_mode, 'C', 1)
+
+    def bne(self, addressing_mode: int):
+        self.branch(addressing_mode, 'Z', 0)
+
+    def beq(self, addressing_mode: int):
+        self.branch(addressing_mode, 'Z', 1)
+
     def brk(self, addressing_mode: int):
         if addressing_mode == self.addressing_mode['implied']:
             self.flags['B'].value = 1
+            for flag, value in self._break_flags:
+                self.flags[flag] = Bit(value)
             self.clock.stop()
             raise InterruptError('BRK instruction encountered')
         else:
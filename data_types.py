@@ -145,3 +145,7 @@ class Byte(DType):
 class Word(DType):
     max_value = 0xFFFF
     min_value = 0
+
+
+# One shared Byte per value so memory reads don't allocate. These are shared, never change their value in place.
+BYTES = tuple(Byte(value) for value in range(Byte.max_value + 1))
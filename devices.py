@@ -0,0 +1,61 @@
+from abc import ABC, abstractmethod
+from clock import Clock
+
+
+class Device(ABC):
+    """
+    Memory mapped peripheral that is only brought up to date when something needs it.
+
+    Instead of being ticked every clock pulse, a device remembers the cycle it was last synced to and catches up in
+    one step, either when the bus routes an access to it or when a deadline it scheduled comes due. Subclasses
+    implement read/write for their registers and catch_up for any state that runs on its own.
+    """
+    # Register offsets whose reads return the same value until the device's next scheduled event or a write to the
+    # device. Idle loop detection only fast-forwards loops that poll stable registers.
+    stable_registers = frozenset()
+
+    def __init__(self, clock: Clock, base: int, size: int):
+        self.clock = clock
+        self.base = base
+        self.size = size
+        self.synced_cycle = clock.cycles
+        self._deadline = None
+
+    def sync(self, cycle: int):
+        """Catch up to cycle."""
+        if cycle > self.synced_cycle:
+            self.catch_up(self.synced_cycle, cycle)
+            self.synced_cycle = cycle
+
+    def catch_up(self, start: int, end: int):
+        """Advance state from cycle start to cycle end in one step."""
+        pass
+
+    def schedule_deadline(self, cycle: int):
+        """Have the device synced at cycle and on_deadline called, replacing any deadline already scheduled."""
+        self.cancel_deadline()
+        self._deadline = self.clock.events.schedule(cycle, self._deadline_due, cycle)
+
+    def cancel_deadline(self):
+        if self._deadline is not None:
+            self.clock.events.cancel(self._deadline)
+            self._deadline = None
+
+    def on_deadline(self, cycle: int):
+        """Called once the device has been synced to a deadline it scheduled."""
+        pass
+
+    def _deadline_due(self, cycle: int):
+        self._deadline = None
+        self.sync(cycle)
+        self.on_deadline(cycle)
+
+    @abstractmethod
+    def read(self, offset: int) -> int:
+        """Read the register at offset from the device's base address."""
+        pass
+
+    @abstractmethod
+    def write(self, offset: int, value: int):
+        """Write the register at offset from the device's base address."""
+        pass
@@ -0,0 +1,323 @@
+import hashlib
+from collections import OrderedDict
+from addressing_modes import operand_lengths_6502
+from cpu import INSTRUCTIONS_6502, IRQ_VECTOR, NMI_VECTOR
+from memory import Memory
+
+RESET_VECTOR = 0xFFFC
+
+# How control leaves an instruction, by name. Anything else falls through to the next one.
+JUMPS = frozenset({'jmp', 'bra'})
+CALLS = frozenset({'jsr'})
+RETURNS = frozenset({'rts', 'rti', 'brk'})
+
+# Graphs kept by analyze(), most recently used last.
+CACHE_SIZE = 8
+_cache = OrderedDict()
+
+
+class Instruction:
+    __slots__ = ('address', 'opcode', 'name', 'mode', 'operand', 'length')
+
+    def __init__(self, address: int, opcode: int, name: str | None, mode: str | None, operand: int | None,
+                 length: int):
+        self.address = address
+        self.opcode = opcode
+        # None for opcodes the table doesn't have.
+        self.name = name
+        self.mode = mode
+        self.operand = operand
+        self.length = length
+
+    @property
+    def next(self) -> int:
+        return self.address + self.length
+
+    @property
+    def target(self) -> int | None:
+        """Where a branch, jump or call goes, None if it is not one or the target is only known at run time."""
+        if self.mode == 'relative':
+            return (self.next + self.operand - (0x100 if self.operand & 0x80 else 0)) & 0xFFFF
+        if self.mode == 'absolute' and (self.name in JUMPS or self.name in CALLS):
+            return self.operand
+        return None
+
+    def text(self) -> str:
+        """Source text the assembler turns back into the same instruction, .byte for unknown opcodes."""
+        if self.name is None:
+            return f'.byte ${self.opcode:02X}'
+        name, mode, operand = self.name.upper(), self.mode, self.operand
+        if mode == 'implied':
+            return name
+        if mode == 'accumulator':
+            return f'{name} A'
+        if mode == 'relative':
+            return f'{name} ${self.target:04X}'
+        value = f'${operand:02X}' if operand_lengths_6502[mode] == 1 else f'${operand:04X}'
+        return {
+            'immediate': f'{name} #{value}',
+            'zero_page_x': f'{name} {value},X',
+            'zero_page_y': f'{name} {value},Y',
+            'absolute_x': f'{name} {value},X',
+            'absolute_y': f'{name} {value},Y',
+            'indirect': f'{name} ({value})',
+            'indirect_x': f'{name} ({value},X)',
+            'indirect_y': f'{name} ({value}),Y',
+            'zero_page_indirect': f'{name} ({value})',
+            'absolute_indirect_x': f'{name} ({value},X)',
+        }.get(mode, f'{name} {value}')
+
+    def __repr__(self):
+        return f'Instruction(${self.address:04X} {self.text()})'
+
+
+def _image(image) -> bytes:
+    if isinstance(image, Memory):
+        return image.dump(0, image.memory_size)
+    return bytes(image)
+
+
+def decode(image: bytes, address: int, base: int = 0, instructions: dict = INSTRUCTIONS_6502) -> Instruction | None:
+    """The instruction at address, None if it runs off either end of the image."""
+    offset = address - base
+    if not 0 <= offset < len(image):
+        return None
+    opcode = image[offset]
+    entry = instructions.get(opcode)
+    if entry is None:
+        return Instruction(address, opcode, None, None, None, 1)
+    name, mode, _ = entry
+    length = 1 + operand_lengths_6502[mode]
+    if offset + length > len(image):
+        return None
+    operand = int.from_bytes(image[offset + 1:offset + length], 'little') if length > 1 else None
+    return Instruction(address, opcode, name, mode, operand, length)
+
+
+def disassemble(image, start: int, end: int | None = None, base: int = 0,
+                instructions: dict = INSTRUCTIONS_6502) -> list:
+    """Linear sweep from start up to end (exclusive, default the end of the image), one Instruction each."""
+    image = _image(image)
+    end = base + len(image) if end is None else end
+    listing = []
+    address = start
+    while address < end:
+        instruction = decode(image, address, base, instructions)
+        if instruction is None:
+            break
+        listing.append(instruction)
+        address = instruction.next
+    return listing
+
+
+class BasicBlock:
+    __slots__ = ('start', 'end', 'instructions', 'successors')
+
+    def __init__(self, start: int):
+        self.start = start
+        # Address after the last instruction.
+        self.end = start
+        self.instructions = []
+        # Addresses control can go to next, in order: branch target before the fall through.
+        self.successors = []
+
+    @property
+    def last(self) -> Instruction:
+        return self.instructions[-1]
+
+    def __repr__(self):
+        successors = ', '.join(f'${successor:04X}' for successor in self.successors)
+        return f'BasicBlock(${self.start:04X}-${self.end - 1:04X} -> [{successors}])'
+
+
+class ControlFlowGraph:
+    """
+    Basic blocks reachable from a set of entry points, found by following every branch, jump and call.
+
+    Indirect jumps, returns and BRK end their block with no successors, their targets are only known at run time and
+    the indirect jumps are listed in indirect_jumps. Targets outside the image are listed in external.
+    """
+    def __init__(self, entries: dict, blocks: dict, instructions: dict, indirect_jumps: list, external: set,
+                 invalid: list):
+        self.entries = entries
+        self.blocks = blocks
+        self.instructions = instructions
+        self.indirect_jumps = indirect_jumps
+        self.external = external
+        # Unknown opcodes control reached, as addresses.
+        self.invalid = invalid
+        self._starts = sorted(blocks)
+        self._predecessors = None
+        self._block_of = None
+
+    def block_at(self, address: int) -> BasicBlock | None:
+        """The block holding the instruction starting at address, or None if no block does."""
+        if self._block_of is None:
+            self._block_of = {instruction.address: block for block in self.blocks.values()
+                              for instruction in block.instructions}
+        return self._block_of.get(address)
+
+    def predecessors(self, start: int) -> list:
+        if self._predecessors is None:
+            self._predecessors = {}
+            for block in self.blocks.values():
+                for successor in block.successors:
+                    self._predecessors.setdefault(successor, []).append(block.start)
+        return self._predecessors.get(start, [])
+
+    def edges(self) -> list:
+        return [(block.start, successor) for block in self.blocks.values() for successor in block.successors]
+
+    def listing(self) -> str:
+        """Blocks in address order as assembler source, each starting with an L_xxxx label."""
+        lines = []
+        names = {address: name for name, address in self.entries.items()}
+        for start in self._starts:
+            block = self.blocks[start]
+            label = f'L_{start:04X}:'
+            if start in names:
+                label += f'  ; {names[start]}'
+            lines.append(label)
+            for instruction in block.instructions:
+                lines.append(f'        {instruction.text()}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dot(self) -> str:
+        lines = ['digraph cfg {', '  node [shape=box fontname=monospace];']
+        for start in self._starts:
+            block = self.blocks[start]
+            text = '\\l'.join(f'{instruction.address:04X} {instruction.text()}' for instruction in block.instructions)
+            lines.append(f'  b{start:04X} [label="{text}\\l"];')
+            for successor in block.successors:
+                if successor in self.blocks:
+                    lines.append(f'  b{start:04X} -> b{successor:04X};')
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+
+def rom_hash(image) -> str:
+    return hashlib.sha256(_image(image)).hexdigest()
+
+
+def vectors(image, base: int = 0) -> dict:
+    """Reset, IRQ and NMI entry points read from the vectors, for those the image covers."""
+    image = _image(image)
+    entries = {}
+    for name, vector in (('reset', RESET_VECTOR), ('irq', IRQ_VECTOR), ('nmi', NMI_VECTOR)):
+        offset = vector - base
+        if 0 <= offset and offset + 2 <= len(image):
+            entries[name] = image[offset] | (image[offset + 1] << 8)
+    return entries
+
+
+def analyze(image, entries: dict | None = None, base: int = 0, instructions: dict = INSTRUCTIONS_6502,
+            cache: bool = True) -> ControlFlowGraph:
+    """
+    ControlFlowGraph of image, loaded at base, from entries ({name: address}, default the reset/IRQ/NMI vectors).
+
+    Graphs are memoized by ROM hash, entries, base and opcode table, so analysing the same image again returns the
+    same graph. Treat it as read only.
+    """
+    image = _image(image)
+    entries = vectors(image, base) if entries is None else dict(entries)
+    key = None
+    if cache:
+        table = tuple(sorted((opcode, name, mode) for opcode, (name, mode, _) in instructions.items()))
+        key = (hashlib.sha256(image).digest(), base, tuple(sorted(entries.items())), hash(table))
+        graph = _cache.get(key)
+        if graph is not None:
+            _cache.move_to_end(key)
+            return graph
+    graph = _build(image, entries, base, instructions)
+    if cache:
+        _cache[key] = graph
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return graph
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def _flow(instruction: Instruction) -> tuple:
+    """(successors, ends block) for an instruction, the fall through last."""
+    name = instruction.name
+    if name is None:
+        return (), True
+    if instruction.mode == 'relative':
+        if name in JUMPS:
+            return (instruction.target,), True
+        return (instruction.target, instruction.next), True
+    if name in JUMPS:
+        target = instruction.target
+        return ((target,) if target is not None else ()), True
+    if name in CALLS:
+        return (instruction.target, instruction.next), True
+    if name in RETURNS:
+        return (), True
+    return (instruction.next,), False
+
+
+def _build(image: bytes, entries: dict, base: int, instructions: dict) -> ControlFlowGraph:
+    decoded = {}
+    leaders = set()
+    external = set()
+    indirect_jumps = []
+    invalid = []
+    end = base + len(image)
+
+    def visit(address):
+        if not base <= address < end:
+            external.add(address)
+            return False
+        return True
+
+    # Find every reachable instruction and where blocks must start.
+    work = [address for address in entries.values() if visit(address)]
+    leaders.update(work)
+    while work:
+        address = work.pop()
+        while True:
+            if address in decoded:
+                # Reached known code from somewhere new, it starts a block.
+                leaders.add(address)
+                break
+            instruction = decode(image, address, base, instructions)
+            if instruction is None:
+                break
+            decoded[address] = instruction
+            successors, ends = _flow(instruction)
+            if instruction.name is None:
+                invalid.append(address)
+            elif instruction.name in JUMPS and instruction.target is None:
+                indirect_jumps.append(address)
+            if not ends:
+                address = instruction.next
+                if not visit(address):
+                    break
+                continue
+            for successor in successors:
+                if visit(successor):
+                    leaders.add(successor)
+                    work.append(successor)
+            break
+
+    # Cut the reachable instructions into blocks at the leaders.
+    blocks = {}
+    for start in sorted(leaders):
+        if start not in decoded:
+            continue
+        block = BasicBlock(start)
+        address = start
+        while True:
+            instruction = decoded[address]
+            block.instructions.append(instruction)
+            successors, ends = _flow(instruction)
+            address = instruction.next
+            if ends or address in leaders or address not in decoded:
+                block.successors = list(successors)
+                break
+        block.end = address
+        blocks[start] = block
+    return ControlFlowGraph(entries, blocks, decoded, sorted(indirect_jumps), external, sorted(invalid))
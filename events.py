@@ -0,0 +1,51 @@
+import heapq
+from itertools import count
+
+
+class EventQueue:
+    """
+    Callbacks stamped with the clock cycle they are due on.
+
+    The CPU runs due events between instructions, so a callback always sees the machine at an instruction boundary.
+    Checking for due events is a single comparison against next_cycle.
+    """
+    def __init__(self):
+        self._queue = []
+        self._counter = count()
+        self.next_cycle = float('inf')
+        # Number of callbacks run so far, lets observers tell whether anything happened in between two points.
+        self.fired = 0
+
+    def __len__(self):
+        return sum(1 for event in self._queue if event[2] is not None)
+
+    def schedule(self, cycle: int, callback, *args) -> list:
+        """Run callback(*args) at the first instruction boundary on or after cycle. Returns a handle for cancel()."""
+        event = [cycle, next(self._counter), callback, args]
+        heapq.heappush(self._queue, event)
+        if cycle < self.next_cycle:
+            self.next_cycle = cycle
+        return event
+
+    def cancel(self, event: list):
+        event[2] = None
+        self._drop_cancelled()
+
+    def clear(self):
+        self._queue.clear()
+        self.next_cycle = float('inf')
+
+    def run_due(self, cycle: int):
+        queue = self._queue
+        while queue and queue[0][0] <= cycle:
+            _, _, callback, args = heapq.heappop(queue)
+            if callback is not None:
+                self.fired += 1
+                callback(*args)
+        self._drop_cancelled()
+
+    def _drop_cancelled(self):
+        queue = self._queue
+        while queue and queue[0][2] is None:
+            heapq.heappop(queue)
+        self.next_cycle = queue[0][0] if queue else float('inf')
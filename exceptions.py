@@ -23,3 +23,37 @@ class AddressModeError(ValueError):
 
     def __str__(self):
         return f'AddressModeError: {self.message}'
+
+
+class BreakpointHit(Exception):
+    def __init__(self, message, address):
+        super().__init__(message)
+        self.message = message
+        self.address = address
+
+    def __str__(self):
+        return f'BreakpointHit: {self.message}'
+
+
+class WatchpointHit(Exception):
+    def __init__(self, message, access, address, value):
+        super().__init__(message)
+        self.message = message
+        self.access = access
+        self.address = address
+        self.value = value
+
+    def __str__(self):
+        return f'WatchpointHit: {self.message}'
+
+
+class AssemblerError(ValueError):
+    def __init__(self, message, line=None):
+        super().__init__(message)
+        self.message = message
+        self.line = line
+
+    def __str__(self):
+        if self.line is None:
+            return f'AssemblerError: {self.message}'
+        return f'AssemblerError: line {self.line}: {self.message}'
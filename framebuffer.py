@@ -0,0 +1,131 @@
+import struct
+import zlib
+from devices import Device
+from clock import Clock
+
+
+class Framebuffer(Device):
+    """
+    Memory mapped framebuffer.
+
+    Video RAM is width * height pixels of bits_per_pixel (1, 2, 4 or 8) bits, packed most significant bits first with
+    every row starting on a byte boundary. Pixel values index into palette, a sequence of (r, g, b) tuples, which
+    defaults to a grey ramp.
+
+    Guest writes only mark their row dirty. render() converts the dirty rows to RGB in a few numpy operations and
+    keeps the rest of the previous frame, so no Python code runs per pixel. numpy is needed for rendering and
+    dumping frames, not for running the guest.
+    """
+    def __init__(self, clock: Clock, base: int, width: int, height: int, bits_per_pixel: int = 8, palette=None):
+        if bits_per_pixel not in (1, 2, 4, 8):
+            raise ValueError(f'bits_per_pixel must be 1, 2, 4 or 8, got {bits_per_pixel}')
+        self.width = width
+        self.height = height
+        self.bits_per_pixel = bits_per_pixel
+        self.stride = (width * bits_per_pixel + 7) // 8
+        super().__init__(clock, base, self.stride * height)
+        self.stable_registers = range(self.size)
+
+        self.vram = bytearray(self.size)
+        self._dirty = bytearray(b'\x01' * height)
+        self._frame = None
+        self._palette = None
+        self.set_palette(palette)
+
+        self.frames_rendered = 0
+        self.rows_rendered = 0
+
+    def set_palette(self, palette=None):
+        colours = 1 << self.bits_per_pixel
+        if palette is None:
+            palette = [(value, value, value) for value in (i * 255 // (colours - 1) for i in range(colours))]
+        if len(palette) < colours:
+            raise ValueError(f'Palette needs {colours} colours for {self.bits_per_pixel} bits per pixel')
+        self.palette = [tuple(colour) for colour in palette]
+        self._palette = None
+        self._dirty[:] = b'\x01' * self.height
+
+    def read(self, offset: int) -> int:
+        return self.vram[offset]
+
+    def write(self, offset: int, value: int):
+        self.vram[offset] = value
+        self._dirty[offset // self.stride] = 1
+
+    def dirty_rows(self) -> list:
+        return [row for row, dirty in enumerate(self._dirty) if dirty]
+
+    def render(self):
+        """Return the current frame as a (height, width, 3) uint8 numpy array. The array is reused between calls."""
+        import numpy as np
+        if self._frame is None:
+            self._frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        if self._palette is None:
+            self._palette = np.array(self.palette, dtype=np.uint8)
+        rows = np.flatnonzero(np.frombuffer(self._dirty, dtype=np.uint8))
+        if len(rows):
+            raw = np.frombuffer(self.vram, dtype=np.uint8).reshape(self.height, self.stride)[rows]
+            if self.bits_per_pixel == 8:
+                indices = raw[:, :self.width]
+            else:
+                bits = np.unpackbits(raw, axis=1).reshape(len(rows), -1, self.bits_per_pixel)
+                weights = 1 << np.arange(self.bits_per_pixel - 1, -1, -1, dtype=np.uint8)
+                indices = (bits * weights).sum(axis=2, dtype=np.uint8)[:, :self.width]
+            self._frame[rows] = self._palette[indices]
+            self._dirty[:] = bytes(self.height)
+            self.rows_rendered += len(rows)
+        self.frames_rendered += 1
+        return self._frame
+
+    def write_ppm(self, path: str):
+        frame = self.render()
+        with open(path, 'wb') as f:
+            f.write(b'P6\n%d %d\n255\n' % (self.width, self.height))
+            f.write(frame.tobytes())
+
+    def write_png(self, path: str):
+        import numpy as np
+        frame = self.render()
+        # Filter type 0 (none) in front of every row.
+        scanlines = np.zeros((self.height, 1 + self.width * 3), dtype=np.uint8)
+        scanlines[:, 1:] = frame.reshape(self.height, -1)
+
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+            f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)))
+            f.write(chunk(b'IDAT', zlib.compress(scanlines.tobytes())))
+            f.write(chunk(b'IEND', b''))
+
+    def write_raw(self, stream):
+        """Append the frame to a raw rgb24 stream, e.g. for ffmpeg -f rawvideo -pix_fmt rgb24 -s WIDTHxHEIGHT."""
+        stream.write(self.render().tobytes())
+
+
+class FrameRecorder:
+    """Capture a framebuffer to a raw rgb24 stream every interval cycles, driven by clock events."""
+    def __init__(self, framebuffer: Framebuffer, stream, interval: int):
+        self.framebuffer = framebuffer
+        self.stream = stream
+        self.interval = interval
+        self.frames = 0
+        self._event = None
+        self._due = None
+
+    def start(self):
+        self._due = self.framebuffer.clock.cycles + self.interval
+        self._event = self.framebuffer.clock.events.schedule(self._due, self._capture)
+
+    def stop(self):
+        if self._event is not None:
+            self.framebuffer.clock.events.cancel(self._event)
+            self._event = None
+
+    def _capture(self):
+        self.framebuffer.write_raw(self.stream)
+        self.frames += 1
+        # Stay on the interval grid even though events run on the first instruction boundary after they are due.
+        self._due += self.interval
+        self._event = self.framebuffer.clock.events.schedule(self._due, self._capture)
@@ -0,0 +1,69 @@
+import json
+from collections import Counter
+from addressing_modes import operand_lengths_6502
+from cpu import CPU6502
+
+
+def profile_pairs(cpu: CPU6502, cycles: int) -> Counter:
+    """
+    Run cpu for cycles cycles and count how often each opcode falls straight through into each other opcode.
+
+    Pairs split by a jump, a taken branch, an interrupt or a page boundary are not counted, they could not be fused.
+    """
+    counts = Counter()
+    execute = cpu._plain_execute
+    memory = cpu.memory
+    instructions = cpu.instructions
+    previous = None
+
+    def profiled_execute():
+        nonlocal previous
+        pc = cpu.pc.value
+        # Fetching from a device register could have side effects, and would not be cached anyway.
+        opcode = None if memory.is_device_page(pc) else memory[pc].value
+        serviced = cpu.interrupts_serviced
+        if previous is not None and previous[0] == pc and pc >> 8 == (pc - 1) >> 8:
+            counts[previous[1], opcode] += 1
+        execute()
+        if cpu.interrupts_serviced != serviced or opcode not in instructions:
+            previous = None
+        else:
+            previous = (pc + 1 + operand_lengths_6502[instructions[opcode][1]], opcode)
+
+    cpu.execute = profiled_execute
+    try:
+        cpu.run_until(cpu.clock.cycles + cycles)
+    finally:
+        cpu._update_instrumentation()
+    return counts
+
+
+class FusionTable:
+    """
+    Opcode pairs to run as superinstructions, for CPU6502(..., fusion=table).
+
+    learn() picks the most frequent pairs out of a profile_pairs() run, save() and load() keep them on disk so later
+    runs can skip profiling.
+    """
+    def __init__(self, pairs=()):
+        self.pairs = [tuple(pair) for pair in pairs]
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    @classmethod
+    def learn(cls, counts: Counter, size: int = 32, min_count: int = 1) -> 'FusionTable':
+        return cls(pair for pair, count in counts.most_common(size) if count >= min_count)
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump({'pairs': [[f'{first:02X}', f'{second:02X}'] for first, second in self.pairs]}, f, indent=1)
+
+    @classmethod
+    def load(cls, path: str) -> 'FusionTable':
+        with open(path) as f:
+            data = json.load(f)
+        return cls((int(first, 16), int(second, 16)) for first, second in data['pairs'])
@@ -0,0 +1,180 @@
+import multiprocessing
+import random
+from cpu import CPU6502
+from exceptions import InterruptError
+
+INTERESTING = (0x00, 0x01, 0x7F, 0x80, 0xFF)
+
+
+class Fuzzer:
+    """
+    Coverage guided fuzzer for guest code.
+
+    cpu is a machine that has already booted and is about to run the code under test, the fuzzer snapshots it and
+    restores the snapshot before every input instead of booting again. Each input is written to input_address, its
+    length to length_address if given, and the guest runs until BRK, an error (a crash) or max_cycles (a hang).
+
+    Edge coverage is kept AFL style in a map of 2 ** map_bits entries indexed by (previous pc >> 1) ^ pc, filled in by
+    an instrumented execute the fuzzer runs in place of the CPU's. Each run collects the few entries it touches in a
+    set, coverage is the bitmap of every entry seen so far. Inputs that light up new entries join the corpus and are
+    mutated further.
+    """
+    def __init__(self, cpu: CPU6502, input_address: int, input_size: int, length_address: int | None = None,
+                 max_cycles: int = 100_000, seed: int = 0, map_bits: int = 16):
+        self.cpu = cpu
+        self.input_address = input_address
+        self.input_size = input_size
+        self.length_address = length_address
+        self.max_cycles = max_cycles
+        self.random = random.Random(seed)
+        self.map_size = 1 << map_bits
+        self.snapshot = cpu.save_state()
+
+        self.trace = set()
+        self.coverage = bytearray(self.map_size)
+        self.corpus = []
+        self.crashes = {}
+        self.hangs = []
+        self.executions = 0
+        self._previous = [0]
+        self._execute = self._traced_execute(cpu)
+
+    def _traced_execute(self, cpu: CPU6502):
+        execute = cpu._plain_execute
+        trace = self.trace
+        mask = self.map_size - 1
+        previous = self._previous
+
+        def traced_execute():
+            pc = cpu.pc.value
+            trace.add((previous[0] ^ pc) & mask)
+            previous[0] = pc >> 1
+            execute()
+        return traced_execute
+
+    def run_input(self, data: bytes) -> str:
+        """Run one input, returns 'ok', 'crash' or 'hang'. Coverage is left in self.trace."""
+        cpu = self.cpu
+        cpu.restore_state(self.snapshot)
+        cpu.memory.load(self.input_address, data)
+        if self.length_address is not None:
+            cpu.memory.load(self.length_address, bytes((len(data),)))
+        self.trace.clear()
+        self._previous[0] = 0
+        self.executions += 1
+
+        clock = cpu.clock
+        limit = clock.cycles + self.max_cycles
+        execute = self._execute
+        # Installed as the CPU's execute() while running, so fused pairs go back through it for every instruction.
+        cpu.execute = execute
+        try:
+            while clock.cycles < limit:
+                execute()
+        except InterruptError:
+            return 'ok'
+        except Exception as error:
+            self.crashes.setdefault(bytes(data), repr(error))
+            return 'crash'
+        finally:
+            cpu._update_instrumentation()
+        self.hangs.append(bytes(data))
+        return 'hang'
+
+    def _new_coverage(self) -> bool:
+        coverage = self.coverage
+        new = False
+        for index in self.trace:
+            if not coverage[index]:
+                coverage[index] = 1
+                new = True
+        return new
+
+    def add_seed(self, data: bytes):
+        data = bytes(data[:self.input_size])
+        self.run_input(data)
+        self._new_coverage()
+        self.corpus.append(data)
+
+    def mutate(self, data: bytes) -> bytes:
+        data = bytearray(data)
+        for _ in range(1 << self.random.randrange(4)):
+            choice = self.random.randrange(6)
+            if not data or choice == 0 and len(data) < self.input_size:
+                data.insert(self.random.randrange(len(data) + 1), self.random.randrange(256))
+            elif choice == 1:
+                data[self.random.randrange(len(data))] ^= 1 << self.random.randrange(8)
+            elif choice == 2:
+                data[self.random.randrange(len(data))] = self.random.randrange(256)
+            elif choice == 3:
+                data[self.random.randrange(len(data))] = self.random.choice(INTERESTING)
+            elif choice == 4 and len(data) > 1:
+                del data[self.random.randrange(len(data))]
+            elif self.corpus:
+                # Splice in the tail of another corpus entry.
+                other = self.random.choice(self.corpus)
+                cut = self.random.randrange(len(data) + 1)
+                data[cut:] = other[self.random.randrange(len(other) + 1):]
+        return bytes(data[:self.input_size])
+
+    def fuzz(self, executions: int) -> int:
+        """Run executions mutated inputs, returns how many were added to the corpus."""
+        if not self.corpus:
+            self.add_seed(b'')
+        added = 0
+        for _ in range(executions):
+            data = self.mutate(self.random.choice(self.corpus))
+            if self.run_input(data) != 'hang' and self._new_coverage():
+                self.corpus.append(data)
+                added += 1
+        return added
+
+    def edges_covered(self) -> int:
+        return self.map_size - self.coverage.count(0)
+
+    def merge(self, corpus, coverage: bytes, crashes: dict, hangs: list):
+        known = set(self.corpus)
+        self.corpus.extend(data for data in corpus if data not in known)
+        merged = int.from_bytes(self.coverage, 'little') | int.from_bytes(coverage, 'little')
+        self.coverage[:] = merged.to_bytes(self.map_size, 'little')
+        for data, error in crashes.items():
+            self.crashes.setdefault(data, error)
+        self.hangs.extend(hangs)
+
+
+# The fuzzer forked worker processes inherit, see fuzz_parallel.
+_worker_fuzzer = None
+
+
+def _fuzz_round(seed: int, corpus: list, coverage: bytes, executions: int) -> tuple:
+    fuzzer = _worker_fuzzer
+    fuzzer.random.seed(seed)
+    fuzzer.corpus = list(corpus)
+    fuzzer.coverage[:] = coverage
+    fuzzer.crashes = {}
+    fuzzer.hangs = []
+    fuzzer.fuzz(executions)
+    return fuzzer.corpus, bytes(fuzzer.coverage), fuzzer.crashes, fuzzer.hangs, executions
+
+
+def fuzz_parallel(fuzzer: Fuzzer, workers: int, rounds: int, executions: int):
+    """
+    Fuzz on workers processes forked from fuzzer, so they all start from its booted snapshot without booting again.
+
+    Every round each worker runs executions inputs, then their corpora and coverage are merged into fuzzer and handed
+    out again for the next round. Needs the fork start method.
+    """
+    global _worker_fuzzer
+    if not fuzzer.corpus:
+        fuzzer.add_seed(b'')
+    _worker_fuzzer = fuzzer
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for round_number in range(rounds):
+                jobs = [(fuzzer.random.randrange(1 << 32), fuzzer.corpus, bytes(fuzzer.coverage), executions)
+                        for _ in range(workers)]
+                for corpus, coverage, crashes, hangs, done in pool.starmap(_fuzz_round, jobs):
+                    fuzzer.merge(corpus, coverage, crashes, hangs)
+                    fuzzer.executions += done
+    finally:
+        _worker_fuzzer = None
@@ -0,0 +1,140 @@
+import re
+from cpu import CPU6502
+from data_types import Word, Byte
+
+MAGIC = b'6502COV1'
+ADDRESS_SPACE = 0x10000
+
+# 'label = $C000', 'label: $C000', 'label $C000', 'label = 0xC000', VICE 'al C:C000 .label' and '$C000 label'
+_SYMBOL_PATTERNS = (
+    re.compile(r'^al\s+(?:[0-9A-Fa-f]+:|00)?([0-9A-Fa-f]{4})\s+\.?(\S+)'),
+    re.compile(r'^([A-Za-z_.@][\w.@]*)\s*[:=]?\s*(?:\$|0x)([0-9A-Fa-f]{1,4})\b'),
+    re.compile(r'^(?:\$|0x)([0-9A-Fa-f]{1,4})\s+([A-Za-z_.@][\w.@]*)'),
+)
+
+
+def load_symbols(path: str) -> dict:
+    """Read a label file into {address: name}. Lines that do not look like a label are skipped."""
+    symbols = {}
+    with open(path) as f:
+        for line in f:
+            line = line.split(';')[0].strip()
+            for number, pattern in enumerate(_SYMBOL_PATTERNS):
+                match = pattern.match(line)
+                if match is None:
+                    continue
+                if number == 1:
+                    name, address = match.groups()
+                else:
+                    address, name = match.groups()
+                symbols.setdefault(int(address, 16), name)
+                break
+    return symbols
+
+
+class GuestCoverage:
+    """
+    Which addresses guest code executed, read and wrote, one byte per address for each.
+
+    Opt-in: start() wraps the CPU's plain execute and data accessors, stop() puts them back, and until then the CPU
+    runs exactly as before. The wrappers sit under breakpoints and watchpoints, so both can be used together.
+    Executed marks the address of each instruction's opcode, reads and writes mark data accesses, not instruction
+    fetches.
+
+    Maps from parallel runs are combined with merge() or merge_files(), e.g. every test process save()s its own and
+    one report() is made from all of them.
+    """
+    def __init__(self, cpu: CPU6502 | None = None):
+        self.cpu = cpu
+        self.executed = bytearray(ADDRESS_SPACE)
+        self.read = bytearray(ADDRESS_SPACE)
+        self.written = bytearray(ADDRESS_SPACE)
+        self._saved = None
+
+    def start(self):
+        cpu = self.cpu
+        self._saved = (cpu._plain_execute, cpu._plain_get_byteADDR, cpu._plain_store_byteADDR)
+        execute, get_byteADDR, store_byteADDR = self._saved
+        executed, read, written = self.executed, self.read, self.written
+
+        def covered_execute():
+            executed[cpu.pc.value] = 1
+            execute()
+
+        def covered_get_byteADDR(address: Word | Byte) -> Byte:
+            read[address.value] = 1
+            return get_byteADDR(address)
+
+        def covered_store_byteADDR(address: Word | Byte, value: Byte):
+            written[address.value] = 1
+            store_byteADDR(address, value)
+
+        cpu._plain_execute = covered_execute
+        cpu._plain_get_byteADDR = covered_get_byteADDR
+        cpu._plain_store_byteADDR = covered_store_byteADDR
+        cpu._update_instrumentation()
+
+    def stop(self):
+        if self._saved is not None:
+            cpu = self.cpu
+            cpu._plain_execute, cpu._plain_get_byteADDR, cpu._plain_store_byteADDR = self._saved
+            cpu._update_instrumentation()
+            self._saved = None
+
+    def merge(self, other: 'GuestCoverage'):
+        for mine, theirs in ((self.executed, other.executed), (self.read, other.read),
+                             (self.written, other.written)):
+            merged = int.from_bytes(mine, 'little') | int.from_bytes(theirs, 'little')
+            mine[:] = merged.to_bytes(ADDRESS_SPACE, 'little')
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(self.executed)
+            f.write(self.read)
+            f.write(self.written)
+
+    @classmethod
+    def load(cls, path: str) -> 'GuestCoverage':
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC or len(data) != len(MAGIC) + 3 * ADDRESS_SPACE:
+            raise ValueError(f'{path} is not a coverage file')
+        coverage = cls()
+        maps = memoryview(data)[len(MAGIC):]
+        coverage.executed[:] = maps[:ADDRESS_SPACE]
+        coverage.read[:] = maps[ADDRESS_SPACE:2 * ADDRESS_SPACE]
+        coverage.written[:] = maps[2 * ADDRESS_SPACE:]
+        return coverage
+
+    @classmethod
+    def merge_files(cls, paths) -> 'GuestCoverage':
+        coverage = cls()
+        for path in paths:
+            coverage.merge(cls.load(path))
+        return coverage
+
+    def routines(self, symbols: dict) -> list:
+        """
+        Coverage per symbol, taking each symbol to run up to the next one.
+
+        Returns (name, start, end, executed, read, written) tuples in address order, the last three being how many
+        addresses in the range were executed, read and written.
+        """
+        addresses = sorted(symbols)
+        report = []
+        for start, end in zip(addresses, addresses[1:] + [ADDRESS_SPACE]):
+            report.append((symbols[start], start, end - 1, self.executed[start:end].count(1),
+                           self.read[start:end].count(1), self.written[start:end].count(1)))
+        return report
+
+    def report(self, symbols: dict) -> str:
+        """Text table of routines() with the executed ones marked."""
+        lines = [f'{"":2}{"symbol":<24} {"range":<11} {"executed":>8} {"read":>6} {"written":>7}']
+        entered = 0
+        for name, start, end, executed, read, written in self.routines(symbols):
+            mark = '* ' if self.executed[start] else '  '
+            entered += bool(self.executed[start])
+            lines.append(f'{mark}{name:<24} {start:04X}-{end:04X} {executed:>8} {read:>6} {written:>7}')
+        lines.append(f'{entered} of {len(symbols)} symbols entered, {self.executed.count(1)} addresses executed')
+        return '\n'.join(lines) + '\n'
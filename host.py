@@ -0,0 +1,283 @@
+import heapq
+import multiprocessing
+import queue
+import threading
+import time
+from itertools import count
+from clock import UnthrottledClock
+from exceptions import InterruptError
+
+# How often the host checks its worker processes are still alive while waiting for them to report.
+WORKER_POLL_SECONDS = 0.5
+
+
+class Session:
+    """
+    One emulated machine owned by an EmulatorHost.
+
+    factory(*args) builds the session's CPU6502, which must run on an UnthrottledClock. In process mode it is called
+    in the worker process, so it has to be a picklable module level function.
+    """
+    def __init__(self, name: str, factory, args: tuple, priority: int, quota: int | None):
+        if priority <= 0:
+            raise ValueError(f'Priority must be positive, got {priority}')
+        self.name = name
+        self.factory = factory
+        self.args = args
+        self.priority = priority
+        self.quota = quota
+        self.cpu = None
+        # 'ready', 'quota' once the quota is used up, 'halted' after BRK, 'failed' if the guest raised anything else
+        self.state = 'ready'
+        self.error = None
+        self.cycles = 0
+        self.slices = 0
+        self.busy_seconds = 0.0
+
+    def build(self):
+        self.cpu = self.factory(*self.args)
+        if not isinstance(self.cpu.clock, UnthrottledClock):
+            raise ValueError(f'Session {self.name} needs a CPU driven by an UnthrottledClock')
+
+    @property
+    def virtual_time(self) -> float:
+        # Sessions are picked lowest first, so a priority 2 session gets twice the cycles of a priority 1 one.
+        return self.cycles / self.priority
+
+    def run_slice(self, slice_cycles: int) -> int:
+        """Run up to slice_cycles cycles, returns how many ran."""
+        clock = self.cpu.clock
+        start = clock.cycles
+        target = start + slice_cycles
+        if self.quota is not None:
+            target = min(target, start + self.quota - self.cycles)
+        started = time.perf_counter()
+        try:
+            self.cpu.run_until(target)
+        except InterruptError:
+            self.state = 'halted'
+        except Exception as error:
+            self.state = 'failed'
+            self.error = repr(error)
+        ran = clock.cycles - start
+        self.busy_seconds += time.perf_counter() - started
+        self.cycles += ran
+        self.slices += 1
+        if self.state == 'ready' and self.quota is not None and self.cycles >= self.quota:
+            self.state = 'quota'
+        return ran
+
+    def report(self) -> dict:
+        return {
+            'state': self.state,
+            'error': self.error,
+            'priority': self.priority,
+            'cycles': self.cycles,
+            'slices': self.slices,
+            'busy_seconds': self.busy_seconds,
+        }
+
+
+class _Scheduler:
+    """Weighted fair queue of ready sessions, shared by the workers of one process."""
+    def __init__(self, sessions, slice_cycles: int, stop, cycles: int | None):
+        self._queue = []
+        self._counter = count()
+        self._lock = threading.Lock()
+        self.slice_cycles = slice_cycles
+        self.stop = stop
+        self.remaining = float('inf') if cycles is None else cycles
+        for session in sessions:
+            self._push(session)
+
+    def _push(self, session: Session):
+        heapq.heappush(self._queue, (session.virtual_time, next(self._counter), session))
+
+    def take(self) -> Session | None:
+        with self._lock:
+            if not self._queue or self.stop.is_set() or self.remaining <= 0:
+                return None
+            return heapq.heappop(self._queue)[2]
+
+    def put_back(self, session: Session, ran: int):
+        with self._lock:
+            self.remaining -= ran
+            if session.state == 'ready':
+                self._push(session)
+
+    def work(self):
+        while True:
+            session = self.take()
+            if session is None:
+                return
+            self.put_back(session, session.run_slice(self.slice_cycles))
+
+
+def _process_worker(commands, results, slice_cycles: int, stop):
+    """
+    Worker process main loop. Each command is (new sessions, cycles) and runs every session this worker holds, the new
+    ones built first, then reports on all of them. None ends the worker. Sessions stay in the worker between runs.
+    """
+    sessions = []
+    while True:
+        command = commands.get()
+        if command is None:
+            return
+        new, cycles = command
+        for session in new:
+            try:
+                session.build()
+            except Exception as error:
+                session.state = 'failed'
+                session.error = repr(error)
+            sessions.append(session)
+        try:
+            _Scheduler([session for session in sessions if session.state == 'ready'], slice_cycles, stop,
+                       cycles).work()
+        finally:
+            results.put({session.name: session.report() for session in sessions})
+
+
+class EmulatorHost:
+    """
+    Runs many emulator sessions on a small pool of workers instead of a clock thread and a CPU thread each.
+
+    Sessions are run in slices of slice_cycles cycles. Whenever a worker is free it takes the ready session that has
+    had the fewest cycles for its priority, so over time each session's share of cycles is proportional to its
+    priority. A session with a quota stops once it has run that many cycles.
+
+    mode 'thread' runs the workers as threads of this process, which suits sessions that mostly wait on host I/O.
+    mode 'process' splits the sessions across worker processes, each scheduling its share the same way, for sessions
+    that are CPU-bound. Sessions are only built in the process that runs them, their CPUs are not reachable from the
+    host in process mode. The worker processes are started by the first run() and keep their sessions between runs,
+    so a later run() carries on where the last one stopped. close(), or leaving a with block, ends them.
+    """
+    def __init__(self, workers: int = 4, mode: str = 'thread', slice_cycles: int = 10_000):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Mode must be 'thread' or 'process', got {mode!r}")
+        self.workers = workers
+        self.mode = mode
+        self.slice_cycles = slice_cycles
+        self.sessions = {}
+        self.elapsed_seconds = 0.0
+        if mode == 'thread':
+            self._stop = threading.Event()
+        else:
+            self._stop = multiprocessing.Event()
+        # Process mode: (process, command queue, total priority of its sessions) per worker, and the sessions they hold.
+        self._workers = []
+        self._placed = set()
+        self._results = None
+
+    def add_session(self, factory, *args, name: str | None = None, priority: int = 1,
+                    quota: int | None = None) -> Session:
+        name = f'session{len(self.sessions)}' if name is None else name
+        if name in self.sessions:
+            raise ValueError(f'Session {name} already exists')
+        session = Session(name, factory, args, priority, quota)
+        if self.mode == 'thread':
+            session.build()
+        self.sessions[name] = session
+        return session
+
+    def run(self, duration: float | None = None, cycles: int | None = None):
+        """
+        Run sessions until every one has stopped, duration seconds have passed or cycles cycles have run across all
+        sessions (per worker process in process mode). stop() from another thread ends the run early too.
+        """
+        self._stop.clear()
+        timer = None
+        if duration is not None:
+            timer = threading.Timer(duration, self._stop.set)
+            timer.start()
+        started = time.perf_counter()
+        try:
+            if self.mode == 'thread':
+                self._run_threads(cycles)
+            else:
+                self._run_processes(cycles)
+        finally:
+            self.elapsed_seconds += time.perf_counter() - started
+            if timer is not None:
+                timer.cancel()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        """End the worker processes. Sessions they held are lost, their last reports stay."""
+        for process, commands, _ in self._workers:
+            if process.is_alive():
+                commands.put(None)
+        for process, _, _ in self._workers:
+            process.join()
+        self._workers = []
+        self._placed = set()
+        self._results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run_threads(self, cycles: int | None):
+        ready = [session for session in self.sessions.values() if session.state == 'ready']
+        scheduler = _Scheduler(ready, self.slice_cycles, self._stop, cycles)
+        threads = [threading.Thread(target=scheduler.work) for _ in range(min(self.workers, len(ready)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _run_processes(self, cycles: int | None):
+        new = [session for session in self.sessions.values()
+               if session.state == 'ready' and session.name not in self._placed]
+        if self._results is None:
+            self._results = multiprocessing.Queue()
+        while len(self._workers) < min(self.workers, len(self._placed) + len(new)):
+            commands = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_process_worker,
+                                              args=(commands, self._results, self.slice_cycles, self._stop),
+                                              daemon=True)
+            process.start()
+            self._workers.append([process, commands, 0])
+        # Deal new sessions out by priority to the least loaded worker so every process gets a similar share of work.
+        shares = [[] for _ in self._workers]
+        for session in sorted(new, key=lambda session: -session.priority):
+            index = min(range(len(self._workers)), key=lambda index: self._workers[index][2])
+            self._workers[index][2] += session.priority
+            shares[index].append(session)
+            self._placed.add(session.name)
+        for (_, commands, _), share in zip(self._workers, shares):
+            commands.put((share, cycles))
+        for _ in self._workers:
+            for name, report in self._report().items():
+                session = self.sessions[name]
+                for key, value in report.items():
+                    setattr(session, key, value)
+
+    def _report(self) -> dict:
+        """The next worker report, raising if a worker process died instead of reporting."""
+        while True:
+            try:
+                return self._results.get(timeout=WORKER_POLL_SECONDS)
+            except queue.Empty:
+                dead = [process for process, _, _ in self._workers if not process.is_alive()]
+                if dead:
+                    # Stop the others too, the run can't be completed without the dead worker's sessions.
+                    self._stop.set()
+                    self.close()
+                    raise RuntimeError(f'Worker process {dead[0].pid} exited with code {dead[0].exitcode}')
+
+    def utilization(self) -> dict:
+        """Per-session cycles, share of all cycles run, busy time and achieved clock rate."""
+        total = sum(session.cycles for session in self.sessions.values())
+        report = {}
+        for name, session in self.sessions.items():
+            report[name] = dict(
+                session.report(),
+                share=session.cycles / total if total else 0.0,
+                mhz=session.cycles / session.busy_seconds / 1e6 if session.busy_seconds else 0.0,
+            )
+        return report
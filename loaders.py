@@ -0,0 +1,63 @@
+from memory import Memory
+
+
+def load_binary(memory: Memory, path: str, address: int) -> int:
+    """Load a raw binary image at address. Returns the number of bytes loaded."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    memory.load(address, data)
+    return len(data)
+
+
+def load_prg(memory: Memory, path: str) -> int:
+    """Load a PRG file, whose first two bytes are the little endian load address. Returns the load address."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 2:
+        raise ValueError(f'{path} is too short to be a PRG file')
+    address = data[0] | (data[1] << 8)
+    memory.load(address, data[2:])
+    return address
+
+
+def load_ihex(memory: Memory, path: str) -> int | None:
+    """
+    Load an Intel HEX file. Returns the start address from a type 03 or 05 record, or None if there isn't one.
+
+    Data records are written with Memory.load, one call per record.
+    """
+    base = 0
+    start = None
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith(':'):
+                raise ValueError(f'{path}:{line_number}: expected a record starting with ":"')
+            try:
+                record = bytes.fromhex(line[1:])
+            except ValueError:
+                raise ValueError(f'{path}:{line_number}: invalid hex digits') from None
+            if len(record) < 5 or len(record) != record[0] + 5:
+                raise ValueError(f'{path}:{line_number}: record length does not match its byte count')
+            if sum(record) & 0xFF:
+                raise ValueError(f'{path}:{line_number}: checksum mismatch')
+            record_type, data = record[3], record[4:-1]
+            offset = (record[1] << 8) | record[2]
+            if record_type == 0x00:
+                memory.load(base + offset, data)
+            elif record_type == 0x01:
+                break
+            elif record_type == 0x02:
+                base = int.from_bytes(data, 'big') << 4
+            elif record_type == 0x04:
+                base = int.from_bytes(data, 'big') << 16
+            elif record_type == 0x03:
+                # CS:IP
+                start = (int.from_bytes(data[:2], 'big') << 4) + int.from_bytes(data[2:], 'big')
+            elif record_type == 0x05:
+                start = int.from_bytes(data, 'big')
+            else:
+                raise ValueError(f'{path}:{line_number}: unknown record type {record_type:#04x}')
+    return start
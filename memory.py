@@ -1,11 +1,18 @@
+import sys
 from abc import ABC, abstractmethod
-from data_types import Word, Byte, DType
+from multiprocessing import shared_memory, resource_tracker
+from data_types import Word, Byte, DType, BYTES
 
 
 class Memory(ABC):
+    # Reads whose value can change without the CPU writing to memory, e.g. device registers. Idle loop detection
+    # compares this before and after an iteration.
+    volatile_reads = 0
+
     def __init__(self, memory_size):
         self.memory_size = memory_size
-        self.memory = [Byte(0)] * memory_size
+        # Raw byte values, exposed without copying through view(), numpy() and the buffer protocol.
+        self.memory = bytearray(memory_size)
 
     @abstractmethod
     def read(self, address: int | DType):
@@ -14,8 +21,44 @@ class Memory(ABC):
     def __len__(self):
         return self.memory_size
 
+    def __buffer__(self, flags):
+        # Python 3.12+ lets memoryview(memory) and numpy.frombuffer(memory) see the backing store directly.
+        return memoryview(self.memory)
+
+    def _check_range(self, address: int, length: int):
+        if address < 0 or length < 0 or address + length > self.memory_size:
+            raise ValueError(f'Range {address:#06x}+{length} is outside memory of size {self.memory_size:#x}')
+
+    def view(self, address: int | DType = 0, length: int | None = None) -> memoryview:
+        """Writable view of length bytes from address, sharing storage with the memory."""
+        address = int(address)
+        if length is None:
+            length = self.memory_size - address
+        self._check_range(address, length)
+        return memoryview(self.memory)[address:address + length]
+
+    def numpy(self, address: int | DType = 0, length: int | None = None):
+        """Writable numpy uint8 array over length bytes from address, sharing storage with the memory."""
+        import numpy as np
+        return np.frombuffer(self.view(address, length), dtype=np.uint8)
+
+    def load(self, address: int | DType, data):
+        """Copy a bytes-like object into memory starting at address."""
+        address = int(address)
+        data = memoryview(data).cast('B')
+        self._check_range(address, len(data))
+        self.memory[address:address + len(data)] = data
+
+    def dump(self, address: int | DType, length: int) -> bytes:
+        address = int(address)
+        self._check_range(address, length)
+        return bytes(self.memory[address:address + length])
+
+    def is_device_page(self, address: int | DType) -> bool:
+        return False
+
     def __getitem__(self, address: int | DType):
-        return self.memory[address]
+        return BYTES[self.memory[address]]
 
     def __setitem__(self, key, value):
         raise NotImplementedError('Memory is read-only')
@@ -27,10 +70,10 @@ class RAM(Memory):
         self.memory[address] = value
 
     def read(self, address: Word):
-        return self.memory[address]
+        return BYTES[self.memory[address]]
 
     def __getitem__(self, address: Word | int):
-        return self.memory[address]
+        return BYTES[self.memory[address]]
 
     def __setitem__(self, address: Word, value: Byte):
         self.memory[address] = value
@@ -48,13 +91,188 @@ class RAM64K(RAM):
         super().__init__(0xFFFF + 1)
 
 
+# Bytes in front of the memory in a shared block, holding the write sequence counter.
+SHARED_HEADER_SIZE = 8
+
+
+class SharedRAM(RAM):
+    """
+    RAM kept in a multiprocessing.shared_memory block so other processes can watch it live.
+
+    Other processes attach with SharedRAMReader(ram.name). The block starts with a sequence counter that is odd while
+    a write is in progress and goes up by two per write, letting readers detect a multi-byte read that raced with
+    the emulator and retry it. Call close() when done and unlink() once no process needs the block any more.
+    """
+    def __init__(self, memory_size: int = 0xFFFF + 1, name: str | None = None):
+        self.memory_size = memory_size
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=SHARED_HEADER_SIZE + memory_size)
+        self.name = self._shm.name
+        self._sequence = self._shm.buf[:SHARED_HEADER_SIZE].cast('Q')
+        self.memory = self._shm.buf[SHARED_HEADER_SIZE:SHARED_HEADER_SIZE + memory_size]
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence[0]
+
+    def write(self, address: Word, value: Byte):
+        self[address] = value
+
+    def __setitem__(self, address: Word, value: Byte):
+        self._sequence[0] += 1
+        self.memory[address] = value
+        self._sequence[0] += 1
+
+    def load(self, address: int | DType, data):
+        self._sequence[0] += 1
+        try:
+            super().load(address, data)
+        finally:
+            self._sequence[0] += 1
+
+    def close(self):
+        # Views into the block have to go before it can be closed.
+        self._sequence.release()
+        self.memory.release()
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+class SharedRAMReader:
+    """Read-only access to a SharedRAM from another process."""
+    def __init__(self, name: str):
+        if sys.version_info >= (3, 13):
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Only the creating process should unlink the block. Attaching would register it with this process's
+            # resource tracker, which unlinks everything it knows about on exit.
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                self._shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        self._sequence = self._shm.buf[:SHARED_HEADER_SIZE].cast('Q')
+        self.memory = self._shm.buf[SHARED_HEADER_SIZE:]
+        self.memory_size = len(self.memory)
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence[0]
+
+    def read(self, address: int, length: int, retries: int = 1000) -> bytes:
+        """Copy length bytes from address, retrying while the emulator writes in between. Raises if it never settles."""
+        for _ in range(retries):
+            before = self._sequence[0]
+            if before & 1:
+                continue
+            data = bytes(self.memory[address:address + length])
+            if self._sequence[0] == before:
+                return data
+        raise RuntimeError(f'Could not get a consistent read of {length} bytes at {address:#06x}')
+
+    def close(self):
+        self._sequence.release()
+        self.memory.release()
+        self._shm.close()
+
+
 class ROM(Memory):
     """Read-only memory."""
     def __init__(self, memory_size: int, data):
         super().__init__(memory_size)
         self.data = data
+        self.memory[:len(data)] = bytes(data)
 
     def read(self, address: Word):
-        return self.data[address]
+        return BYTES[self.memory[address]]
+
+
+class Bus(Memory):
+    """
+    Address space made of a backing memory with devices mapped over parts of it.
+
+    Pages without devices go straight to the backing memory. An access that hits a device first syncs it to the
+    current clock cycle, so devices catch up lazily instead of being ticked every pulse.
+    """
+    def __init__(self, memory: Memory, clock):
+        # The backing memory holds the data, there is nothing to allocate here.
+        self.memory_size = len(memory)
+        self.backing = memory
+        self.clock = clock
+        self.devices = []
+        # Page -> {address: device} for pages with at least one device mapped in them.
+        self._pages = [None] * ((self.memory_size + 0xFF) >> 8)
 
+    def attach(self, device):
+        end = device.base + device.size
+        if device.base < 0 or end > self.memory_size:
+            raise ValueError(f'Device range {device.base:#06x}-{end - 1:#06x} is outside the address space')
+        for address in range(device.base, end):
+            page = self._pages[address >> 8]
+            if page is not None and address in page:
+                raise ValueError(f'Address {address:#06x} is already mapped to {page[address].__class__.__name__}')
+        for address in range(device.base, end):
+            if self._pages[address >> 8] is None:
+                self._pages[address >> 8] = {}
+            self._pages[address >> 8][address] = device
+        self.devices.append(device)
+        return device
+
+    def detach(self, device):
+        for address in range(device.base, device.base + device.size):
+            page = self._pages[address >> 8]
+            del page[address]
+            if not page:
+                self._pages[address >> 8] = None
+        self.devices.remove(device)
+
+    def is_device_page(self, address: int | DType) -> bool:
+        return self._pages[int(address) >> 8] is not None
+
+    # Bulk access goes straight to the backing memory, devices mapped over the range are not involved.
+    def __buffer__(self, flags):
+        return self.backing.__buffer__(flags)
+
+    def view(self, address: int | DType = 0, length: int | None = None) -> memoryview:
+        return self.backing.view(address, length)
+
+    def numpy(self, address: int | DType = 0, length: int | None = None):
+        return self.backing.numpy(address, length)
+
+    def load(self, address: int | DType, data):
+        self.backing.load(address, data)
+
+    def dump(self, address: int | DType, length: int) -> bytes:
+        return self.backing.dump(address, length)
+
+    def read(self, address: Word | int):
+        return self[address]
+
+    def write(self, address: Word | int, value: Byte):
+        self[address] = value
+
+    def __getitem__(self, address: Word | int):
+        address = int(address)
+        page = self._pages[address >> 8]
+        if page is not None:
+            device = page.get(address)
+            if device is not None:
+                device.sync(self.clock.cycles)
+                offset = address - device.base
+                if offset not in device.stable_registers:
+                    self.volatile_reads += 1
+                return Byte(device.read(offset))
+        return self.backing[address]
 
+    def __setitem__(self, address: Word | int, value: Byte):
+        address = int(address)
+        page = self._pages[address >> 8]
+        if page is not None:
+            device = page.get(address)
+            if device is not None:
+                device.sync(self.clock.cycles)
+                device.write(address - device.base, value.value)
+                return
+        self.backing[address] = value
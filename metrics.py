@@ -0,0 +1,70 @@
+import os
+import threading
+
+# stats() keys that only ever go up, exported as Prometheus counters. Everything else is a gauge.
+COUNTERS = frozenset({
+    'instructions_retired', 'cycles', 'run_cycles', 'run_seconds', 'blocked_seconds', 'memory_reads',
+    'memory_writes', 'interrupts_serviced', 'idle_cycles_skipped', 'decode_cache_hits', 'decode_cache_misses',
+    'decode_cache_invalidations', 'events_fired', 'rx_bytes', 'tx_bytes', 'rx_syscalls', 'tx_syscalls',
+})
+
+
+def prometheus_text(sources: dict, prefix: str = 'emulator') -> str:
+    """
+    Render the stats() of every source in Prometheus text format.
+
+    sources maps an instance label to anything with a stats() method, e.g. {'cpu0': cpu, 'clock0': clock}.
+    Non-numeric values are skipped.
+    """
+    samples = {}
+    for instance, source in sources.items():
+        for key, value in source.stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f'{prefix}_{key}_total' if key in COUNTERS else f'{prefix}_{key}'
+            samples.setdefault((name, key in COUNTERS), []).append((instance, value))
+
+    lines = []
+    for (name, counter), values in sorted(samples.items()):
+        lines.append(f'# TYPE {name} {"counter" if counter else "gauge"}')
+        for instance, value in values:
+            lines.append(f'{name}{{instance="{instance}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusExporter:
+    """
+    Periodically write the stats of a set of emulators to a Prometheus text file, e.g. for node_exporter's textfile
+    collector.
+
+    Runs on its own thread and only calls stats(), so the emulators pay nothing for being exported. Files are
+    replaced atomically, a scraper never sees a half written one.
+    """
+    def __init__(self, path: str, sources: dict, interval: float = 15.0, prefix: str = 'emulator'):
+        self.path = path
+        self.sources = sources
+        self.interval = interval
+        self.prefix = prefix
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def write(self):
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as f:
+            f.write(prometheus_text(self.sources, self.prefix))
+        os.replace(temporary, self.path)
+
+    def start(self):
+        self._thread.start()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.write()
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        """Stop the thread after writing one last time."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write()
@@ -0,0 +1,179 @@
+import threading
+from clock import UnthrottledClock
+from cpu import CPU6502
+from data_types import Word, Byte, DType
+from exceptions import InterruptError
+from memory import Memory
+
+
+class CoreMemory(Memory):
+    """
+    A core's view of the address space: its own private memory, with the system's shared pages mapped over it.
+
+    Accessing a shared page first brings every other core up to this core's cycle, so shared memory sees accesses in
+    cycle order no matter how far the cores were allowed to run apart.
+    """
+    def __init__(self, system, core, private: Memory):
+        self.memory_size = len(private)
+        self.system = system
+        self.core = core
+        self.private = private
+        self.shared = system.shared
+        self._shared_pages = system.shared_pages
+
+    def is_device_page(self, address: int | DType) -> bool:
+        # Other cores can rewrite shared code at any time, keep it out of decode caches.
+        return int(address) >> 8 in self._shared_pages or self.private.is_device_page(address)
+
+    def __buffer__(self, flags):
+        return self.private.__buffer__(flags)
+
+    def view(self, address: int | DType = 0, length: int | None = None) -> memoryview:
+        return self.private.view(address, length)
+
+    def load(self, address: int | DType, data):
+        self.private.load(address, data)
+
+    def dump(self, address: int | DType, length: int) -> bytes:
+        return self.private.dump(address, length)
+
+    def read(self, address: Word | int):
+        return self[address]
+
+    def write(self, address: Word | int, value: Byte):
+        self[address] = value
+
+    def __getitem__(self, address: Word | int):
+        if int(address) >> 8 in self._shared_pages:
+            self.system._sync(self.core)
+            # Other cores can change it, a loop polling it is not idle.
+            self.volatile_reads += 1
+            return self.shared[address]
+        return self.private[address]
+
+    def __setitem__(self, address: Word | int, value: Byte):
+        if int(address) >> 8 in self._shared_pages:
+            self.system._sync(self.core)
+            self.shared[address] = value
+        else:
+            self.private[address] = value
+
+
+class Core:
+    def __init__(self, index: int):
+        self.index = index
+        self.cpu = None
+        self.clock = None
+        self.halted = False
+        self.done = False
+        self.error = None
+
+    @property
+    def live(self) -> bool:
+        return not self.halted and not self.done
+
+    def position(self) -> tuple:
+        # Cores on the same cycle go in the order they were added.
+        return self.clock.cycles, self.index
+
+
+class MultiCoreSystem:
+    """
+    Several CPU6502 cores sharing part of their address space.
+
+    Each core runs on its own UnthrottledClock over a CoreMemory, on a thread of its own, but only one core runs at a
+    time. A core runs until the next multiple of quantum cycles and then hands over to whichever core is furthest
+    behind. quantum=1 is lockstep, larger quanta switch cores less often. A core that reaches a shared page while
+    another is behind also hands over and waits, so shared memory sees every access in cycle order whatever the
+    quantum, and the quantum only bounds how far apart the cores drift between shared accesses.
+
+    shared is the memory behind the shared pages, typically a Bus on self.clock. self.clock follows the cycle of the
+    latest shared access and its events run once every core has reached their cycle, so devices and events on it
+    see the same timeline as the cores.
+    """
+    def __init__(self, shared: Memory, shared_pages, quantum: int = 1000):
+        if quantum < 1:
+            raise ValueError(f'Quantum must be at least 1 cycle, got {quantum}')
+        self.shared = shared
+        self.shared_pages = frozenset(shared_pages)
+        self.quantum = quantum
+        self.clock = getattr(shared, 'clock', None) or UnthrottledClock()
+        self.cores = []
+        self._condition = threading.Condition()
+        self._turn = None
+        self.handoffs = 0
+
+    def add_core(self, private: Memory, **options) -> CPU6502:
+        """Add a core with its own private memory. options are passed on to CPU6502."""
+        core = Core(len(self.cores))
+        core.cpu = CPU6502(CoreMemory(self, core, private), UnthrottledClock(), **options)
+        core.clock = core.cpu.clock
+        self.cores.append(core)
+        return core.cpu
+
+    def _run_events(self, cycle: int):
+        if cycle > self.clock.cycles:
+            self.clock.cycles = cycle
+        if self.clock.events.next_cycle <= cycle:
+            self.clock.events.run_due(cycle)
+
+    def _handoff(self, core: Core):
+        """Give the turn to the core furthest behind and wait until it comes back to core."""
+        with self._condition:
+            live = [other for other in self.cores if other.live]
+            if live:
+                turn = min(live, key=Core.position)
+                self._run_events(turn.clock.cycles)
+                if turn is not core:
+                    self.handoffs += 1
+            else:
+                turn = None
+            self._turn = turn
+            self._condition.notify_all()
+            if core.live:
+                self._condition.wait_for(lambda: self._turn is core)
+
+    def _sync(self, core: Core):
+        position = core.position()
+        while any(other.live and other.position() < position for other in self.cores if other is not core):
+            self._handoff(core)
+        # Every other core is at or past this cycle now, anything due on the shared clock has happened.
+        self._run_events(position[0])
+
+    def _core_main(self, core: Core, until: int):
+        with self._condition:
+            self._condition.wait_for(lambda: self._turn is core)
+        try:
+            while core.clock.cycles < until:
+                target = (core.clock.cycles // self.quantum + 1) * self.quantum
+                target = min(target, until, max(self.clock.events.next_cycle, core.clock.cycles + 1))
+                core.cpu.run_until(target)
+                self._handoff(core)
+            core.done = True
+        except InterruptError:
+            # BRK halts the core, the others carry on.
+            core.halted = True
+        except BaseException as error:
+            core.halted = True
+            core.error = error
+        finally:
+            self._handoff(core)
+
+    def run(self, until: int):
+        """Run until every core has reached cycle until or halted."""
+        cores = [core for core in self.cores if not core.halted]
+        for core in cores:
+            core.done = False
+        threads = [threading.Thread(target=self._core_main, args=(core, until)) for core in cores]
+        for thread in threads:
+            thread.start()
+        with self._condition:
+            live = [core for core in cores if core.live]
+            self._turn = min(live, key=Core.position) if live else None
+            self._condition.notify_all()
+        for thread in threads:
+            thread.join()
+        for core in cores:
+            if core.error is not None:
+                error, core.error = core.error, None
+                raise error
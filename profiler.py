@@ -0,0 +1,150 @@
+from collections import defaultdict
+from time import perf_counter_ns
+from cpu import CPU6502
+
+DISPATCH = '(dispatch)'
+INTERRUPT = '(interrupt)'
+
+
+def _timer_overhead(samples: int = 1000) -> int:
+    """Smallest back to back perf_counter_ns() difference, taken off every sample."""
+    best = None
+    for _ in range(samples):
+        start = perf_counter_ns()
+        elapsed = perf_counter_ns() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+class HostProfiler:
+    """
+    Host time spent on each guest opcode.
+
+    Opt-in like guest coverage: start() wraps every handler in the CPU's dispatch table and its plain execute, stop()
+    puts them back. Each handler call is timed with perf_counter_ns() into per opcode totals, which are only summed up
+    into tables when asked for, so profiling costs two timer reads per instruction and nothing once stopped.
+
+    Time is split three ways: the handlers themselves, interrupt entry, and dispatch, which is everything else
+    execute() does, fetching and decoding the opcode, running due events and fused pair checks.
+
+    set_accuracy() rebuilds the dispatch table, call it before start() rather than while profiling.
+    """
+    def __init__(self, cpu: CPU6502):
+        self.cpu = cpu
+        self.counts = [0] * 0x100
+        self.handler_ns = [0] * 0x100
+        self.execute_ns = 0
+        self.interrupt_ns = 0
+        self.interrupts = 0
+        self.overhead_ns = _timer_overhead()
+        self._saved = None
+
+    def start(self):
+        cpu = self.cpu
+        self._saved = (cpu.OPCODES, cpu._plain_execute)
+        opcodes, execute = self._saved
+        counts, handler_ns, overhead = self.counts, self.handler_ns, self.overhead_ns
+
+        def profiled_handler(opcode: int, func):
+            def profiled(addressing_mode: int):
+                start = perf_counter_ns()
+                func(addressing_mode)
+                handler_ns[opcode] += perf_counter_ns() - start - overhead
+                counts[opcode] += 1
+            profiled.__name__ = func.__name__
+            return profiled
+
+        def profiled_execute():
+            serviced = cpu.interrupts_serviced
+            start = perf_counter_ns()
+            execute()
+            elapsed = perf_counter_ns() - start - overhead
+            if cpu.interrupts_serviced != serviced:
+                self.interrupt_ns += elapsed
+                self.interrupts += 1
+            else:
+                self.execute_ns += elapsed
+
+        cpu.OPCODES = {opcode: (profiled_handler(opcode, func), mode, cycles)
+                       for opcode, (func, mode, cycles) in opcodes.items()}
+        cpu._plain_execute = profiled_execute
+        # Cached entries hold the unwrapped handlers.
+        cpu.invalidate_decode_cache()
+        cpu._update_instrumentation()
+
+    def stop(self):
+        if self._saved is not None:
+            cpu = self.cpu
+            cpu.OPCODES, cpu._plain_execute = self._saved
+            cpu.invalidate_decode_cache()
+            cpu._update_instrumentation()
+            self._saved = None
+
+    def reset(self):
+        self.counts[:] = [0] * 0x100
+        self.handler_ns[:] = [0] * 0x100
+        self.execute_ns = self.interrupt_ns = self.interrupts = 0
+
+    @property
+    def dispatch_ns(self) -> int:
+        return max(self.execute_ns - sum(self.handler_ns), 0)
+
+    def opcodes(self) -> list:
+        """(opcode, name, mode, count, total ns, ns per instruction) for every opcode that ran, most time first."""
+        rows = []
+        for opcode, count in enumerate(self.counts):
+            if count:
+                name, mode, _ = self.cpu.instructions[opcode]
+                rows.append((opcode, name, mode, count, self.handler_ns[opcode], self.handler_ns[opcode] / count))
+        rows.sort(key=lambda row: -row[4])
+        return rows
+
+    def modes(self) -> list:
+        """(mode, count, total ns, ns per instruction) per addressing mode, most time first."""
+        totals = defaultdict(lambda: [0, 0])
+        for _, _, mode, count, total, _ in self.opcodes():
+            totals[mode][0] += count
+            totals[mode][1] += total
+        rows = [(mode, count, total, total / count) for mode, (count, total) in totals.items()]
+        rows.sort(key=lambda row: -row[2])
+        return rows
+
+    def report(self) -> str:
+        """Text tables of opcodes() and modes(), with dispatch and interrupt time below."""
+        instructions = sum(self.counts)
+        total = self.execute_ns + self.interrupt_ns
+        lines = [f'{"opcode":<7}{"name":<5}{"mode":<13}{"count":>10} {"ms":>9} {"ns/instr":>9} {"share":>6}']
+        for opcode, name, mode, count, handler_ns, per_instruction in self.opcodes():
+            lines.append(f'${opcode:02X}    {name.upper():<5}{mode:<13}{count:>10} {handler_ns / 1e6:>9.2f} '
+                         f'{per_instruction:>9.0f} {handler_ns / total if total else 0:>6.1%}')
+        lines.append('')
+        lines.append(f'{"mode":<25}{"count":>10} {"ms":>9} {"ns/instr":>9} {"share":>6}')
+        for mode, count, mode_ns, per_instruction in self.modes():
+            lines.append(f'{mode:<25}{count:>10} {mode_ns / 1e6:>9.2f} {per_instruction:>9.0f} '
+                         f'{mode_ns / total if total else 0:>6.1%}')
+        lines.append('')
+        for label, spent, count in ((DISPATCH, self.dispatch_ns, instructions),
+                                    (INTERRUPT, self.interrupt_ns, self.interrupts)):
+            lines.append(f'{label:<25}{count:>10} {spent / 1e6:>9.2f} {spent / count if count else 0:>9.0f} '
+                         f'{spent / total if total else 0:>6.1%}')
+        lines.append(f'{instructions} instructions, {total / instructions if instructions else 0:.0f} ns each')
+        return '\n'.join(lines) + '\n'
+
+    def folded(self) -> str:
+        """
+        Folded stacks in nanoseconds, one 'execute;mode;name ns' line each, for flamegraph.pl or speedscope.
+
+        Grouping by mode first shows which addressing modes cost the most, each split up by instruction.
+        """
+        lines = []
+        for opcode, name, mode, _, handler_ns, _ in sorted(self.opcodes(), key=lambda row: (row[2], row[1])):
+            lines.append(f'execute;{mode};{name} {handler_ns}')
+        lines.append(f'execute;{DISPATCH} {self.dispatch_ns}')
+        if self.interrupts:
+            lines.append(f'execute;{INTERRUPT} {self.interrupt_ns}')
+        return '\n'.join(lines) + '\n'
+
+    def save_folded(self, path: str):
+        with open(path, 'w') as f:
+            f.write(self.folded())
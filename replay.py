@@ -0,0 +1,272 @@
+import json
+import zlib
+from clock import UnthrottledClock
+from cpu import CPU6502
+from data_types import BYTES, Word, Byte, DType
+from memory import Memory, RAM
+
+# Log entry kinds
+READ = 0
+IRQ_ASSERT = 1
+IRQ_RELEASE = 2
+NMI = 3
+SKIP = 4
+
+MAGIC = b'6502INPUTS2\n'
+
+
+def _write_varint(log: bytearray, value: int):
+    while value > 0x7F:
+        log.append(value & 0x7F | 0x80)
+        value >>= 7
+    log.append(value)
+
+
+def _read_varint(data, position: int) -> tuple:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def decode_log(data) -> list:
+    """Decode a log into (cycle, kind, address/source/skipped cycles, value) tuples."""
+    entries = []
+    position = 0
+    cycle = 0
+    while position < len(data):
+        kind = data[position]
+        delta, position = _read_varint(data, position + 1)
+        cycle += delta
+        if kind == READ:
+            address = data[position] | data[position + 1] << 8
+            entries.append((cycle, kind, address, data[position + 2]))
+            position += 3
+        elif kind == NMI:
+            entries.append((cycle, kind, None, None))
+        else:
+            argument, position = _read_varint(data, position)
+            entries.append((cycle, kind, argument, None))
+    return entries
+
+
+class InputRecorder:
+    """
+    Log every input the machine takes from outside: device register reads, IRQ and NMI signals and idle loop skips,
+    each stamped with its clock cycle.
+
+    Device reads also cover host bytes, e.g. what an ACIA received from its file descriptor. The log is delta encoded
+    varints, a few bytes per input. Together with the state the CPU had at start() it is enough for Replayer to
+    reproduce the run with no devices attached.
+
+    Devices capture the CPU's interrupt methods when they are constructed, so create the recorder before them, e.g.
+    InputRecorder(cpu) and then VIA6522(clock, base, irq=cpu.set_irq). set_irq and nmi therefore stay wrapped for
+    the recorder's lifetime and only log while recording. Device reads and idle loop checks are wrapped by start()
+    and stop() puts the plain methods back.
+    """
+    def __init__(self, cpu: CPU6502):
+        self.cpu = cpu
+        self.clock = cpu.clock
+        self.log = bytearray()
+        self.initial_state = None
+        self.accuracy = None
+        self.end_cycle = None
+        self.devices = []
+        self._last_cycle = 0
+        self._sources = {}
+        self._plain_set_irq = cpu.set_irq
+        self._plain_nmi = cpu.nmi
+        self._plain_check_idle_loop = cpu._check_idle_loop
+        self._device_reads = {}
+        self._recording = False
+        cpu.set_irq = self._set_irq
+        cpu.nmi = self._nmi
+
+    def _source_id(self, source) -> int:
+        return self._sources.setdefault(id(source), (len(self._sources), source))[0]
+
+    def start(self):
+        state = self.cpu.save_state()
+        state['irq_sources'] = frozenset(self._source_id(source) for source in state['irq_sources'])
+        self.initial_state = state
+        # Bus accuracy makes dummy reads, of device registers too, so the replay has to run at the same level.
+        self.accuracy = self.cpu.accuracy
+        self._last_cycle = state['cycles']
+        self.log.clear()
+        self.end_cycle = None
+
+        memory = self.cpu.memory
+        self.devices = [(device.base, device.size, frozenset(device.stable_registers))
+                        for device in getattr(memory, 'devices', [])]
+        for device in getattr(memory, 'devices', []):
+            self._device_reads[device] = device.read
+            device.read = self._recording_read(device, device.read)
+        self.cpu._check_idle_loop = self._check_idle_loop
+        self._recording = True
+
+    def stop(self):
+        self.end_cycle = self.clock.cycles
+        for device, read in self._device_reads.items():
+            device.read = read
+        self._device_reads.clear()
+        self.cpu._check_idle_loop = self._plain_check_idle_loop
+        self._recording = False
+
+    def _entry(self, kind: int, cycle: int):
+        log = self.log
+        log.append(kind)
+        _write_varint(log, cycle - self._last_cycle)
+        self._last_cycle = cycle
+
+    def _recording_read(self, device, read):
+        def recording_read(offset: int) -> int:
+            value = read(offset)
+            address = device.base + offset
+            self._entry(READ, self.clock.cycles)
+            self.log += bytes((address & 0xFF, address >> 8, value))
+            return value
+        return recording_read
+
+    def _set_irq(self, source, asserted: bool = True):
+        if self._recording:
+            self._entry(IRQ_ASSERT if asserted else IRQ_RELEASE, self.clock.cycles)
+            _write_varint(self.log, self._source_id(source))
+        self._plain_set_irq(source, asserted)
+
+    def _nmi(self):
+        if self._recording:
+            self._entry(NMI, self.clock.cycles)
+        self._plain_nmi()
+
+    def _check_idle_loop(self, target: int):
+        cycle = self.clock.cycles
+        self._plain_check_idle_loop(target)
+        if self.clock.cycles != cycle:
+            self._entry(SKIP, cycle)
+            _write_varint(self.log, self.clock.cycles - cycle)
+
+    def save(self, path: str):
+        """
+        Write MAGIC, a one line JSON header with the initial state, variant, accuracy, end cycle and devices, then the
+        log. The variant is saved by name, so the replay can only rebuild the ones in VARIANTS.
+        """
+        state = self.initial_state
+        header = {
+            'initial_state': dict(state, irq_sources=sorted(state['irq_sources']),
+                                  memory=zlib.compress(state['memory']).hex()),
+            'variant': self.cpu.variant.name,
+            'accuracy': self.accuracy,
+            'end_cycle': self.end_cycle,
+            'devices': [[base, size, sorted(stable_registers)] for base, size, stable_registers in self.devices],
+        }
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(json.dumps(header).encode() + b'\n')
+            f.write(zlib.compress(self.log))
+
+
+class ReplayBus(Memory):
+    """Memory that serves reads of device registers from a recorded log and drops writes to them."""
+    def __init__(self, memory: Memory, clock, devices: list, entries: list):
+        self.memory_size = len(memory)
+        self.backing = memory
+        self.clock = clock
+        self._pages = set()
+        self._stable = set()
+        self._device_addresses = set()
+        for base, size, stable_registers in devices:
+            for offset in range(size):
+                self._device_addresses.add(base + offset)
+                self._pages.add((base + offset) >> 8)
+                if offset in stable_registers:
+                    self._stable.add(base + offset)
+        self._reads = iter([entry for entry in entries if entry[1] == READ])
+
+    def is_device_page(self, address: int | DType) -> bool:
+        return int(address) >> 8 in self._pages
+
+    def __buffer__(self, flags):
+        return self.backing.__buffer__(flags)
+
+    def view(self, address: int | DType = 0, length: int | None = None) -> memoryview:
+        return self.backing.view(address, length)
+
+    def load(self, address: int | DType, data):
+        self.backing.load(address, data)
+
+    def dump(self, address: int | DType, length: int) -> bytes:
+        return self.backing.dump(address, length)
+
+    def read(self, address: Word | int):
+        return self[address]
+
+    def write(self, address: Word | int, value: Byte):
+        self[address] = value
+
+    def __getitem__(self, address: Word | int):
+        address = int(address)
+        if address not in self._device_addresses:
+            return self.backing[address]
+        cycle = self.clock.cycles
+        entry = next(self._reads, None)
+        if entry is None or entry[0] != cycle or entry[2] != address:
+            raise RuntimeError(f'Replay diverged reading {address:#06x} on cycle {cycle}, log has {entry}')
+        if address not in self._stable:
+            self.volatile_reads += 1
+        return BYTES[entry[3]]
+
+    def __setitem__(self, address: Word | int, value: Byte):
+        address = int(address)
+        if address not in self._device_addresses:
+            self.backing[address] = value
+
+
+class Replayer:
+    """
+    Rerun a recorded session on an unthrottled clock with no devices attached, on the variant and at the accuracy it
+    was recorded with.
+
+    Device reads are answered from the log and interrupts and idle skips are scheduled as clock events on the cycles
+    they were recorded on, so the CPU goes through exactly the states it went through while recording.
+    """
+    def __init__(self, path: str, decode_cache: bool = False):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not an input log')
+            header = json.loads(f.readline())
+            log = zlib.decompress(f.read())
+        state = header['initial_state']
+        state['memory'] = zlib.decompress(bytes.fromhex(state['memory']))
+        self.end_cycle = header['end_cycle']
+        self.entries = decode_log(log)
+        devices = [(base, size, frozenset(stable_registers)) for base, size, stable_registers in header['devices']]
+
+        self.clock = UnthrottledClock()
+        self.memory = ReplayBus(RAM(len(state['memory'])), self.clock, devices, self.entries)
+        self.cpu = CPU6502(self.memory, self.clock, decode_cache=decode_cache, accuracy=header['accuracy'],
+                           variant=header['variant'])
+        self.cpu.restore_state(state)
+
+        events = self.clock.events
+        for cycle, kind, argument, _ in self.entries:
+            if kind == IRQ_ASSERT:
+                events.schedule(cycle, self.cpu.set_irq, argument, True)
+            elif kind == IRQ_RELEASE:
+                events.schedule(cycle, self.cpu.set_irq, argument, False)
+            elif kind == NMI:
+                events.schedule(cycle, self.cpu.nmi)
+            elif kind == SKIP:
+                events.schedule(cycle, self._skip, argument)
+
+    def _skip(self, cycles: int):
+        self.clock.advance(cycles)
+        # Whatever came due during the skip ran before the next instruction in the recorded run too.
+        self.clock.events.run_due(self.clock.cycles)
+
+    def run(self, cycle: int | None = None):
+        """Replay up to cycle, by default the cycle recording stopped on."""
+        self.cpu.run_until(self.end_cycle if cycle is None else cycle)
@@ -0,0 +1,149 @@
+import zlib
+from collections import OrderedDict
+from cpu import CPU6502
+from exceptions import WatchpointHit
+
+
+class ReverseDebugger:
+    """
+    Step and run a CPU backwards by replaying forward from periodic checkpoints.
+
+    A checkpoint (CPU6502.save_state with memory compressed) is taken every interval cycles from a clock event, so
+    the cost while running forwards is one snapshot per interval. step_back() and run_back_until() restore the newest
+    checkpoint before the point they are looking for and re-execute up to it. Checkpoints are kept in least recently
+    used order and the oldest are evicted once their compressed size goes over budget bytes.
+
+    Replaying assumes the run is deterministic. Device state and scheduled events are not rewound, so a machine with
+    devices attached needs its inputs recorded and replayed to go back reliably.
+    """
+    def __init__(self, cpu: CPU6502, interval: int = 100_000, budget: int = 64 * 1024 * 1024):
+        self.cpu = cpu
+        self.clock = cpu.clock
+        self.interval = interval
+        self.budget = budget
+        self.checkpoints = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+        self._event = None
+        self._due = None
+
+    def start(self):
+        """Take a checkpoint now and every interval cycles after."""
+        self.checkpoint()
+        self._due = self.clock.cycles + self.interval
+        self._event = self.clock.events.schedule(self._due, self._checkpoint_due)
+
+    def stop(self):
+        if self._event is not None:
+            self.clock.events.cancel(self._event)
+            self._event = None
+
+    def _checkpoint_due(self):
+        self.checkpoint()
+        self._due += self.interval
+        self._event = self.clock.events.schedule(self._due, self._checkpoint_due)
+
+    def checkpoint(self):
+        cycle = self.clock.cycles
+        if cycle in self.checkpoints:
+            # Replaying over an existing checkpoint, it is still valid.
+            self.checkpoints.move_to_end(cycle)
+            return
+        state = self.cpu.save_state()
+        state['memory'] = zlib.compress(state['memory'], 1)
+        self.checkpoints[cycle] = state
+        self.size += len(state['memory'])
+        while self.size > self.budget and len(self.checkpoints) > 1:
+            _, evicted = self.checkpoints.popitem(last=False)
+            self.size -= len(evicted['memory'])
+            self.evictions += 1
+
+    def _restore(self, cycle: int):
+        self.checkpoints.move_to_end(cycle)
+        state = dict(self.checkpoints[cycle])
+        state['memory'] = zlib.decompress(state['memory'])
+        self.cpu.restore_state(state)
+
+    def _checkpoints_before(self, cycle: int) -> list:
+        """Checkpoint cycles before cycle, newest first."""
+        return sorted((c for c in self.checkpoints if c < cycle), reverse=True)
+
+    def _replay(self, start: int, end: int, pc: int | None = None, watch: tuple | None = None) -> list:
+        """
+        Restore the checkpoint at start and execute until the clock reaches end.
+
+        Returns every instruction boundary passed on the way, or only those where the CPU was about to execute pc or
+        had just written into the watch range.
+        """
+        cpu = self.cpu
+        self._restore(start)
+        # User breakpoints and watchpoints must not stop the replay.
+        breakpoints, watchpoints = cpu._breakpoints, cpu._watchpoints
+        cpu._breakpoints, cpu._watchpoints = set(), []
+        if watch is not None:
+            cpu._watchpoints.append((watch[0], watch[1], False, True))
+        cpu._update_instrumentation()
+        execute = cpu.execute
+        boundaries = []
+        # Every boundary has to be seen, skipped idle loop iterations would hide them and could carry on past end.
+        run_limit, cpu._run_limit = cpu._run_limit, end
+        idle_skip, cpu._idle_skip = cpu._idle_skip, False
+        try:
+            while self.clock.cycles < end:
+                if pc is None and watch is None or cpu.pc.value == pc:
+                    boundaries.append(self.clock.cycles)
+                try:
+                    execute()
+                except WatchpointHit:
+                    boundaries.append(self.clock.cycles)
+        finally:
+            cpu._run_limit, cpu._idle_skip = run_limit, idle_skip
+            cpu._breakpoints, cpu._watchpoints = breakpoints, watchpoints
+            cpu._update_instrumentation()
+        return boundaries
+
+    def _run_to(self, start: int, cycle: int):
+        cpu = self.cpu
+        self._restore(start)
+        execute = cpu._plain_execute
+        # Idle loops may still be skipped on the way, but only up to cycle, which is an instruction boundary.
+        run_limit, cpu._run_limit = cpu._run_limit, cycle
+        try:
+            while self.clock.cycles < cycle:
+                execute()
+        finally:
+            cpu._run_limit = run_limit
+
+    def step_back(self) -> int:
+        """Go back to the start of the previous instruction. Returns the cycle it started on."""
+        now = self.clock.cycles
+        for start in self._checkpoints_before(now):
+            boundaries = [cycle for cycle in self._replay(start, now) if cycle < now]
+            if boundaries:
+                self._run_to(start, boundaries[-1])
+                return boundaries[-1]
+        raise ValueError(f'No checkpoint before cycle {now}')
+
+    def run_back_until(self, pc: int | None = None, watch: int | tuple | None = None) -> int | None:
+        """
+        Go back to the last time the CPU was about to execute pc, or had just written into watch.
+
+        watch is an address or an inclusive (start, end) range. Returns the cycle stopped on, or None with the machine
+        left where it was if no checkpoint still held reaches far enough back.
+        """
+        if (pc is None) == (watch is None):
+            raise ValueError('Give exactly one of pc and watch')
+        if isinstance(watch, int):
+            watch = (watch, watch)
+        now = self.clock.cycles
+        end = now
+        for start in self._checkpoints_before(now):
+            hits = [cycle for cycle in self._replay(start, end, pc, watch) if cycle < now]
+            if hits:
+                self._run_to(start, hits[-1])
+                return hits[-1]
+            end = start
+        starts = self._checkpoints_before(now)
+        if starts:
+            self._run_to(starts[0], now)
+        return None
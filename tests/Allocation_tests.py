@@ -0,0 +1,143 @@
+import unittest
+from cpu import CMOS_65C02, INSTRUCTIONS_6502
+from data_types import Byte, Word
+from allocations import AllocationCounter, measure_all, measure_instruction, over_budget, report
+
+# Most DType objects one execute() of each instruction may create, opcode fetch included, worst of with and without
+# page crossing. These are what the handlers allocate today, lower them as handlers stop allocating, never raise them
+# without a reason.
+BUDGETS = {
+    ('brk', 'implied'): 1,
+    ('lda', 'immediate'): 5,
+    ('lda', 'zero_page'): 5,
+    ('lda', 'zero_page_x'): 6,
+    ('lda', 'absolute'): 7,
+    ('lda', 'absolute_x'): 9,
+    ('lda', 'absolute_y'): 9,
+    ('lda', 'indirect_x'): 8,
+    ('lda', 'indirect_y'): 10,
+    ('ldx', 'immediate'): 5,
+    ('ldx', 'zero_page'): 5,
+    ('ldx', 'zero_page_y'): 6,
+    ('ldx', 'absolute'): 7,
+    ('ldx', 'absolute_y'): 9,
+    ('ldy', 'immediate'): 5,
+    ('ldy', 'zero_page'): 5,
+    ('ldy', 'zero_page_x'): 6,
+    ('ldy', 'absolute'): 7,
+    ('ldy', 'absolute_x'): 9,
+    ('lsr', 'accumulator'): 7,
+    ('lsr', 'zero_page'): 8,
+    ('lsr', 'zero_page_x'): 9,
+    ('lsr', 'absolute'): 10,
+    ('lsr', 'absolute_x'): 12,
+    ('nop', 'implied'): 1,
+    ('ora', 'immediate'): 6,
+    ('ora', 'zero_page'): 6,
+    ('ora', 'zero_page_x'): 7,
+    ('ora', 'absolute'): 8,
+    ('ora', 'absolute_x'): 10,
+    ('ora', 'absolute_y'): 10,
+    ('ora', 'indirect_x'): 9,
+    ('ora', 'indirect_y'): 11,
+    ('pha', 'implied'): 4,
+    ('pla', 'implied'): 9,
+    ('php', 'implied'): 4,
+    ('plp', 'implied'): 22,
+    ('jmp', 'absolute'): 4,
+    ('jmp', 'indirect'): 6,
+    ('bpl', 'relative'): 4,
+    ('bmi', 'relative'): 4,
+    ('bvc', 'relative'): 4,
+    ('bvs', 'relative'): 4,
+    ('bcc', 'relative'): 4,
+    ('bcs', 'relative'): 4,
+    ('bne', 'relative'): 4,
+    ('beq', 'relative'): 4,
+    ('rti', 'implied'): 29,
+    ('sei', 'implied'): 2,
+    ('cli', 'implied'): 2,
+    ('sta', 'zero_page'): 2,
+    ('sta', 'zero_page_x'): 3,
+    ('sta', 'absolute'): 4,
+    ('sta', 'absolute_x'): 6,
+    ('sta', 'absolute_y'): 6,
+    ('sta', 'indirect_x'): 5,
+    ('sta', 'indirect_y'): 7,
+}
+
+# The 65C02's, BUDGETS with its own handlers and modes on top. Its JMP ($xxxx) and BRK keep the NMOS keys but not
+# their code.
+BUDGETS_65C02 = {
+    **BUDGETS,
+    ('brk', 'implied'): 2,
+    ('bra', 'relative'): 4,
+    ('phx', 'implied'): 4,
+    ('phy', 'implied'): 4,
+    ('plx', 'implied'): 9,
+    ('ply', 'implied'): 9,
+    ('lda', 'zero_page_indirect'): 7,
+    ('ora', 'zero_page_indirect'): 8,
+    ('sta', 'zero_page_indirect'): 4,
+    ('jmp', 'indirect'): 7,
+    ('jmp', 'absolute_indirect_x'): 8,
+}
+
+# Bytes tracemalloc may see in use at once during one instruction. Generous, object sizes vary between versions.
+PEAK_BYTES_BUDGET = 4096
+
+
+class AllocationBudgetTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = measure_all(repeat=50)
+        cls.results_65c02 = measure_all(repeat=50, variant=CMOS_65C02)
+
+    def test_every_handler_within_budget(self):
+        self.assertEqual(over_budget(self.results, BUDGETS), [], '\n' + report(self.results))
+        self.assertEqual(over_budget(self.results_65c02, BUDGETS_65C02), [], '\n' + report(self.results_65c02))
+
+    def test_every_instruction_has_a_budget(self):
+        self.assertEqual({(name, mode) for name, mode, _ in INSTRUCTIONS_6502.values()}, set(BUDGETS))
+        self.assertEqual({(name, mode) for name, mode, _ in CMOS_65C02.instructions.values()}, set(BUDGETS_65C02))
+
+    def test_peak_memory(self):
+        for results in (self.results, self.results_65c02):
+            for key, result in results.items():
+                self.assertLessEqual(result['peak_bytes'], PEAK_BYTES_BUDGET, key)
+
+    def test_nothing_outlives_an_instruction(self):
+        for results in (self.results, self.results_65c02):
+            for key, result in results.items():
+                # Less than one object per instruction, a handler keeping anything would show up as at least one.
+                self.assertLess(result['retained_objects'], 1, key)
+                # What's left is the interpreter's free lists settling, a constant spread over the repeats.
+                self.assertLess(result['retained_bytes'], 64, key)
+
+
+class AllocationCounterTestCase(unittest.TestCase):
+    def test_counts_by_type(self):
+        with AllocationCounter() as counter:
+            Word(0x0200) + 1
+            Byte(1) == 1
+        self.assertEqual(counter.created, {'Word': 2, 'Byte': 1, 'Bit': 1})
+        self.assertEqual(counter.total, 4)
+        # Unpatched again on the way out.
+        Byte(2)
+        self.assertEqual(counter.total, 4)
+
+    def test_over_budget(self):
+        lda = next(opcode for opcode, (name, mode, _) in INSTRUCTIONS_6502.items()
+                   if (name, mode) == ('lda', 'absolute_x'))
+        results = {('lda', 'absolute_x', crossing): measure_instruction(lda, crossing) for crossing in (False, True)}
+        # The page crossing costs an extra address.
+        self.assertEqual(results['lda', 'absolute_x', True]['objects'],
+                         results['lda', 'absolute_x', False]['objects'] + 1)
+        budget = results['lda', 'absolute_x', False]['objects']
+        self.assertEqual(over_budget(results, {('lda', 'absolute_x'): budget}),
+                         [('lda', 'absolute_x', True, budget + 1, budget)])
+        self.assertEqual(len(over_budget(results, {})), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import tempfile
+import unittest
+from cpu import CPU6502, INSTRUCTIONS_6502, CMOS_65C02
+from memory import RAM64K
+from clock import UnthrottledClock
+from data_types import Byte
+from exceptions import AssemblerError, InterruptError
+from assembler import Assembler, Program, assemble
+
+# Operand syntax for every addressing mode, with values that fit the zero page ones.
+OPERANDS = {
+    'implied': '',
+    'accumulator': 'A',
+    'immediate': '#$42',
+    'zero_page': '$10',
+    'zero_page_x': '$10,X',
+    'zero_page_y': '$10,Y',
+    'absolute': '$1234',
+    'absolute_x': '$1234,X',
+    'absolute_y': '$1234,Y',
+    'indirect': '($1234)',
+    'indirect_x': '($10,X)',
+    'indirect_y': '($10),Y',
+    'zero_page_indirect': '($10)',
+    'absolute_indirect_x': '($1234,X)',
+    'relative': '*',
+}
+
+PROGRAM = """
+; ORs two table entries into $10, then stops.
+count = end - table
+        .org $0200
+start:  LDX #count - 1
+        LDA #0
+loop:   ORA table,X     ; forward reference, absolute,X
+        ORA table
+        STA $10
+shift:  LSR
+        BNE shift
+        LDA #>vector
+        STA $11
+        LDY table+1
+        JMP done
+        NOP
+done:   BRK
+table:  .byte $01, %10, 'A', "BC"
+end:
+        .align 4, $EA
+vector: .word start
+"""
+
+
+class AssemblerTestCase(unittest.TestCase):
+    def test_every_opcode(self):
+        for table in (INSTRUCTIONS_6502, CMOS_65C02.instructions):
+            assembler = Assembler(table)
+            for opcode, (name, mode, _) in table.items():
+                data = assembler.assemble(f'  {name.upper()} {OPERANDS[mode]}').segments[0][1]
+                self.assertEqual(data[0], opcode, (name, mode))
+                self.assertEqual(len(data), {'implied': 1, 'accumulator': 1, 'absolute': 3, 'absolute_x': 3,
+                                             'absolute_y': 3, 'indirect': 3, 'absolute_indirect_x': 3}.get(mode, 2),
+                                 (name, mode))
+
+    def test_program(self):
+        program = assemble(PROGRAM)
+        self.assertEqual(program.start, 0x0200)
+        self.assertEqual(program.symbols['count'], 5)
+        self.assertEqual(program.symbols['vector'] % 4, 0)
+        image = program.image()
+        table = program.symbols['table'] - 0x0200
+        self.assertEqual(image[table:table + 5], b'\x01\x02ABC')
+        self.assertEqual(image[-2:], b'\x00\x02')
+        self.assertEqual(image[:2], bytes([0xA2, 0x04]))
+        # ORA table,X is absolute, table is only defined further down.
+        loop = program.symbols['loop'] - 0x0200
+        self.assertEqual(image[loop], 0x1D)
+
+        memory = RAM64K()
+        program.load(memory)
+        cpu = CPU6502(memory, UnthrottledClock())
+        with self.assertRaises(InterruptError):
+            cpu.run_until(10_000)
+        self.assertEqual(memory.dump(0x10, 2), bytes([0x43, 0x02]))
+        self.assertEqual(cpu.y, Byte(0x02))
+
+    def test_expressions_and_segments(self):
+        program = assemble("""
+low = <$1234
+        .org $0300
+        .byte low, >$1234, 2 + 3 * 4, (2 + 3) * 4, 1 << 4 | 1, ~0 & $FF, -1, 7 % 4, * & $FF, * >> 8
+        *= $0400
+        .word *, $10 - 1
+        .res 2
+        """)
+        self.assertEqual(program.segments, [
+            (0x0300, bytes([0x34, 0x12, 14, 20, 0x11, 0xFF, 0xFF, 3, 0x00, 0x03])),
+            (0x0400, bytes([0x00, 0x04, 0x0F, 0x00, 0x00, 0x00])),
+        ])
+        self.assertEqual(program.image(fill=0xEA)[10:12], b'\xEA\xEA')
+
+    def test_zero_page_choice(self):
+        program = assemble("""
+zp = $80
+        LDA zp
+        LDA zp,X
+        LDA far
+        LDX zp,Y
+far = $2000
+        """)
+        self.assertEqual(program.segments[0][1], bytes([0xA5, 0x80, 0xB5, 0x80, 0xAD, 0x00, 0x20, 0xB6, 0x80]))
+
+    def test_errors(self):
+        cases = {
+            '  LDA #1\n  FOO': (2, 'unknown instruction FOO'),
+            '  LDA missing': (1, 'undefined symbol missing'),
+            'a:\na:': (2, 'a is already defined'),
+            '  BNE far\n  .res 200\nfar:': (1, 'out of range'),
+            '  LDA #$100': (1, 'does not fit in a byte'),
+            '  STA #1': (1, 'STA has no immediate mode'),
+            '  .org later\nlater = 1': (1, 'later must be defined before'),
+            '  LDA (1 + 2': (1, 'missing )'),
+            '  LDA ($10)': (1, 'LDA has no indirect mode'),
+        }
+        for source, (line, message) in cases.items():
+            with self.assertRaises(AssemblerError) as context:
+                assemble(source)
+            self.assertEqual(context.exception.line, line, source)
+            self.assertIn(message, str(context.exception), source)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            assembler = Assembler(cache_dir=cache_dir)
+            first = assembler.assemble(PROGRAM)
+            second = assembler.assemble(PROGRAM)
+            self.assertEqual(second, first)
+            self.assertEqual((assembler.cache_hits, assembler.cache_misses), (1, 1))
+
+            # Another origin or source is another entry.
+            assembler.assemble(PROGRAM, origin=0x0300)
+            assembler.assemble(PROGRAM + '\n  NOP')
+            self.assertEqual((assembler.cache_hits, assembler.cache_misses), (1, 3))
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+            # A damaged entry is assembled again and replaced.
+            with open(assembler.cache_path(PROGRAM, 0x0200), 'w') as f:
+                f.write('{')
+            self.assertEqual(Assembler(cache_dir=cache_dir).assemble(PROGRAM), first)
+            fresh = Assembler(cache_dir=cache_dir)
+            self.assertEqual(fresh.assemble(PROGRAM), first)
+            self.assertEqual(fresh.cache_hits, 1)
+
+    def test_other_table(self):
+        table = dict(INSTRUCTIONS_6502)
+        table[0xEA] = ('nop', 'implied', 2)
+        table[0xFF] = ('halt', 'implied', 1)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            program = Assembler(table, cache_dir).assemble('  HALT')
+            self.assertEqual(program.segments, [(0x0200, b'\xFF')])
+            # Same source, different table, not served from the other table's cache entry.
+            self.assertNotEqual(Assembler(cache_dir=cache_dir).cache_path('  HALT', 0x200),
+                                Assembler(table, cache_dir).cache_path('  HALT', 0x200))
+        self.assertIsInstance(Program.from_json(program.to_json()), Program)
+
+
+if __name__ == '__main__':
+    unittest.main()
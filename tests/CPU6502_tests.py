@@ -1,10 +1,18 @@
+import os
+import tempfile
 import unittest
 from threading import Thread
-from cpu import CPU6502
+from cpu import CPU6502, CMOS_65C02, INSTRUCTIONS_6502, NMOS_6502, Variant
 from memory import RAM64K
 from data_types import Word, Byte, Bit
 from exceptions import *
-from clock import Clock
+from clock import Clock, UnthrottledClock
+from reverse import ReverseDebugger
+from metrics import PrometheusExporter, prometheus_text
+from fusion import FusionTable, profile_pairs
+from guest_coverage import GuestCoverage
+from profiler import HostProfiler
+from assembler import Assembler
 
 
 class MyTestCase(unittest.TestCase):
@@ -654,6 +662,873 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(self.memory[Word(0x01FF)], Byte(0x80))
         self.check_flags(self.cpu, [0, 0, 0, 0, 1, 0, 0, 1])
 
+    def test_jmp_absolute(self):
+        # JMP $0300
+        self.memory[Word(0x0200)] = Byte(0x4C)
+        self.memory[Word(0x0201)] = Byte(0x00)
+        self.memory[Word(0x0202)] = Byte(0x03)
+        self.run_cpu()
+
+        self.assertEqual(self.clock.cycles, 4)
+        self.assertEqual(self.cpu.pc, Word(0x0301))
+
+    def test_jmp_indirect_page_wrap(self):
+        # JMP ($03FF), msb is read from $0300 rather than $0400
+        self.memory[Word(0x0200)] = Byte(0x6C)
+        self.memory[Word(0x0201)] = Byte(0xFF)
+        self.memory[Word(0x0202)] = Byte(0x03)
+        self.memory[Word(0x03FF)] = Byte(0x10)
+        self.memory[Word(0x0300)] = Byte(0x05)
+        self.memory[Word(0x0400)] = Byte(0x06)
+        self.run_cpu()
+
+        self.assertEqual(self.clock.cycles, 6)
+        self.assertEqual(self.cpu.pc, Word(0x0511))
+
+    def test_beq_taken(self):
+        # LDA #$00
+        self.memory[Word(0x0200)] = Byte(0xA9)
+        self.memory[Word(0x0201)] = Byte(0x00)
+        # BEQ +2
+        self.memory[Word(0x0202)] = Byte(0xF0)
+        self.memory[Word(0x0203)] = Byte(0x02)
+        self.memory[Word(0x0204)] = Byte(0xA9)
+        self.memory[Word(0x0205)] = Byte(0x05)
+        self.run_cpu()
+
+        # 2 + 3 for the taken branch + 1 for brk
+        self.assertEqual(self.clock.cycles, 6)
+        self.assertEqual(self.cpu.a, Byte(0x00))
+        self.assertEqual(self.cpu.pc, Word(0x0207))
+
+    def test_bne_not_taken(self):
+        # LDA #$00
+        self.memory[Word(0x0200)] = Byte(0xA9)
+        self.memory[Word(0x0201)] = Byte(0x00)
+        # BNE +2
+        self.memory[Word(0x0202)] = Byte(0xD0)
+        self.memory[Word(0x0203)] = Byte(0x02)
+        self.run_cpu()
+
+        self.assertEqual(self.clock.cycles, 5)
+        self.assertEqual(self.cpu.pc, Word(0x0205))
+
+    def test_bpl_backwards_page_crossed(self):
+        # JMP $0300
+        self.memory[Word(0x0200)] = Byte(0x4C)
+        self.memory[Word(0x0201)] = Byte(0x00)
+        self.memory[Word(0x0202)] = Byte(0x03)
+        # BPL -8, lands on $02FA
+        self.memory[Word(0x0300)] = Byte(0x10)
+        self.memory[Word(0x0301)] = Byte(0xF8)
+        self.run_cpu()
+
+        # 3 + 4 for the taken branch crossing a page + 1 for brk
+        self.assertEqual(self.clock.cycles, 8)
+        self.assertEqual(self.cpu.pc, Word(0x02FB))
+
+    def test_sta_zero_page(self):
+        # LDA #$37
+        self.memory[Word(0x0200)] = Byte(0xA9)
+        self.memory[Word(0x0201)] = Byte(0x37)
+        # STA $42
+        self.memory[Word(0x0202)] = Byte(0x85)
+        self.memory[Word(0x0203)] = Byte(0x42)
+        self.run_cpu()
+
+        self.assertEqual(self.clock.cycles, 6)
+        self.assertEqual(self.memory[Word(0x0042)], Byte(0x37))
+
+    def test_sta_absolute_x(self):
+        # LDA #$37
+        self.memory[Word(0x0200)] = Byte(0xA9)
+        self.memory[Word(0x0201)] = Byte(0x37)
+        # STA $25F0, X (X starts at 0x42)
+        self.memory[Word(0x0202)] = Byte(0x9D)
+        self.memory[Word(0x0203)] = Byte(0xF0)
+        self.memory[Word(0x0204)] = Byte(0x25)
+        self.run_cpu()
+
+        # No page crossing penalty for stores
+        self.assertEqual(self.clock.cycles, 8)
+        self.assertEqual(self.memory[Word(0x2632)], Byte(0x37))
+
+    def test_sta_indirect_y(self):
+        # LDY #$10
+        self.memory[Word(0x0200)] = Byte(0xA0)
+        self.memory[Word(0x0201)] = Byte(0x10)
+        # LDA #$37
+        self.memory[Word(0x0202)] = Byte(0xA9)
+        self.memory[Word(0x0203)] = Byte(0x37)
+        # STA ($44), Y
+        self.memory[Word(0x0204)] = Byte(0x91)
+        self.memory[Word(0x0205)] = Byte(0x44)
+        self.memory[Word(0x0044)] = Byte(0x00)
+        self.memory[Word(0x0045)] = Byte(0x25)
+        self.run_cpu()
+
+        self.assertEqual(self.clock.cycles, 11)
+        self.assertEqual(self.memory[Word(0x2510)], Byte(0x37))
+
+
+class IdleLoopTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = RAM64K()
+        self.clock = UnthrottledClock()
+
+    def run_to_brk(self, idle_skip):
+        cpu = CPU6502(self.memory, self.clock, idle_skip=idle_skip)
+        with self.assertRaises(InterruptError):
+            while True:
+                cpu.execute()
+        return cpu
+
+    def poll_loop(self):
+        # LDA $3000
+        self.memory[Word(0x0200)] = Byte(0xAD)
+        self.memory[Word(0x0201)] = Byte(0x00)
+        self.memory[Word(0x0202)] = Byte(0x30)
+        # BEQ $0200
+        self.memory[Word(0x0203)] = Byte(0xF0)
+        self.memory[Word(0x0204)] = Byte(0xFB)
+        # A device sets the status bit later on.
+        self.clock.events.schedule(20_000, self.memory.__setitem__, Word(0x3000), Byte(0x80))
+
+    def test_poll_loop_matches_interpreted_cycles(self):
+        self.poll_loop()
+        self.run_to_brk(idle_skip=False)
+        interpreted = self.clock.cycles
+
+        self.setUp()
+        self.poll_loop()
+        cpu = self.run_to_brk(idle_skip=True)
+
+        self.assertEqual(self.clock.cycles, interpreted)
+        self.assertGreater(cpu.idle_cycles_skipped, 19_000)
+        self.assertEqual(cpu.a, Byte(0x80))
+
+    def test_jump_to_self_runs_until(self):
+        # JMP $0200
+        self.memory[Word(0x0200)] = Byte(0x4C)
+        self.memory[Word(0x0201)] = Byte(0x00)
+        self.memory[Word(0x0202)] = Byte(0x02)
+        cpu = CPU6502(self.memory, self.clock, idle_skip=True)
+        cpu.run_until(10_000_000)
+
+        # Instruction boundaries fall on multiples of 3.
+        self.assertEqual(self.clock.cycles, 10_000_002)
+        self.assertGreater(cpu.idle_cycles_skipped, 9_999_000)
+
+    def test_loop_with_writes_is_not_skipped(self):
+        # PHA
+        self.memory[Word(0x0200)] = Byte(0x48)
+        # PLA
+        self.memory[Word(0x0201)] = Byte(0x68)
+        # JMP $0200
+        self.memory[Word(0x0202)] = Byte(0x4C)
+        self.memory[Word(0x0203)] = Byte(0x00)
+        self.memory[Word(0x0204)] = Byte(0x02)
+        cpu = CPU6502(self.memory, self.clock, idle_skip=True)
+        cpu.run_until(1000)
+
+        self.assertEqual(cpu.idle_cycles_skipped, 0)
+
+
+class InterruptTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = RAM64K()
+        self.clock = UnthrottledClock()
+        # IRQ handler at $0300, NMI handler at $0400
+        self.memory[Word(0xFFFE)] = Byte(0x00)
+        self.memory[Word(0xFFFF)] = Byte(0x03)
+        self.memory[Word(0xFFFA)] = Byte(0x00)
+        self.memory[Word(0xFFFB)] = Byte(0x04)
+        # LDA #$42
+        self.memory[Word(0x0300)] = Byte(0xA9)
+        self.memory[Word(0x0301)] = Byte(0x42)
+        self.memory[Word(0x0400)] = Byte(0xA9)
+        self.memory[Word(0x0401)] = Byte(0x24)
+        # RTI
+        self.memory[Word(0x0402)] = Byte(0x40)
+
+    def wait_loop(self, cli):
+        # CLI or NOP
+        self.memory[Word(0x0200)] = Byte(0x58 if cli else 0xEA)
+        # JMP $0201
+        self.memory[Word(0x0201)] = Byte(0x4C)
+        self.memory[Word(0x0202)] = Byte(0x01)
+        self.memory[Word(0x0203)] = Byte(0x02)
+
+    def run_to_brk(self, cpu):
+        with self.assertRaises(InterruptError):
+            while True:
+                cpu.execute()
+
+    def test_irq(self):
+        self.wait_loop(cli=True)
+        for idle_skip in (False, True):
+            self.clock = UnthrottledClock()
+            cpu = CPU6502(self.memory, self.clock, idle_skip=idle_skip)
+            self.clock.events.schedule(100, cpu.set_irq, 'timer', True)
+            self.run_to_brk(cpu)
+
+            # Taken on the boundary at cycle 101, 7 cycles + LDA + BRK
+            self.assertEqual(self.clock.cycles, 111)
+            self.assertEqual(cpu.a, Byte(0x42))
+            self.assertEqual(cpu.sp, Byte(0xFC))
+            self.assertEqual(self.memory[Word(0x01FF)], Byte(0x02))
+            self.assertEqual(self.memory[Word(0x01FE)], Byte(0x01))
+            self.assertEqual(self.memory[Word(0x01FD)], Byte(0x20))
+            self.assertEqual(cpu.flags['I'].value, 1)
+            self.assertEqual(cpu.interrupts_serviced, 1)
+
+    def test_irq_masked(self):
+        self.wait_loop(cli=False)
+        cpu = CPU6502(self.memory, self.clock)
+        cpu.flags['I'] = Bit(1)
+        cpu.set_irq('timer')
+        cpu.run_until(1000)
+
+        self.assertEqual(cpu.interrupts_serviced, 0)
+        self.assertEqual(cpu.a, Byte(0x00))
+
+        cpu.set_irq('timer', False)
+        cpu.flags['I'] = Bit(0)
+        cpu.run_until(2000)
+        self.assertEqual(cpu.interrupts_serviced, 0)
+
+    def test_nmi_ignores_i_flag_and_returns(self):
+        # SEI, BRK
+        self.memory[Word(0x0200)] = Byte(0x78)
+        cpu = CPU6502(self.memory, self.clock)
+        self.clock.events.schedule(1, cpu.nmi)
+        self.run_to_brk(cpu)
+
+        # SEI + 7 + LDA + RTI + BRK
+        self.assertEqual(self.clock.cycles, 18)
+        self.assertEqual(cpu.a, Byte(0x24))
+        self.assertEqual(cpu.pc, Word(0x0202))
+        self.assertEqual(cpu.sp, Byte(0xFF))
+
+
+class DecodeCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = RAM64K()
+        # LDA #$05
+        self.memory[Word(0x0200)] = Byte(0xA9)
+        self.memory[Word(0x0201)] = Byte(0x05)
+        # JMP $0200
+        self.memory[Word(0x0202)] = Byte(0x4C)
+        self.memory[Word(0x0203)] = Byte(0x00)
+        self.memory[Word(0x0204)] = Byte(0x02)
+
+        self.clock = Clock(2000)
+        self.cpu = CPU6502(self.memory, self.clock, decode_cache=True)
+        self.clock.start()
+
+    def tearDown(self):
+        self.clock.stop()
+        self.clock._clock_thread.join()
+
+    def test_loop_hits_cache(self):
+        for _ in range(10):
+            self.cpu.execute()
+
+        stats = self.cpu.decode_cache_stats()
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['hits'], 8)
+        self.assertEqual(stats['entries'], 2)
+        self.assertAlmostEqual(stats['hit_rate'], 0.8)
+        self.assertEqual(self.cpu.pc, Word(0x0200))
+        self.assertEqual(self.cpu.a, Byte(0x05))
+
+    def test_write_invalidates_page(self):
+        for _ in range(2):
+            self.cpu.execute()
+        # Self-modifying store into the LDA operand.
+        self.cpu.store_byteADDR(Word(0x0201), Byte(0x07))
+        self.cpu.execute()
+
+        self.assertEqual(self.cpu.a, Byte(0x07))
+        self.assertEqual(self.cpu.decode_cache_stats()['invalidations'], 1)
+
+    def test_hits_skip_operand_fetches(self):
+        program = bytes([
+            0xAD, 0x00, 0x30,  # LDA $3000
+            0xA2, 0x01,        # LDX #$01
+            0xEA,              # NOP
+            0x4C, 0x00, 0x02,  # JMP $0200
+        ])
+        for accuracy in ('bus', 'cycle', 'instruction'):
+            cpus = []
+            for decode_cache in (False, True):
+                memory = RecordingRAM()
+                memory.load(0x0200, program)
+                memory.load(0x3000, bytes([0x42]))
+                cpus.append(CPU6502(memory, UnthrottledClock(), decode_cache=decode_cache, accuracy=accuracy))
+            plain, cached = cpus
+            for cpu in cpus:
+                for _ in range(4):
+                    cpu.execute()
+                cpu.memory.log.clear()
+                for _ in range(4):
+                    cpu.execute()
+            # Once cached, only data reads touch memory, NOP's dummy read of the next byte on the bus, and the fetch
+            # cycles are still counted.
+            reads = [('read', 0x3000, 0x42)] + ([('read', 0x0206, 0x4C)] if accuracy == 'bus' else [])
+            self.assertEqual([entry for entry in cached.memory.log if entry[0] == 'read'], reads)
+            self.assertEqual(cached.clock.cycles, 2 * (4 + 2 + 2 + 3))
+            self.assertEqual(cached.save_state(), plain.save_state())
+
+
+class DebugTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = RAM64K()
+        self.clock = UnthrottledClock()
+        # LDA #$05
+        self.memory[Word(0x0200)] = Byte(0xA9)
+        self.memory[Word(0x0201)] = Byte(0x05)
+        # STA $3000
+        self.memory[Word(0x0202)] = Byte(0x8D)
+        self.memory[Word(0x0203)] = Byte(0x00)
+        self.memory[Word(0x0204)] = Byte(0x30)
+        # LDX $3001
+        self.memory[Word(0x0205)] = Byte(0xAE)
+        self.memory[Word(0x0206)] = Byte(0x01)
+        self.memory[Word(0x0207)] = Byte(0x30)
+        self.memory[Word(0x3001)] = Byte(0x09)
+        self.cpu = CPU6502(self.memory, self.clock)
+
+    def test_breakpoint_stops_and_resumes(self):
+        self.cpu.add_breakpoint(0x0202)
+        self.cpu.execute()
+        with self.assertRaises(BreakpointHit) as hit:
+            self.cpu.execute()
+        self.assertEqual(hit.exception.address, 0x0202)
+        self.assertEqual(self.cpu.pc, Word(0x0202))
+        self.assertEqual(self.clock.cycles, 2)
+
+        # Executing again steps over the breakpoint.
+        self.cpu.execute()
+        self.assertEqual(self.cpu.pc, Word(0x0205))
+        self.assertEqual(self.memory[Word(0x3000)], Byte(0x05))
+
+    def test_write_watchpoint(self):
+        self.cpu.add_watchpoint(0x3000, 0x30FF)
+        self.cpu.execute()
+        with self.assertRaises(WatchpointHit) as hit:
+            self.cpu.execute()
+        self.assertEqual(hit.exception.access, 'write')
+        self.assertEqual(hit.exception.address, 0x3000)
+        self.assertEqual(hit.exception.value, 0x05)
+        # The store completed before stopping.
+        self.assertEqual(self.cpu.pc, Word(0x0205))
+        # Reads are not watched.
+        self.cpu.execute()
+        self.assertEqual(self.cpu.x, Byte(0x09))
+
+    def test_read_watchpoint(self):
+        self.cpu.add_watchpoint(0x3001, read=True, write=False)
+        self.cpu.execute()
+        self.cpu.execute()
+        with self.assertRaises(WatchpointHit) as hit:
+            self.cpu.execute()
+        self.assertEqual(hit.exception.access, 'read')
+        self.assertEqual(hit.exception.value, 0x09)
+
+    def test_removing_restores_plain_methods(self):
+        execute = self.cpu.execute
+        store = self.cpu.store_byteADDR
+        self.cpu.add_breakpoint(0x0202)
+        watchpoint = self.cpu.add_watchpoint(0x3000, read=True)
+        self.assertNotEqual(self.cpu.execute, execute)
+        self.assertNotEqual(self.cpu.store_byteADDR, store)
+
+        self.cpu.remove_breakpoint(0x0202)
+        self.cpu.remove_watchpoint(watchpoint)
+        self.assertEqual(self.cpu.execute, execute)
+        self.assertEqual(self.cpu.store_byteADDR, store)
+        self.assertEqual(self.cpu.get_byteADDR, self.cpu._plain_get_byteADDR)
+
+
+class ReverseDebuggerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = RAM64K()
+        self.clock = UnthrottledClock()
+        program = [
+            0xA9, 0x01,        # LDA #$01
+            0x85, 0x10,        # STA $10
+            0xA2, 0x02,        # LDX #$02
+            0x8D, 0x00, 0x30,  # STA $3000
+            0xA9, 0x03,        # LDA #$03
+            0x85, 0x10,        # STA $10
+            0x4C, 0x00, 0x02,  # JMP $0200
+        ]
+        self.memory.load(0x0200, bytes(program))
+        self.cpu = CPU6502(self.memory, self.clock)
+        self.debugger = ReverseDebugger(self.cpu, interval=20)
+        self.debugger.start()
+
+    def run_instructions(self, count):
+        states = []
+        for _ in range(count):
+            states.append(self.cpu.save_state())
+            self.cpu.execute()
+        return states
+
+    def test_step_back_matches_forward_run(self):
+        states = self.run_instructions(40)
+        for expected in reversed(states[-10:]):
+            self.assertEqual(self.debugger.step_back(), expected['cycles'])
+            self.assertEqual(self.cpu.save_state(), expected)
+
+        # Running forward again retraces the same path.
+        self.cpu.execute()
+        self.assertEqual(self.cpu.save_state(), states[-9])
+
+    def test_run_back_until_pc(self):
+        self.run_instructions(40)
+        cycle = self.debugger.run_back_until(pc=0x0204)
+        self.assertEqual(self.clock.cycles, cycle)
+        self.assertEqual(self.cpu.pc, Word(0x0204))
+        self.assertEqual(self.cpu.a, Byte(0x01))
+
+    def test_run_back_until_watch(self):
+        self.run_instructions(40)
+        self.debugger.run_back_until(watch=0x3000)
+        # Stopped right after the STA $3000.
+        self.assertEqual(self.cpu.pc, Word(0x0209))
+        self.assertEqual(self.cpu.x, Byte(0x02))
+
+    def test_not_found_stays_put(self):
+        self.run_instructions(10)
+        state = self.cpu.save_state()
+        self.assertIsNone(self.debugger.run_back_until(pc=0x1234))
+        self.assertEqual(self.cpu.save_state(), state)
+
+    def test_budget_evicts_oldest(self):
+        self.debugger.budget = 3 * len(self.debugger.checkpoints[0]['memory'])
+        self.run_instructions(100)
+        self.assertLessEqual(self.debugger.size, self.debugger.budget)
+        self.assertGreater(self.debugger.evictions, 0)
+        self.assertNotIn(0, self.debugger.checkpoints)
+        self.debugger.step_back()
+
+        # Nothing held before the oldest checkpoint.
+        oldest = min(self.debugger.checkpoints)
+        self.debugger._run_to(oldest, oldest)
+        with self.assertRaises(ValueError):
+            self.debugger.step_back()
+
+    def test_replay_with_idle_skip(self):
+        memory = RAM64K()
+        memory.load(0x0200, bytes([0x4C, 0x00, 0x02]))  # JMP $0200
+        cpu = CPU6502(memory, UnthrottledClock(), idle_skip=True)
+        debugger = ReverseDebugger(cpu, interval=1000)
+        debugger.start()
+        cpu.run_until(500)
+        now = cpu.clock.cycles
+        # Skipping idle loop iterations stops at the cycle being replayed to, not at the next checkpoint.
+        self.assertEqual(debugger.step_back(), now - 3)
+        self.assertEqual(cpu.clock.cycles, now - 3)
+        self.assertEqual(debugger.run_back_until(pc=0x0200), now - 6)
+        self.assertEqual(cpu.clock.cycles, now - 6)
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = RAM64K()
+        self.memory.load(0x0200, bytes([
+            0xA5, 0x10,        # LDA $10
+            0x85, 0x11,        # STA $11
+            0x4C, 0x00, 0x02,  # JMP $0200
+        ]))
+        self.clock = UnthrottledClock()
+        self.cpu = CPU6502(self.memory, self.clock)
+
+    def test_cpu_stats(self):
+        # IRQ handler is the loop itself.
+        self.memory.load(0xFFFE, bytes([0x00, 0x02]))
+        self.cpu.count_memory_reads()
+        self.cpu.run_until(900)
+        self.cpu.set_irq('timer')
+        self.cpu.run_until(1798)
+        stats = self.cpu.stats()
+
+        # 100 loops of 9 cycles, 7 cycles of interrupt entry, then 99 more loops.
+        self.assertEqual(stats['cycles'], 1798)
+        self.assertEqual(stats['run_cycles'], 1798)
+        self.assertEqual(stats['instructions_retired'], 597)
+        self.assertEqual(stats['interrupts_serviced'], 1)
+        # Vector fetch and pushes included.
+        self.assertEqual(stats['memory_reads'], 100 + 2 + 99)
+        self.assertEqual(stats['memory_writes'], 100 + 3 + 99)
+        self.assertGreater(stats['mhz'], 0)
+        self.assertGreaterEqual(stats['blocked_seconds'], 0)
+        self.assertIn('decode_cache_hit_rate', stats)
+
+    def test_memory_reads_opt_in(self):
+        self.cpu.run_until(90)
+        self.assertEqual(self.cpu.stats()['memory_reads'], 0)
+        self.cpu.count_memory_reads()
+        # Counted under a read watchpoint too.
+        self.cpu.add_watchpoint(0x20, read=True, write=False)
+        self.cpu.run_until(180)
+        self.cpu.count_memory_reads(False)
+        self.cpu.run_until(270)
+        self.assertEqual(self.cpu.stats()['memory_reads'], 10)
+        self.assertEqual(self.cpu.stats()['memory_writes'], 30)
+
+    def test_instructions_retired(self):
+        self.cpu.run_until(900)
+        self.assertEqual(self.cpu.stats()['instructions_retired'], 300)
+        # execute() on its own is not counted.
+        self.cpu.execute()
+        self.assertEqual(self.cpu.stats()['instructions_retired'], 300)
+
+    def test_prometheus_export(self):
+        self.cpu.run_until(90)
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            exporter = PrometheusExporter(path, {'cpu0': self.cpu, 'clock0': self.clock}, interval=60)
+            exporter.start()
+            exporter.stop()
+            with open(path) as f:
+                text = f.read()
+        finally:
+            os.remove(path)
+
+        self.assertEqual(text, prometheus_text({'cpu0': self.cpu, 'clock0': self.clock}))
+        self.assertIn('# TYPE emulator_instructions_retired_total counter\n', text)
+        self.assertIn('emulator_instructions_retired_total{instance="cpu0"} 30\n', text)
+        self.assertIn('emulator_cycles_total{instance="clock0"} 90\n', text)
+        self.assertIn('# TYPE emulator_mhz gauge\n', text)
+
+
+class FusionTestCase(unittest.TestCase):
+    PROGRAM = bytes([
+        0x58,              # CLI
+        0xA5, 0x10,        # LDA $10
+        0x09, 0x01,        # ORA #$01
+        0x48,              # PHA
+        0x68,              # PLA
+        0x85, 0x11,        # STA $11
+        0x4C, 0x01, 0x02,  # JMP $0201
+    ])
+
+    def make_cpu(self, **options):
+        memory = RAM64K()
+        memory.load(0x0200, self.PROGRAM)
+        # IRQ handler: LDA #$80, STA $10, RTI
+        memory.load(0x0300, bytes([0xA9, 0x80, 0x85, 0x10, 0x40]))
+        memory.load(0xFFFE, bytes([0x00, 0x03]))
+        clock = UnthrottledClock()
+        cpu = CPU6502(memory, clock, **options)
+        clock.events.schedule(203, cpu.set_irq, 'timer', True)
+        clock.events.schedule(210, cpu.set_irq, 'timer', False)
+        return cpu
+
+    def test_profile_and_persist(self):
+        counts = profile_pairs(self.make_cpu(), 100)
+        self.assertAlmostEqual(counts[0xA5, 0x09], counts[0x48, 0x68], delta=1)
+        self.assertGreater(counts[0xA5, 0x09], 5)
+        # The jump never falls through.
+        self.assertNotIn((0x4C, 0xA5), counts)
+
+        table = FusionTable.learn(counts, size=3)
+        self.assertEqual(len(table), 3)
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            table.save(path)
+            self.assertEqual(FusionTable.load(path).pairs, table.pairs)
+        finally:
+            os.remove(path)
+
+    def test_fused_matches_plain(self):
+        pairs = [(0xA5, 0x09), (0x48, 0x68), (0x85, 0x4C)]
+        for cycle in (5, 100, 204, 206, 250, 1000):
+            plain = self.make_cpu(decode_cache=True)
+            fused = self.make_cpu(fusion=pairs)
+            plain.run_until(cycle)
+            fused.run_until(cycle)
+            self.assertEqual(fused.save_state(), plain.save_state())
+            self.assertEqual(fused.stats()['instructions_retired'], plain.stats()['instructions_retired'])
+            self.assertEqual(fused.interrupts_serviced, plain.interrupts_serviced)
+        self.assertEqual(plain.interrupts_serviced, 1)
+        self.assertGreater(fused.fused_pairs, 100)
+
+    def test_self_modifying_pair(self):
+        memory = RAM64K()
+        memory.load(0x0200, bytes([
+            0xA9, 0x07,        # LDA #$07
+            0x8D, 0x08, 0x02,  # STA $0208, the operand of the LDX below
+            0xA2, 0x00,        # LDX #$00
+            0xA2, 0x00,        # LDX #$00
+            0x00,              # BRK
+        ]))
+        cpu = CPU6502(memory, UnthrottledClock(), fusion=[(0x8D, 0xA2), (0xA2, 0xA2)])
+        with self.assertRaises(InterruptError):
+            cpu.run_until(100)
+        self.assertEqual(cpu.x, Byte(0x07))
+
+    def test_wrapped_execute_sees_fused_pairs(self):
+        pairs = [(0xA5, 0x09), (0x48, 0x68), (0x85, 0x4C)]
+        maps = []
+        for options in ({'decode_cache': True}, {'fusion': pairs}):
+            cpu = self.make_cpu(**options)
+            coverage = GuestCoverage(cpu)
+            coverage.start()
+            cpu.run_until(1000)
+            coverage.stop()
+            maps.append(coverage.executed)
+            # Nothing is fused while execute() is wrapped.
+            self.assertEqual(cpu.fused_pairs, 0)
+        self.assertEqual(maps[1], maps[0])
+        self.assertEqual(maps[1][0x0203], 1)
+        # Fusing carries on once it no longer is.
+        cpu.run_until(2000)
+        self.assertGreater(cpu.fused_pairs, 0)
+        self.assertEqual(profile_pairs(self.make_cpu(fusion=pairs), 1000),
+                         profile_pairs(self.make_cpu(decode_cache=True), 1000))
+
+
+class HostProfilerTestCase(unittest.TestCase):
+    PROGRAM = FusionTestCase.PROGRAM
+    make_cpu = FusionTestCase.make_cpu
+
+    def test_profile(self):
+        for options in ({}, {'decode_cache': True}, {'fusion': [(0xA5, 0x09), (0x48, 0x68)]}):
+            cpu = self.make_cpu(**options)
+            opcodes = cpu.OPCODES
+            profiler = HostProfiler(cpu)
+            profiler.start()
+            cpu.run_until(2000)
+            profiler.stop()
+            self.assertIs(cpu.OPCODES, opcodes)
+
+            self.assertEqual(sum(profiler.counts), cpu.stats()['instructions_retired'])
+            self.assertEqual(profiler.interrupts, 1)
+            # The loop body runs once per iteration, CLI only on the way in and LDA #$80 in the handler.
+            self.assertAlmostEqual(profiler.counts[0xA5], profiler.counts[0x4C], delta=1)
+            self.assertEqual(profiler.counts[0x58], 1)
+            self.assertEqual(profiler.counts[0xA9], 1)
+            self.assertEqual({row[0] for row in profiler.opcodes()},
+                             {0x58, 0xA5, 0x09, 0x48, 0x68, 0x85, 0x4C, 0xA9, 0x40})
+            modes = {row[0]: row[1] for row in profiler.modes()}
+            self.assertEqual(modes['zero_page'], profiler.counts[0xA5] + profiler.counts[0x85])
+
+            report = profiler.report()
+            self.assertIn('ORA  immediate', report)
+            self.assertIn('(interrupt)', report)
+            folded = profiler.folded().splitlines()
+            self.assertIn('execute;absolute;jmp', [line.rsplit(' ', 1)[0] for line in folded])
+            for line in folded:
+                int(line.rsplit(' ', 1)[1])
+
+        # Stopped, nothing more is counted.
+        before = sum(profiler.counts)
+        cpu.run_until(3000)
+        self.assertEqual(sum(profiler.counts), before)
+        profiler.reset()
+        self.assertEqual(profiler.opcodes(), [])
+
+
+class RecordingRAM(RAM64K):
+    """RAM logging every access, instruction fetches included."""
+    def __init__(self):
+        super().__init__()
+        self.log = []
+
+    def __getitem__(self, address):
+        value = super().__getitem__(address)
+        self.log.append(('read', int(address), value.value))
+        return value
+
+    def __setitem__(self, address, value):
+        self.log.append(('write', int(address), value.value))
+        super().__setitem__(address, value)
+
+
+class AccuracyTestCase(unittest.TestCase):
+    PROGRAM = bytes([
+        0x58,              # CLI
+        0xA2, 0x20,        # LDX #$20
+        0xBD, 0xF0, 0x20,  # LDA $20F0,X, crosses a page
+        0x9D, 0x00, 0x30,  # STA $3000,X
+        0x46, 0x10,        # LSR $10
+        0x48,              # PHA
+        0xEA,              # NOP
+        0x68,              # PLA
+        0x08,              # PHP
+        0x28,              # PLP
+        0xD0, 0x70,        # BNE $0282, crosses into the next page
+    ])
+
+    def make_cpu(self, accuracy, memory=None):
+        memory = RAM64K() if memory is None else memory
+        memory.load(0x0200, self.PROGRAM)
+        # JMP $0200 back from the other page
+        memory.load(0x0282, bytes([0x4C, 0x00, 0x02]))
+        memory.load(0x2110, bytes([0x81]))
+        memory.load(0x0010, bytes([0xFE]))
+        # IRQ handler: LSR $11, RTI
+        memory.load(0x0300, bytes([0x46, 0x11, 0x40]))
+        memory.load(0xFFFE, bytes([0x00, 0x03]))
+        memory.load(0x0011, bytes([0x80]))
+        clock = UnthrottledClock()
+        cpu = CPU6502(memory, clock, accuracy=accuracy)
+        clock.events.schedule(50, cpu.set_irq, 'timer', True)
+        clock.events.schedule(60, cpu.set_irq, 'timer', False)
+        return cpu
+
+    @staticmethod
+    def state(cpu):
+        # Bus accuracy counts its dummy writes too.
+        state = cpu.save_state()
+        del state['memory_writes']
+        return state
+
+    def test_nop_takes_two_cycles(self):
+        for accuracy in ('bus', 'cycle', 'instruction'):
+            memory = RAM64K()
+            memory[Word(0x0200)] = Byte(0xEA)
+            cpu = CPU6502(memory, UnthrottledClock(), accuracy=accuracy)
+            cpu.execute()
+            self.assertEqual(cpu.clock.cycles, 2)
+            self.assertEqual(cpu.pc, Word(0x0201))
+
+    def test_levels_agree(self):
+        for cycle in (3, 40, 56, 200):
+            reference = self.make_cpu('cycle')
+            reference.run_until(cycle)
+            for accuracy in ('bus', 'instruction'):
+                cpu = self.make_cpu(accuracy)
+                cpu.run_until(cycle)
+                self.assertEqual(self.state(cpu), self.state(reference))
+        self.assertEqual(reference.interrupts_serviced, 1)
+
+    def test_switch_between_instructions(self):
+        reference = self.make_cpu('cycle')
+        reference.run_until(200)
+        cpu = self.make_cpu('instruction')
+        cpu.run_until(30)
+        cpu.set_accuracy('bus')
+        cpu.run_until(100)
+        cpu.set_accuracy('cycle')
+        cpu.run_until(200)
+        self.assertEqual(self.state(cpu), self.state(reference))
+        with self.assertRaises(ValueError):
+            cpu.set_accuracy('exact')
+
+    def test_bus_dummy_accesses(self):
+        bus = self.make_cpu('bus', RecordingRAM())
+        cycle = self.make_cpu('cycle', RecordingRAM())
+        for cpu in (bus, cycle):
+            # Up to the end of PLP
+            while cpu.pc != Word(0x0210):
+                cpu.execute()
+        bus_log, cycle_log = bus.memory.log, cycle.memory.log
+        # LDA reads the unfixed address before the carry reaches the high byte, STA reads its target first.
+        self.assertIn(('read', 0x2010, 0), bus_log)
+        self.assertIn(('read', 0x3020, 0), bus_log)
+        self.assertNotIn(('read', 0x2010, 0), cycle_log)
+        # LSR writes the value it read back before the result.
+        self.assertEqual([entry for entry in bus_log if entry[:2] == ('write', 0x10)],
+                         [('write', 0x10, 0xFE), ('write', 0x10, 0x7F)])
+        self.assertEqual([entry for entry in cycle_log if entry[:2] == ('write', 0x10)], [('write', 0x10, 0x7F)])
+        # PLA and PLP read the free slot the stack pointer is on before pulling.
+        self.assertEqual(sum(entry[:2] == ('read', 0x01FE) for entry in bus_log), 2)
+        # Every cycle is a bus access.
+        self.assertEqual(len(bus_log), bus.clock.cycles)
+        self.assertLess(len(cycle_log), cycle.clock.cycles)
+        self.assertEqual(self.state(bus), self.state(cycle))
+
+
+class VariantTestCase(unittest.TestCase):
+    PROGRAM = """
+        LDX #$12
+        LDY #$34
+        PHX
+        PHY
+        PLX             ; swaps X and Y through the stack
+        PLY
+        LDA ($10)
+        STA ($12)
+        BRA skip
+        LDA #$00
+skip:   LDX #$02
+        JMP (jumps,X)
+        BRK
+jumps:  .word 0, done
+done:   JMP ($20FF)
+"""
+
+    def make_cpu(self, accuracy='cycle', variant='65c02', memory=None):
+        memory = RAM64K() if memory is None else memory
+        Assembler(CMOS_65C02.instructions).assemble(self.PROGRAM).load(memory)
+        memory.load(0x0010, bytes([0x00, 0x30, 0x00, 0x31]))
+        memory.load(0x3000, bytes([0x55]))
+        # JMP ($20FF) takes its msb from $2100 on the 65C02 and from $2000 on the NMOS 6502.
+        memory.load(0x20FF, bytes([0x00, 0x04]))
+        memory.load(0x2000, bytes([0x05]))
+        return CPU6502(memory, UnthrottledClock(), accuracy=accuracy, variant=variant)
+
+    def test_variants(self):
+        self.assertIs(CPU6502(RAM64K(), UnthrottledClock()).variant, NMOS_6502)
+        self.assertEqual(NMOS_6502.instructions, INSTRUCTIONS_6502)
+        with self.assertRaises(ValueError):
+            CPU6502(RAM64K(), UnthrottledClock(), variant='65816')
+        # Resolved into the dispatch table, the handlers run no variant checks of their own.
+        nmos = CPU6502(RAM64K(), UnthrottledClock())
+        cmos = CPU6502(RAM64K(), UnthrottledClock(), variant=CMOS_65C02)
+        self.assertEqual(nmos.OPCODES[0x6C][0], nmos.jmp)
+        self.assertEqual(cmos.OPCODES[0x6C][0], cmos.jmp_65c02)
+        self.assertNotIn(0x80, nmos.OPCODES)
+        self.assertEqual(cmos.OPCODES[0x80][0], cmos.bra)
+        # A variant of a variant's own.
+        custom = Variant('no-ora', instructions={opcode: None for opcode, entry in INSTRUCTIONS_6502.items()
+                                                 if entry[0] == 'ora'})
+        cpu = CPU6502(RAM64K(), UnthrottledClock(), variant=custom)
+        self.assertEqual(len(cpu.OPCODES), len(INSTRUCTIONS_6502) - 8)
+
+    def test_65c02_program(self):
+        cycles = []
+        for accuracy in ('bus', 'cycle', 'instruction'):
+            cpu = self.make_cpu(accuracy)
+            while cpu.pc.value not in (0x0400, 0x0500):
+                cpu.execute()
+            self.assertEqual(cpu.pc, Word(0x0400))
+            self.assertEqual((cpu.x, cpu.y, cpu.a, cpu.sp), (Byte(0x02), Byte(0x12), Byte(0x55), Byte(0xFF)))
+            self.assertEqual(cpu.memory[Word(0x3100)], Byte(0x55))
+            cycles.append(cpu.clock.cycles)
+        # 2+2+3+3+4+4+5+5+3+2+6+6
+        self.assertEqual(cycles, [45] * 3)
+
+    def test_jmp_indirect_page_wrap(self):
+        for variant, target, cycles in (('nmos', 0x0500, 5), ('65c02', 0x0400, 6)):
+            cpu = self.make_cpu(variant=variant)
+            cpu.pc = Word(0x0300)
+            cpu.memory.load(0x0300, bytes([0x6C, 0xFF, 0x20]))
+            cpu.execute()
+            self.assertEqual((cpu.pc, cpu.clock.cycles), (Word(target), cycles))
+
+    def test_interrupt_clears_decimal(self):
+        for variant, decimal in (('nmos', 1), ('65c02', 0)):
+            cpu = self.make_cpu(variant=variant)
+            cpu.memory.load(0xFFFE, bytes([0x00, 0x03]))
+            cpu.flags['D'] = Bit(1)
+            cpu.set_irq('test')
+            cpu.execute()
+            self.assertEqual((cpu.pc, cpu.flags['I'].value, cpu.flags['D'].value), (Word(0x0300), 1, decimal))
+
+            cpu.flags['D'] = Bit(1)
+            cpu.memory.load(0x0300, bytes([0x00]))
+            with self.assertRaises(InterruptError):
+                cpu.execute()
+            self.assertEqual(cpu.flags['D'].value, decimal)
+
 
 if __name__ == '__main__':
     unittest.main()
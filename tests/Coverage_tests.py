@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from cpu import CPU6502
+from memory import RAM64K
+from clock import UnthrottledClock
+from exceptions import InterruptError
+from guest_coverage import GuestCoverage, load_symbols
+
+PROGRAM = bytes([
+    0xAD, 0x00, 0x30,  # main:  LDA $3000
+    0xF0, 0x03,        #        BEQ skip
+    0x8D, 0x01, 0x30,  #        STA $3001
+    0x00,              # skip:  BRK
+])
+
+
+class GuestCoverageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_program(self, value):
+        memory = RAM64K()
+        memory.load(0x0200, PROGRAM)
+        memory.load(0x3000, bytes([value]))
+        cpu = CPU6502(memory, UnthrottledClock())
+        coverage = GuestCoverage(cpu)
+        coverage.start()
+        with self.assertRaises(InterruptError):
+            cpu.run_until(1000)
+        coverage.stop()
+        return cpu, coverage
+
+    def test_maps(self):
+        cpu, coverage = self.run_program(0)
+        self.assertEqual([address for address in range(0x10000) if coverage.executed[address]],
+                         [0x0200, 0x0203, 0x0208])
+        self.assertEqual(coverage.read[0x3000], 1)
+        self.assertEqual(coverage.written.count(1), 0)
+        self.assertEqual(cpu.execute, cpu._plain_execute)
+        self.assertEqual(cpu.execute.__name__, 'execute')
+
+    def test_works_with_breakpoints(self):
+        memory = RAM64K()
+        memory.load(0x0200, PROGRAM)
+        cpu = CPU6502(memory, UnthrottledClock())
+        cpu.add_breakpoint(0x0203)
+        coverage = GuestCoverage(cpu)
+        coverage.start()
+        cpu.execute()
+        cpu.remove_breakpoint(0x0203)
+        cpu.execute()
+        self.assertEqual(coverage.executed[0x0203], 1)
+
+    def test_merge_files_and_report(self):
+        paths = []
+        for value in (0, 1):
+            _, coverage = self.run_program(value)
+            paths.append(os.path.join(self.directory.name, f'{value}.cov'))
+            coverage.save(paths[-1])
+        merged = GuestCoverage.merge_files(paths)
+        self.assertEqual(merged.executed.count(1), 4)
+        self.assertEqual(merged.written[0x3001], 1)
+
+        symbols_path = os.path.join(self.directory.name, 'labels.txt')
+        with open(symbols_path, 'w') as f:
+            f.write('main = $0200\n; comment\nal C:0208 .skip\n$0300 unused\n')
+        symbols = load_symbols(symbols_path)
+        self.assertEqual(symbols, {0x0200: 'main', 0x0208: 'skip', 0x0300: 'unused'})
+
+        routines = merged.routines(symbols)
+        self.assertEqual(routines[0], ('main', 0x0200, 0x0207, 3, 0, 0))
+        self.assertEqual(routines[1], ('skip', 0x0208, 0x02FF, 1, 0, 0))
+        report = merged.report(symbols)
+        self.assertIn('* main', report)
+        self.assertIn('  unused', report)
+        self.assertIn('2 of 3 symbols entered', report)
+
+    def test_load_rejects_other_files(self):
+        path = os.path.join(self.directory.name, 'bad.cov')
+        with open(path, 'wb') as f:
+            f.write(b'nonsense')
+        with self.assertRaises(ValueError):
+            GuestCoverage.load(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,523 @@
+import asyncio
+import io
+import json
+import os
+import socket
+import time
+import tempfile
+import unittest
+import zlib
+from cpu import CPU6502, CMOS_65C02
+from memory import RAM64K, Bus
+from data_types import Word, Byte, Bit
+from devices import Device
+from clock import UnthrottledClock
+from exceptions import InterruptError
+from via import VIA6522
+from acia import ACIA6551
+from framebuffer import Framebuffer, FrameRecorder
+from async_driver import AsyncACIA6551, run_async
+from clock import Clock
+from replay import InputRecorder, Replayer, decode_log, MAGIC, SKIP
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class LatchDevice(Device):
+    """Register 0 reads back the low byte of the cycle the device was last synced to, register 1 is a plain latch."""
+    def __init__(self, clock, base):
+        super().__init__(clock, base, 2)
+        self.latch = 0
+        self.catch_ups = []
+        self.deadlines = []
+
+    def catch_up(self, start, end):
+        self.catch_ups.append((start, end))
+
+    def on_deadline(self, cycle):
+        self.deadlines.append(cycle)
+
+    def read(self, offset):
+        return self.synced_cycle & 0xFF if offset == 0 else self.latch
+
+    def write(self, offset, value):
+        self.latch = value
+
+
+class BusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = UnthrottledClock()
+        self.ram = RAM64K()
+        self.bus = Bus(self.ram, self.clock)
+        self.device = self.bus.attach(LatchDevice(self.clock, 0x6000))
+
+    def test_unmapped_addresses_reach_backing_memory(self):
+        self.bus[Word(0x6002)] = Byte(0x11)
+
+        self.assertEqual(self.ram[Word(0x6002)], Byte(0x11))
+        self.assertEqual(self.bus[Word(0x6002)], Byte(0x11))
+        self.assertEqual(self.device.catch_ups, [])
+
+    def test_overlapping_attach_rejected(self):
+        with self.assertRaises(ValueError):
+            self.bus.attach(LatchDevice(self.clock, 0x6001))
+
+    def test_detach(self):
+        self.bus.detach(self.device)
+        self.bus[Word(0x6001)] = Byte(0x22)
+
+        self.assertEqual(self.ram[Word(0x6001)], Byte(0x22))
+        self.assertFalse(self.bus.is_device_page(0x6000))
+
+    def test_device_synced_only_on_access(self):
+        # LDA #$5A
+        self.ram[Word(0x0200)] = Byte(0xA9)
+        self.ram[Word(0x0201)] = Byte(0x5A)
+        # STA $6001
+        self.ram[Word(0x0202)] = Byte(0x8D)
+        self.ram[Word(0x0203)] = Byte(0x01)
+        self.ram[Word(0x0204)] = Byte(0x60)
+        # LDX $6000
+        self.ram[Word(0x0205)] = Byte(0xAE)
+        self.ram[Word(0x0206)] = Byte(0x00)
+        self.ram[Word(0x0207)] = Byte(0x60)
+        cpu = CPU6502(self.bus, self.clock)
+        cpu.run_until(10)
+
+        self.assertEqual(self.device.latch, 0x5A)
+        # Synced on the store at cycle 6 and the load at cycle 10, nothing in between.
+        self.assertEqual(self.device.catch_ups, [(0, 6), (6, 10)])
+        self.assertEqual(cpu.x, Byte(10))
+
+    def test_deadline(self):
+        self.device.schedule_deadline(50)
+        self.device.schedule_deadline(40)
+        cpu = CPU6502(self.bus, self.clock)
+        # JMP $0200
+        self.ram[Word(0x0200)] = Byte(0x4C)
+        self.ram[Word(0x0201)] = Byte(0x00)
+        self.ram[Word(0x0202)] = Byte(0x02)
+        cpu.run_until(100)
+
+        self.assertEqual(self.device.deadlines, [40])
+        self.assertEqual(self.device.catch_ups, [(0, 40)])
+
+
+class VIA6522TestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = UnthrottledClock()
+        self.ram = RAM64K()
+        self.bus = Bus(self.ram, self.clock)
+        self.irqs = []
+        self.via = self.bus.attach(VIA6522(self.clock, 0x6000, irq=lambda source, asserted: self.irqs.append(
+            (self.clock.cycles, asserted))))
+
+    def at(self, cycle):
+        self.clock.cycles = cycle
+        self.clock.events.run_due(cycle)
+
+    def test_one_shot_timer_is_computed_not_ticked(self):
+        self.at(100)
+        self.bus[Word(0x600E)] = Byte(0xC0)
+        self.bus[Word(0x6004)] = Byte(0x10)
+        self.bus[Word(0x6005)] = Byte(0x00)
+
+        self.assertEqual(self.clock.events.next_cycle, 118)
+        self.at(110)
+        self.assertEqual(self.bus[Word(0x6005)], Byte(0x00))
+        self.assertEqual(self.bus[Word(0x600D)], Byte(0x00))
+        self.at(118)
+        self.assertEqual(self.irqs, [(118, True)])
+        self.assertEqual(self.bus[Word(0x600D)], Byte(0xC0))
+        # Reading T1C-L acknowledges the interrupt, the counter has wrapped past 0.
+        self.assertEqual(self.bus[Word(0x6004)], Byte(0xFF))
+        self.assertEqual(self.irqs, [(118, True), (118, False)])
+        # One-shot, nothing else is scheduled.
+        self.assertEqual(self.clock.events.next_cycle, float('inf'))
+
+    def test_free_running_timer_schedules_only_unacknowledged_underflows(self):
+        self.bus[Word(0x600B)] = Byte(0x40)
+        self.bus[Word(0x6004)] = Byte(0x0A)
+        self.bus[Word(0x6005)] = Byte(0x00)
+        # Loaded on cycle 1, underflows on 12, 24, 36, ...
+        self.assertEqual(self.clock.events.next_cycle, 12)
+        self.at(12)
+        self.assertEqual(self.clock.events.next_cycle, float('inf'))
+        self.at(1000)
+        self.assertEqual(self.bus[Word(0x600D)], Byte(0x40))
+        # 1000 is 4 cycles after the underflow on 996, acknowledging schedules the one on 1008.
+        self.assertEqual(self.bus[Word(0x6004)], Byte(0x07))
+        self.assertEqual(self.clock.events.next_cycle, 1008)
+        self.assertEqual(self.irqs, [])
+
+    def load(self, address, program):
+        for offset, value in enumerate(program):
+            self.ram[Word(address + offset)] = Byte(value)
+
+    def test_irq_driven_firmware(self):
+        cycles = []
+        for idle_skip in (False, True):
+            self.setUp()
+            self.load(0xFFFE, [0x00, 0x03])
+            self.load(0x0200, [
+                0xA9, 0xC0, 0x8D, 0x0E, 0x60,  # LDA #$C0, STA IER
+                0xA9, 0x00, 0x8D, 0x04, 0x60,  # LDA #$00, STA T1C-L
+                0xA9, 0x40, 0x8D, 0x05, 0x60,  # LDA #$40, STA T1C-H
+                0x58,                          # CLI
+                0x4C, 0x10, 0x02,              # JMP $0210
+            ])
+            # IRQ handler: LDA T1C-L, BRK
+            self.load(0x0300, [0xAD, 0x04, 0x60])
+            cpu = CPU6502(self.bus, self.clock, idle_skip=idle_skip)
+            self.via.irq = cpu.set_irq
+            with self.assertRaises(InterruptError):
+                while True:
+                    cpu.execute()
+            cycles.append(self.clock.cycles)
+            self.assertEqual(cpu.interrupts_serviced, 1)
+            self.assertFalse(self.via.ifr)
+            self.assertEqual(cpu.idle_cycles_skipped > 0, idle_skip)
+
+        self.assertEqual(cycles[0], cycles[1])
+        # T1C-H is written on cycle 18 and the underflow flagged 0x4000 + 2 cycles later.
+        self.assertGreater(cycles[0], 18 + 0x4002)
+        self.assertLess(cycles[0], 18 + 0x4002 + 20)
+
+class ACIA6551TestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = UnthrottledClock()
+        self.ram = RAM64K()
+        self.bus = Bus(self.ram, self.clock)
+        self.rx_read, self.rx_write = os.pipe()
+        self.tx_read, self.tx_write = os.pipe()
+        self.acia = self.bus.attach(ACIA6551(self.clock, 0x5000, rx=self.rx_read, tx=self.tx_write))
+
+    def tearDown(self):
+        for fd in (self.rx_read, self.rx_write, self.tx_read, self.tx_write):
+            os.close(fd)
+
+    def test_guest_output_is_batched(self):
+        # LDA #'H', STA $5000, LDA #'i', STA $5000, BRK
+        for offset, value in enumerate([0xA9, 0x48, 0x8D, 0x00, 0x50, 0xA9, 0x69, 0x8D, 0x00, 0x50]):
+            self.ram[Word(0x0200 + offset)] = Byte(value)
+        cpu = CPU6502(self.bus, self.clock)
+        with self.assertRaises(InterruptError):
+            while True:
+                cpu.execute()
+
+        self.assertEqual(self.acia.tx_syscalls, 0)
+        self.acia.flush()
+        self.assertEqual(os.read(self.tx_read, 100), b'Hi')
+        self.assertEqual(self.acia.tx_syscalls, 1)
+
+        for _ in range(10_000):
+            self.bus[Word(0x5000)] = Byte(0x2E)
+        self.acia.close()
+        self.assertEqual(self.acia.stats()['tx_bytes'], 10_002)
+        self.assertEqual(self.acia.stats()['tx_syscalls'], 4)
+        self.assertEqual(len(os.read(self.tx_read, 20_000)), 10_000)
+
+    def test_close_restores_blocking(self):
+        self.assertFalse(os.get_blocking(self.rx_read))
+        self.assertFalse(os.get_blocking(self.tx_write))
+        self.acia.close()
+        self.assertTrue(os.get_blocking(self.rx_read))
+        self.assertTrue(os.get_blocking(self.tx_write))
+
+        # A descriptor that was already non-blocking stays that way, one used both ways is recorded once.
+        os.set_blocking(self.tx_write, False)
+        with ACIA6551(self.clock, 0x6000, rx=self.rx_read, tx=self.rx_read):
+            self.assertFalse(os.get_blocking(self.rx_read))
+        self.assertTrue(os.get_blocking(self.rx_read))
+        with ACIA6551(self.clock, 0x6000, tx=self.tx_write):
+            pass
+        self.assertFalse(os.get_blocking(self.tx_write))
+
+    def test_flush_interval(self):
+        self.bus[Word(0x5000)] = Byte(0x41)
+        self.clock.cycles = self.acia.flush_interval
+        self.clock.events.run_due(self.clock.cycles)
+
+        self.assertEqual(os.read(self.tx_read, 100), b'A')
+
+    def test_receive_polls_host_in_chunks(self):
+        os.write(self.rx_write, b'abc')
+        received = []
+        for cycle in range(0, 5000, 10):
+            self.clock.cycles = cycle
+            if self.bus[Word(0x5001)].value & 0x08:
+                received.append(self.bus[Word(0x5000)].value)
+
+        self.assertEqual(bytes(received), b'abc')
+        self.assertEqual(self.acia.rx_bytes, 3)
+        # One read for the data, then at most one poll every poll_interval cycles while idle.
+        self.assertLessEqual(self.acia.rx_syscalls, 6)
+
+    def test_receive_interrupt(self):
+        irqs = []
+        self.acia.irq = lambda source, asserted: irqs.append(asserted)
+        # DTR on, receiver interrupts enabled
+        self.bus[Word(0x5002)] = Byte(0x01)
+        os.write(self.rx_write, b'x')
+        self.clock.cycles = self.acia.poll_interval
+        self.clock.events.run_due(self.clock.cycles)
+
+        self.assertEqual(irqs, [True])
+        self.assertEqual(self.bus[Word(0x5001)], Byte(0x98))
+        self.assertEqual(self.bus[Word(0x5000)], Byte(ord('x')))
+        self.assertEqual(irqs, [True, False])
+
+
+class FramebufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = UnthrottledClock()
+        self.bus = Bus(RAM64K(), self.clock)
+        self.framebuffer = self.bus.attach(Framebuffer(self.clock, 0x4000, 16, 4, bits_per_pixel=2,
+                                                       palette=[(0, 0, 0), (255, 0, 0), (0, 255, 0), (0, 0, 255)]))
+
+    def test_writes_mark_rows_dirty(self):
+        self.framebuffer._dirty[:] = bytes(4)
+        # Four bytes per row at 2 bits per pixel
+        self.bus[Word(0x4009)] = Byte(0x1B)
+
+        self.assertEqual(self.framebuffer.dirty_rows(), [2])
+        self.assertEqual(self.bus[Word(0x4009)], Byte(0x1B))
+        self.assertEqual(self.bus.volatile_reads, 0)
+
+    def test_invalid_depth(self):
+        with self.assertRaises(ValueError):
+            Framebuffer(self.clock, 0x4000, 16, 4, bits_per_pixel=3)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_render_dirty_rows(self):
+        self.framebuffer.render()
+        self.bus[Word(0x4009)] = Byte(0x1B)
+        frame = self.framebuffer.render()
+
+        self.assertEqual(self.framebuffer.rows_rendered, 5)
+        self.assertEqual(frame[2, 4:8].tolist(), [[0, 0, 0], [255, 0, 0], [0, 255, 0], [0, 0, 255]])
+        self.assertFalse(frame[0].any())
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_dump_frames(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ppm = os.path.join(directory, 'frame.ppm')
+            png = os.path.join(directory, 'frame.png')
+            self.framebuffer.write_ppm(ppm)
+            self.framebuffer.write_png(png)
+            with open(ppm, 'rb') as f:
+                self.assertEqual(f.read(), b'P6\n16 4\n255\n' + bytes(16 * 4 * 3))
+            with open(png, 'rb') as f:
+                self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_recorder(self):
+        stream = io.BytesIO()
+        recorder = FrameRecorder(self.framebuffer, stream, 1000)
+        recorder.start()
+        self.clock.cycles = 3500
+        self.clock.events.run_due(self.clock.cycles)
+
+        self.assertEqual(recorder.frames, 3)
+        self.assertEqual(len(stream.getvalue()), 3 * 16 * 4 * 3)
+
+
+class ReplayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = UnthrottledClock()
+        self.ram = RAM64K()
+        self.bus = Bus(self.ram, self.clock)
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def record(self, cpu, recorder, cycles):
+        recorder.start()
+        cpu.run_until(cycles)
+        recorder.stop()
+        recorder.save(self.path)
+
+        replayer = Replayer(self.path)
+        replayer.run()
+        expected = cpu.save_state()
+        state = replayer.cpu.save_state()
+        self.assertEqual(len(state['irq_sources']), len(expected['irq_sources']))
+        del state['irq_sources'], expected['irq_sources']
+        self.assertEqual(state, expected)
+        return replayer
+
+    def test_reads_and_interrupts(self):
+        self.ram.load(0x0200, bytes([
+            0x58,              # CLI
+            0xAD, 0x00, 0x30,  # LDA $3000
+            0x85, 0x10,        # STA $10
+            0x4C, 0x01, 0x02,  # JMP $0201
+        ]))
+        self.ram.load(0x0300, bytes([
+            0xAD, 0x04, 0x40,  # LDA $4004
+            0x85, 0x11,        # STA $11
+            0x40,              # RTI
+        ]))
+        self.ram.load(0xFFFE, bytes([0x00, 0x03]))
+        cpu = CPU6502(self.bus, self.clock)
+        recorder = InputRecorder(cpu)
+        self.bus.attach(LatchDevice(self.clock, 0x3000))
+        via = self.bus.attach(VIA6522(self.clock, 0x4000, irq=cpu.set_irq))
+        via.write(0xB, 0x40)
+        via.write(0x4, 100)
+        via.write(0x5, 0)
+        via.write(0xE, 0xC0)
+
+        replayer = self.record(cpu, recorder, 5000)
+        self.assertGreater(cpu.interrupts_serviced, 10)
+        self.assertEqual(replayer.cpu.interrupts_serviced, cpu.interrupts_serviced)
+
+    def test_idle_skips(self):
+        self.ram.load(0x0200, bytes([
+            0xAD, 0x0D, 0x40,  # LDA $400D
+            0xF0, 0xFB,        # BEQ $0200
+            0xAE, 0x04, 0x40,  # LDX $4004
+            0xA9, 0x00,        # LDA #$00
+            0x8D, 0x05, 0x40,  # STA $4005
+            0x4C, 0x00, 0x02,  # JMP $0200
+        ]))
+        cpu = CPU6502(self.bus, self.clock, idle_skip=True)
+        recorder = InputRecorder(cpu)
+        via = self.bus.attach(VIA6522(self.clock, 0x4000, irq=cpu.set_irq))
+        via.write(0x4, 0xFF)
+        via.write(0x5, 0x03)
+
+        self.record(cpu, recorder, 20_000)
+        self.assertGreater(cpu.idle_cycles_skipped, 10_000)
+        self.assertIn(SKIP, [entry[1] for entry in decode_log(recorder.log)])
+
+    def test_bus_accuracy(self):
+        self.ram.load(0x0200, bytes([
+            0xA2, 0x20,        # LDX #$20
+            0xBD, 0xE0, 0x30,  # LDA $30E0,X, the dummy read of $3000 reaches the latch
+            0x8D, 0x01, 0x30,  # STA $3001
+            0xAD, 0x00, 0x30,  # LDA $3000
+            0x4C, 0x00, 0x02,  # JMP $0200
+        ]))
+        cpu = CPU6502(self.bus, self.clock, accuracy='bus')
+        recorder = InputRecorder(cpu)
+        self.bus.attach(LatchDevice(self.clock, 0x3000))
+
+        replayer = self.record(cpu, recorder, 1000)
+        self.assertEqual(replayer.cpu.accuracy, 'bus')
+
+    def test_65c02(self):
+        self.ram.load(0x0200, bytes([
+            0xA2, 0x05,        # LDX #$05
+            0xDA,              # PHX
+            0xFA,              # PLX
+            0xAD, 0x00, 0x30,  # LDA $3000
+            0x80, 0xF9,        # BRA $0202
+        ]))
+        cpu = CPU6502(self.bus, self.clock, variant='65c02')
+        recorder = InputRecorder(cpu)
+        self.bus.attach(LatchDevice(self.clock, 0x3000))
+
+        replayer = self.record(cpu, recorder, 1000)
+        self.assertIs(replayer.cpu.variant, CMOS_65C02)
+
+    def test_divergence_is_detected(self):
+        self.ram.load(0x0200, bytes([0xAD, 0x00, 0x30, 0x4C, 0x00, 0x02]))
+        cpu = CPU6502(self.bus, self.clock)
+        recorder = InputRecorder(cpu)
+        self.bus.attach(LatchDevice(self.clock, 0x3000))
+        recorder.start()
+        cpu.run_until(100)
+        recorder.stop()
+        recorder.save(self.path)
+
+        replayer = Replayer(self.path)
+        replayer.memory.load(0x0200, bytes([0xAD, 0x01, 0x30]))
+        with self.assertRaises(RuntimeError):
+            replayer.run()
+
+    def test_header_is_json(self):
+        self.ram.load(0x0200, bytes([0xEA, 0x4C, 0x00, 0x02]))
+        cpu = CPU6502(self.bus, self.clock)
+        recorder = InputRecorder(cpu)
+        via = self.bus.attach(VIA6522(self.clock, 0x4000, irq=cpu.set_irq))
+        # Held off by I, so the source is still pending in the initial state.
+        cpu.flags['I'] = Bit(1)
+        cpu.set_irq(via)
+        self.record(cpu, recorder, 100)
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.readline(), MAGIC)
+            header = json.loads(f.readline())
+        state = header['initial_state']
+        self.assertEqual(state['irq_sources'], [0])
+        self.assertEqual(zlib.decompress(bytes.fromhex(state['memory']))[0x0200], 0xEA)
+        self.assertEqual(header['devices'], [[0x4000, via.size, sorted(via.stable_registers)]])
+        self.assertEqual(header['variant'], 'nmos')
+        self.assertEqual(header['accuracy'], 'cycle')
+        self.assertEqual(header['end_cycle'], cpu.clock.cycles)
+
+
+class AsyncDriverTestCase(unittest.TestCase):
+    ECHO = bytes([
+        0xAD, 0x01, 0x50,        # LDA $5001
+        0x4A, 0x4A, 0x4A, 0x4A,  # LSR x4, RDRF into C
+        0x90, 0xF7,              # BCC $0200
+        0xAD, 0x00, 0x50,        # LDA $5000
+        0x8D, 0x00, 0x50,        # STA $5000
+        0x4C, 0x00, 0x02,        # JMP $0200
+    ])
+
+    async def echo_session(self, message):
+        guest, host = socket.socketpair()
+        reader, writer = await asyncio.open_connection(sock=guest)
+        host_reader, host_writer = await asyncio.open_connection(sock=host)
+
+        clock = UnthrottledClock()
+        ram = RAM64K()
+        ram.load(0x0200, self.ECHO)
+        bus = Bus(ram, clock)
+        acia = bus.attach(AsyncACIA6551(clock, 0x5000, reader, writer))
+        cpu = CPU6502(bus, clock)
+        emulator = asyncio.create_task(run_async(cpu, devices=[acia], idle_timeout=0.01))
+
+        host_writer.write(message)
+        echoed = await asyncio.wait_for(host_reader.readexactly(len(message)), 5)
+        emulator.cancel()
+        for stream in (writer, host_writer):
+            stream.close()
+        return echoed, acia
+
+    def test_emulators_share_a_loop(self):
+        async def main():
+            return await asyncio.gather(*(self.echo_session(f'hello {i}'.encode()) for i in range(4)))
+
+        for i, (echoed, acia) in enumerate(asyncio.run(main())):
+            self.assertEqual(echoed, f'hello {i}'.encode())
+            self.assertEqual(acia.rx_bytes, len(echoed))
+            # Output leaves in batches, not a write per byte.
+            self.assertLess(acia.tx_syscalls, acia.tx_bytes)
+
+    def test_frequency(self):
+        clock = UnthrottledClock()
+        ram = RAM64K()
+        ram.load(0x0200, bytes([0x4C, 0x00, 0x02]))
+        cpu = CPU6502(ram, clock)
+        started = time.perf_counter()
+        asyncio.run(run_async(cpu, slice_cycles=1000, until=10_000, frequency=100_000))
+        self.assertEqual(clock.cycles, 10_002)
+        self.assertGreater(time.perf_counter() - started, 0.08)
+
+    def test_needs_unthrottled_clock(self):
+        cpu = CPU6502(RAM64K(), Clock(1000))
+        with self.assertRaises(ValueError):
+            asyncio.run(run_async(cpu))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import time
+import unittest
+from addressing_modes import operand_lengths_6502
+from cpu import INSTRUCTIONS_6502, CMOS_65C02
+from memory import RAM64K
+from assembler import Assembler, assemble
+from disassembler import analyze, clear_cache, decode, disassemble, rom_hash, vectors
+
+ROM = """
+        .org $8000
+reset:  CLI
+        LDX #$00
+wait:   LDA $10
+        BEQ wait
+        BMI negative
+        JMP (handler)
+negative:
+        LDA #$FF
+        JMP reset
+table:  .byte $FF, $FF, $02     ; data, never reached
+
+irq:    PHA
+        LDA $4000
+        STA $10
+        PLA
+        RTI
+nmi:    RTI
+
+handler: .word reset
+        .org $FFFA
+        .word nmi, reset, irq
+"""
+
+
+class DisassemblerTestCase(unittest.TestCase):
+    def setUp(self):
+        clear_cache()
+        self.program = assemble(ROM)
+        self.image = self.program.image()
+        self.symbols = self.program.symbols
+
+    def test_round_trip(self):
+        # Every opcode comes back out as source that assembles to the same bytes.
+        for table in (INSTRUCTIONS_6502, CMOS_65C02.instructions):
+            assembler = Assembler(table)
+            for opcode, (name, mode, _) in table.items():
+                operand = b'\xFE' if mode == 'relative' else b'\x34\x12'[:operand_lengths_6502[mode]]
+                data = bytes([opcode]) + operand
+                instruction = decode(data, 0x0200, base=0x0200, instructions=table)
+                self.assertEqual((instruction.name, instruction.mode, instruction.length), (name, mode, len(data)))
+                self.assertEqual(assembler.assemble(instruction.text()).segments[0][1], data, instruction.text())
+
+    def test_linear(self):
+        listing = disassemble(self.image, 0x8000, self.symbols['table'], base=0x8000)
+        self.assertEqual([instruction.text() for instruction in listing[:4]],
+                         ['CLI', 'LDX #$00', 'LDA $10', 'BEQ $8003'])
+        self.assertEqual(listing[-1].text(), f'JMP ${self.symbols["reset"]:04X}')
+        self.assertEqual(decode(bytes([0x02]), 0).text(), '.byte $02')
+        # Runs off the end of the image.
+        self.assertIsNone(decode(bytes([0xAD, 0x00]), 0))
+
+    def test_cfg(self):
+        symbols = self.symbols
+        graph = analyze(self.image, base=0x8000)
+        self.assertEqual(vectors(self.image, 0x8000), {'reset': symbols['reset'], 'irq': symbols['irq'],
+                                                       'nmi': symbols['nmi']})
+        self.assertEqual(graph.entries['reset'], 0x8000)
+
+        starts = sorted(graph.blocks)
+        self.assertEqual(starts, [0x8000, symbols['wait'], symbols['wait'] + 4, symbols['wait'] + 6,
+                                  symbols['negative'], symbols['irq'], symbols['nmi']])
+        wait = graph.blocks[symbols['wait']]
+        self.assertEqual(wait.successors, [symbols['wait'], symbols['wait'] + 4])
+        self.assertEqual(graph.blocks[symbols['wait'] + 4].successors, [symbols['negative'], symbols['wait'] + 6])
+        # JMP (handler) is only known at run time.
+        self.assertEqual(graph.blocks[symbols['wait'] + 6].successors, [])
+        self.assertEqual(graph.indirect_jumps, [symbols['wait'] + 6])
+        self.assertEqual(graph.blocks[symbols['negative']].successors, [0x8000])
+        self.assertEqual(graph.blocks[symbols['irq']].successors, [])
+        self.assertEqual(len(graph.blocks[symbols['irq']].instructions), 5)
+        # The table after the jump is data.
+        self.assertIsNone(graph.block_at(symbols['table']))
+        self.assertIs(graph.block_at(symbols['wait'] + 2), wait)
+        self.assertEqual(sorted(graph.predecessors(symbols['wait'])), [0x8000, symbols['wait']])
+        self.assertIn((symbols['negative'], 0x8000), graph.edges())
+
+        listing = graph.listing()
+        self.assertIn('L_8000:  ; reset', listing)
+        self.assertIn('        BMI $', listing)
+        self.assertIn(f'b8000 -> b{symbols["wait"]:04X};', graph.to_dot())
+
+    def test_entries_and_edges_of_the_image(self):
+        image = assemble("""
+        BCC $0250
+        .byte $02
+        """).image()
+        graph = analyze(image, {'start': 0x0200}, base=0x0200)
+        self.assertEqual(graph.external, {0x0250})
+        self.assertEqual(graph.invalid, [0x0202])
+        self.assertEqual(graph.blocks[0x0200].successors, [0x0250, 0x0202])
+
+    def test_memoized_per_rom(self):
+        memory = RAM64K()
+        self.program.load(memory)
+        graph = analyze(memory)
+        self.assertIs(analyze(memory.dump(0, 0x10000)), graph)
+        self.assertIsNot(analyze(memory, cache=False), graph)
+        self.assertEqual(rom_hash(memory), rom_hash(memory.dump(0, 0x10000)))
+        memory.load(self.symbols['negative'], b'\xEA')
+        changed = analyze(memory)
+        self.assertIsNot(changed, graph)
+        # LDA #$FF is now a NOP followed by an unknown opcode.
+        self.assertEqual(changed.invalid, [self.symbols['negative'] + 1])
+        self.assertEqual(graph.invalid, [])
+
+    def test_full_address_space_is_fast(self):
+        # A NOP sled over the whole address space, and a branch every other byte, all of it reachable.
+        for image in (bytes([0xEA]) * 0x10000, bytes([0xD0, 0x00]) * 0x8000):
+            started = time.perf_counter()
+            graph = analyze(image, {'start': 0})
+            self.assertLess(time.perf_counter() - started, 1.0)
+            self.assertEqual(sum(len(block.instructions) for block in graph.blocks.values()),
+                             len(graph.instructions))
+            self.assertEqual(graph.external, {0x10000})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from cpu import CPU6502
+from memory import RAM64K
+from clock import UnthrottledClock
+from fuzz import Fuzzer, fuzz_parallel
+
+# Checks the input at $0300 starts with 'FUZ' through lookup tables, then runs the undefined opcode $02.
+PARSER = bytes([
+    0xAE, 0x00, 0x03,  # LDX $0300
+    0xBD, 0x00, 0x04,  # LDA $0400,X
+    0xF0, 0x11,        # BEQ $0219
+    0xAE, 0x01, 0x03,  # LDX $0301
+    0xBD, 0x00, 0x05,  # LDA $0500,X
+    0xF0, 0x09,        # BEQ $0219
+    0xAE, 0x02, 0x03,  # LDX $0302
+    0xBD, 0x00, 0x06,  # LDA $0600,X
+    0xF0, 0x01,        # BEQ $0219
+    0x02,
+    0x00,              # BRK
+])
+
+
+def make_parser(**options):
+    memory = RAM64K()
+    memory.load(0x0200, PARSER)
+    for table, character in zip((0x0400, 0x0500, 0x0600), b'FUZ'):
+        memory.load(table + character, b'\x01')
+    return CPU6502(memory, UnthrottledClock(), **options)
+
+
+class FuzzerTestCase(unittest.TestCase):
+    def test_finds_crash(self):
+        fuzzer = Fuzzer(make_parser(), 0x0300, 8, max_cycles=1000, seed=1)
+        for _ in range(20):
+            fuzzer.fuzz(1000)
+            if fuzzer.crashes:
+                break
+
+        self.assertTrue(fuzzer.crashes)
+        for data, error in fuzzer.crashes.items():
+            self.assertTrue(data.startswith(b'FUZ'))
+            self.assertEqual(error, 'KeyError(2)')
+        # Empty seed plus one entry for each character matched.
+        self.assertGreaterEqual(len(fuzzer.corpus), 3)
+        self.assertGreater(fuzzer.edges_covered(), 5)
+
+    def test_snapshot_is_restored(self):
+        cpu = make_parser()
+        fuzzer = Fuzzer(cpu, 0x0300, 8, max_cycles=1000)
+        fuzzer.run_input(b'FUZ')
+        fuzzer.run_input(b'A')
+        self.assertEqual(cpu.memory[0x0301].value, 0)
+        self.assertEqual(fuzzer.run_input(b'FUZZ'), 'crash')
+        self.assertEqual(fuzzer.run_input(b''), 'ok')
+
+    def test_trace_with_fusion(self):
+        # LDX then LDA is fused, the trace still sees the LDA.
+        traces = []
+        for options in ({}, {'fusion': [(0xAE, 0xBD)]}):
+            fuzzer = Fuzzer(make_parser(**options), 0x0300, 8, max_cycles=1000)
+            fuzzer.run_input(b'FUZ')
+            traces.append(set(fuzzer.trace))
+        self.assertEqual(traces[1], traces[0])
+
+    def test_hang(self):
+        cpu = make_parser()
+        # JMP $0200
+        cpu.memory.load(0x0200, bytes([0x4C, 0x00, 0x02]))
+        fuzzer = Fuzzer(cpu, 0x0300, 8, max_cycles=300)
+        self.assertEqual(fuzzer.run_input(b'x'), 'hang')
+        self.assertEqual(fuzzer.hangs, [b'x'])
+
+    def test_parallel(self):
+        fuzzer = Fuzzer(make_parser(), 0x0300, 8, max_cycles=1000, seed=2)
+        fuzz_parallel(fuzzer, workers=2, rounds=3, executions=500)
+
+        self.assertEqual(fuzzer.executions, 1 + 2 * 3 * 500)
+        self.assertGreaterEqual(len(fuzzer.corpus), 2)
+        self.assertEqual(len(fuzzer.corpus), len(set(fuzzer.corpus)))
+
+
+if __name__ == '__main__':
+    unittest.main()
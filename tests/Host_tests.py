@@ -0,0 +1,186 @@
+import os
+import unittest
+from cpu import CPU6502
+from memory import RAM64K
+from clock import Clock, UnthrottledClock
+from host import EmulatorHost
+from multicore import MultiCoreSystem
+from data_types import Word, Byte
+
+
+def make_cpu(program=(0x4C, 0x00, 0x02)):
+    """JMP $0200 unless given another program to load at $0200."""
+    memory = RAM64K()
+    memory.load(0x0200, bytes(program))
+    return CPU6502(memory, UnthrottledClock())
+
+
+def exit_worker():
+    os._exit(3)
+
+
+class EmulatorHostTestCase(unittest.TestCase):
+    def test_priorities_share_cycles(self):
+        host = EmulatorHost(workers=1, slice_cycles=300)
+        host.add_session(make_cpu, name='low')
+        host.add_session(make_cpu, name='high', priority=3)
+        host.run(cycles=24_000)
+
+        report = host.utilization()
+        self.assertAlmostEqual(report['low']['share'], 0.25, delta=0.02)
+        self.assertAlmostEqual(report['high']['share'], 0.75, delta=0.02)
+        self.assertEqual(report['low']['state'], 'ready')
+
+    def test_quota_and_halt(self):
+        host = EmulatorHost(workers=2, slice_cycles=1000)
+        quota = host.add_session(make_cpu, quota=5000)
+        # LDA #$01, BRK
+        halting = host.add_session(make_cpu, (0xA9, 0x01, 0x00))
+        host.run()
+
+        self.assertEqual(quota.state, 'quota')
+        self.assertEqual(quota.cycles, 5001)
+        self.assertEqual(halting.state, 'halted')
+        # LDA and the BRK opcode fetch
+        self.assertEqual(halting.cycles, 3)
+
+    def test_duration(self):
+        host = EmulatorHost(workers=2, slice_cycles=1000)
+        for _ in range(4):
+            host.add_session(make_cpu)
+        host.run(duration=0.2)
+
+        self.assertGreater(host.elapsed_seconds, 0.15)
+        for report in host.utilization().values():
+            self.assertGreater(report['cycles'], 0)
+
+    def test_processes(self):
+        with EmulatorHost(workers=2, mode='process', slice_cycles=1000) as host:
+            for _ in range(4):
+                host.add_session(make_cpu, quota=3000)
+            host.run()
+
+        for report in host.utilization().values():
+            self.assertEqual(report['state'], 'quota')
+            self.assertGreaterEqual(report['cycles'], 3000)
+            self.assertGreater(report['busy_seconds'], 0)
+
+    def test_processes_keep_sessions_between_runs(self):
+        program = (
+            0xA9, 0x80,        # LDA #$80
+            0x85, 0x10,        # STA $10
+            0x46, 0x10,        # LSR $10
+            0xF0, 0x03,        # BEQ $020B
+            0x4C, 0x04, 0x02,  # JMP $0204
+            0x00,              # BRK
+        )
+        with EmulatorHost(workers=1, mode='process', slice_cycles=20) as host:
+            session = host.add_session(make_cpu, program)
+            host.run(cycles=40)
+            self.assertEqual(session.state, 'ready')
+            self.assertLess(session.cycles, 84)
+            host.run()
+            # The second run carries on, 5 cycles to set up, 8 loops of 10 less the last JMP and 1 more for the taken
+            # BEQ, and the BRK fetch. Starting over would have taken 84 more.
+            self.assertEqual(session.state, 'halted')
+            self.assertEqual(session.cycles, 84)
+
+    def test_dead_worker(self):
+        host = EmulatorHost(workers=1, mode='process')
+        host.add_session(exit_worker)
+        with self.assertRaises(RuntimeError):
+            host.run()
+        self.assertEqual(host._workers, [])
+
+    def test_needs_unthrottled_clock(self):
+        host = EmulatorHost()
+        with self.assertRaises(ValueError):
+            host.add_session(lambda: CPU6502(RAM64K(), Clock(1000)))
+
+
+class MultiCoreSystemTestCase(unittest.TestCase):
+    PRODUCER = bytes([
+        0xA9, 0x07,        # LDA #$07
+        0x8D, 0x00, 0x40,  # STA $4000, written on cycle 6
+        0x4C, 0x05, 0x02,  # JMP $0205
+    ])
+
+    @staticmethod
+    def consumer(address):
+        return bytes([
+            0xAD, address & 0xFF, address >> 8,  # LDA address
+            0xF0, 0xFB,                          # BEQ $0200
+            0x85, 0x10,                          # STA $10
+            0x00,                                # BRK
+        ])
+
+    def make_system(self, quantum, consumer_address=0x4000):
+        shared = RAM64K()
+        system = MultiCoreSystem(shared, [0x40], quantum=quantum)
+        producer_memory = RAM64K()
+        producer_memory.load(0x0200, self.PRODUCER)
+        consumer_memory = RAM64K()
+        consumer_memory.load(0x0200, self.consumer(consumer_address))
+        # The consumer runs first every round, it must not read ahead of the producer's write.
+        consumer = system.add_core(consumer_memory)
+        producer = system.add_core(producer_memory)
+        return system, shared, consumer, consumer_memory
+
+    def test_shared_access_order_is_independent_of_quantum(self):
+        for quantum in (1, 7, 1000):
+            system, shared, consumer, memory = self.make_system(quantum)
+            system.run(2000)
+
+            # Reads on cycles 4 and 11, the second sees the write, then BEQ, STA and the BRK fetch.
+            self.assertEqual(consumer.clock.cycles, 17)
+            self.assertEqual(memory[Word(0x10)], Byte(0x07))
+            self.assertEqual(shared[Word(0x4000)], Byte(0x07))
+            self.assertTrue(system.cores[0].halted)
+            self.assertGreaterEqual(system.cores[1].clock.cycles, 2000)
+
+    def test_events_on_the_system_clock(self):
+        for quantum in (1, 1000):
+            system, shared, consumer, memory = self.make_system(quantum, consumer_address=0x4001)
+            system.clock.events.schedule(100, shared.__setitem__, Word(0x4001), Byte(0x09))
+            system.run(2000)
+
+            # Polls on cycles 4, 11, ..., 102
+            self.assertEqual(consumer.clock.cycles, 108)
+            self.assertEqual(memory[Word(0x10)], Byte(0x09))
+
+    def test_idle_skip_polling_shared_memory(self):
+        cycles = []
+        for idle_skip in (False, True):
+            shared = RAM64K()
+            system = MultiCoreSystem(shared, [0x40], quantum=100)
+            consumer_memory = RAM64K()
+            consumer_memory.load(0x0200, self.consumer(0x4000))
+            consumer = system.add_core(consumer_memory, idle_skip=idle_skip)
+            # Gives the consumer's idle loop skipping a deadline to skip to.
+            consumer.clock.events.schedule(1000, lambda: None)
+            producer_memory = RAM64K()
+            producer_memory.load(0x0200, bytes([
+                0xA5, 0x10,        # LDA $10
+                0xF0, 0xFC,        # BEQ $0200
+                0x8D, 0x00, 0x40,  # STA $4000
+                0x4C, 0x07, 0x02,  # JMP $0207
+            ]))
+            producer = system.add_core(producer_memory)
+            producer.clock.events.schedule(400, producer_memory.__setitem__, Word(0x10), Byte(0x07))
+            system.run(2000)
+
+            self.assertTrue(system.cores[0].halted)
+            self.assertEqual(consumer_memory[Word(0x10)], Byte(0x07))
+            cycles.append(consumer.clock.cycles)
+        # The consumer sees the write when it happens rather than skipping ahead past it.
+        self.assertLess(cycles[0], 500)
+        self.assertEqual(cycles[1], cycles[0])
+
+    def test_private_memory(self):
+        system, shared, consumer, memory = self.make_system(1000)
+        system.run(100)
+        self.assertEqual(system.cores[1].cpu.memory[Word(0x10)], Byte(0x00))
+
+
+if __name__ == '__main__':
+    unittest.main()
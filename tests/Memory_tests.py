@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+from memory import RAM64K, ROM, Bus, SharedRAM, SharedRAMReader
+from data_types import Word, Byte
+from clock import UnthrottledClock
+from loaders import load_binary, load_prg, load_ihex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class MemoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = RAM64K()
+
+    def test_view_shares_storage(self):
+        view = self.memory.view(0x0200, 4)
+        view[1] = 0xA9
+        self.memory[Word(0x0202)] = Byte(0x05)
+
+        self.assertEqual(self.memory[Word(0x0201)], Byte(0xA9))
+        self.assertEqual(view.tobytes(), b'\x00\xA9\x05\x00')
+        self.assertFalse(view.readonly)
+
+    def test_load_and_dump(self):
+        self.memory.load(Word(0xFFFC), b'\x00\x02')
+        self.memory.load(0x0200, bytearray([0xA9, 0xD3]))
+
+        self.assertEqual(self.memory[Word(0xFFFD)], Byte(0x02))
+        self.assertEqual(self.memory.dump(0x0200, 3), b'\xA9\xD3\x00')
+        with self.assertRaises(ValueError):
+            self.memory.load(0xFFFF, b'\x01\x02')
+        with self.assertRaises(ValueError):
+            self.memory.dump(0xFFF0, 0x20)
+
+    def test_bus_bulk_access_uses_backing_memory(self):
+        bus = Bus(self.memory, UnthrottledClock())
+        bus.load(0x1000, b'abc')
+
+        self.assertEqual(self.memory.dump(0x1000, 3), b'abc')
+        self.assertEqual(bus.view(0x1000, 3).tobytes(), b'abc')
+
+    def test_rom_data_is_readable(self):
+        rom = ROM(0x10, [Byte(0xEA), 0x4C])
+
+        self.assertEqual(rom[1], Byte(0x4C))
+        self.assertEqual(rom.dump(0, 2), b'\xEA\x4C')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy_view(self):
+        array = self.memory.numpy(0x0400, 0x100)
+        array[:] = numpy.arange(0x100, dtype=numpy.uint8)
+
+        self.assertEqual(self.memory[Word(0x04FF)], Byte(0xFF))
+
+
+def read_shared(name, queue):
+    reader = SharedRAMReader(name)
+    queue.put((reader.read(0x0200, 4), reader.sequence))
+    reader.close()
+
+
+class SharedRAMTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = SharedRAM()
+
+    def tearDown(self):
+        self.memory.close()
+        self.memory.unlink()
+
+    def test_writes_bump_sequence(self):
+        self.memory[Word(0x0200)] = Byte(0xA9)
+        self.memory.load(0x0201, b'\xD3\xEA')
+
+        self.assertEqual(self.memory.sequence, 4)
+        self.assertEqual(self.memory.dump(0x0200, 3), b'\xA9\xD3\xEA')
+
+    def test_reader_in_other_process(self):
+        self.memory.load(0x0200, b'\x01\x02\x03\x04')
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=read_shared, args=(self.memory.name, queue))
+        process.start()
+        data, sequence = queue.get(timeout=10)
+        process.join()
+
+        self.assertEqual(data, b'\x01\x02\x03\x04')
+        self.assertEqual(sequence, 2)
+
+    def test_reader_detects_write_in_progress(self):
+        reader = SharedRAMReader(self.memory.name)
+        self.memory._sequence[0] += 1
+        with self.assertRaises(RuntimeError):
+            reader.read(0, 4, retries=10)
+        self.memory._sequence[0] += 1
+        self.assertEqual(reader.read(0, 4), bytes(4))
+        reader.close()
+
+
+class LoadersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = RAM64K()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_load_binary(self):
+        path = self.write('rom.bin', b'\xEA' * 0x100)
+
+        self.assertEqual(load_binary(self.memory, path, 0xFF00), 0x100)
+        self.assertEqual(self.memory.dump(0xFF00, 0x100), b'\xEA' * 0x100)
+
+    def test_load_prg(self):
+        path = self.write('program.prg', b'\x01\x08\xA9\x05')
+
+        self.assertEqual(load_prg(self.memory, path), 0x0801)
+        self.assertEqual(self.memory.dump(0x0801, 2), b'\xA9\x05')
+
+    def test_load_ihex(self):
+        path = self.write('program.hex', b':03020000A9D3EA95\n:0400000500000200F5\n:00000001FF\n')
+
+        self.assertEqual(load_ihex(self.memory, path), 0x0200)
+        self.assertEqual(self.memory.dump(0x0200, 3), b'\xA9\xD3\xEA')
+
+    def test_load_ihex_bad_checksum(self):
+        path = self.write('program.hex', b':03020000A9D3EA96\n')
+
+        with self.assertRaises(ValueError):
+            load_ihex(self.memory, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,243 @@
+from devices import Device
+from clock import Clock
+
+# Register offsets
+ORB = 0x0
+ORA = 0x1
+DDRB = 0x2
+DDRA = 0x3
+T1C_L = 0x4
+T1C_H = 0x5
+T1L_L = 0x6
+T1L_H = 0x7
+T2C_L = 0x8
+T2C_H = 0x9
+SR = 0xA
+ACR = 0xB
+PCR = 0xC
+IFR = 0xD
+IER = 0xE
+ORA_NO_HANDSHAKE = 0xF
+
+# Interrupt flag bits
+IFR_T2 = 0x20
+IFR_T1 = 0x40
+IFR_IRQ = 0x80
+
+# Auxiliary control bits
+ACR_T1_FREE_RUN = 0x40
+ACR_T2_COUNT_PULSES = 0x20
+
+
+class VIA6522(Device):
+    """
+    6522 Versatile Interface Adapter with its two timers and two 8-bit ports.
+
+    Timers are not decremented per cycle. Writing a counter records the cycle it was loaded on, reads work the
+    current value out from the elapsed cycles. Only underflows that set a clear interrupt flag are scheduled as clock
+    events, so a free-running timer costs one event per interrupt the firmware acknowledges, not one per period.
+
+    An underflow is flagged N + 2 cycles after writing N, the real part does it after N + 1.5. PB7 output, pulse
+    counting, the shift register and the CA/CB handshake lines are not modelled, SR and PCR just hold their value.
+
+    irq is called as irq(source, asserted), e.g. CPU6502.set_irq. pins_a and pins_b are the levels driven onto the
+    ports from outside, output_a and output_b are called with the output bits whenever a port's output changes.
+    """
+    stable_registers = frozenset({ORB, ORA, DDRB, DDRA, T1L_L, T1L_H, SR, ACR, PCR, IFR, IER, ORA_NO_HANDSHAKE})
+
+    def __init__(self, clock: Clock, base: int, irq=None, output_a=None, output_b=None):
+        super().__init__(clock, base, 0x10)
+        self.irq = irq
+        self.output_a = output_a
+        self.output_b = output_b
+        self.pins_a = 0xFF
+        self.pins_b = 0xFF
+
+        self.ora = 0
+        self.orb = 0
+        self.ddra = 0
+        self.ddrb = 0
+        self.sr = 0
+        self.acr = 0
+        self.pcr = 0
+        self.ifr = 0
+        self.ier = 0
+
+        # Each counter held value at cycle start and decrements once per cycle from there.
+        self.t1_latch = 0xFFFF
+        self.t1_value = 0xFFFF
+        self.t1_start = self.synced_cycle
+        self.t1_armed = False
+        self.t2_latch_low = 0xFF
+        self.t2_value = 0xFFFF
+        self.t2_start = self.synced_cycle
+        self.t2_armed = False
+
+        self._irq_asserted = False
+
+    def t1_counter(self, cycle: int) -> int:
+        elapsed = cycle - self.t1_start
+        if elapsed <= 0:
+            return self.t1_value
+        return (self.t1_value - elapsed) & 0xFFFF
+
+    def t2_counter(self, cycle: int) -> int:
+        elapsed = cycle - self.t2_start
+        if elapsed <= 0 or self.acr & ACR_T2_COUNT_PULSES:
+            return self.t2_value
+        return (self.t2_value - elapsed) & 0xFFFF
+
+    def _t1_underflow(self) -> int:
+        # The counter passes 0 and reads 0xFFFF this many cycles after being loaded.
+        return self.t1_start + self.t1_value + 1
+
+    def _t2_underflow(self) -> int:
+        return self.t2_start + self.t2_value + 1
+
+    def catch_up(self, start: int, end: int):
+        if self.acr & ACR_T1_FREE_RUN:
+            underflow = self._t1_underflow()
+            if underflow <= end:
+                self.ifr |= IFR_T1
+                # After 0xFFFF the counter reloads from the latch, so later periods are latch + 2 cycles long.
+                period = self.t1_latch + 2
+                underflow += (end - underflow) // period * period
+                self.t1_start = underflow + 1
+                self.t1_value = self.t1_latch
+        elif self.t1_armed and self._t1_underflow() <= end:
+            # One-shot, the counter keeps decrementing but interrupts only once.
+            self.ifr |= IFR_T1
+            self.t1_armed = False
+        if self.t2_armed and not self.acr & ACR_T2_COUNT_PULSES and self._t2_underflow() <= end:
+            self.ifr |= IFR_T2
+            self.t2_armed = False
+
+    def on_deadline(self, cycle: int):
+        self._update_irq()
+        self._reschedule()
+
+    def _reschedule(self):
+        deadlines = []
+        # Polling loops may be fast-forwarded up to the next event, so every flag change needs one, enabled or not.
+        if not self.ifr & IFR_T1 and (self.t1_armed or self.acr & ACR_T1_FREE_RUN):
+            deadlines.append(self._t1_underflow())
+        if not self.ifr & IFR_T2 and self.t2_armed and not self.acr & ACR_T2_COUNT_PULSES:
+            deadlines.append(self._t2_underflow())
+        if deadlines:
+            self.schedule_deadline(min(deadlines))
+        else:
+            self.cancel_deadline()
+
+    def _update_irq(self):
+        asserted = bool(self.ifr & self.ier & 0x7F)
+        if asserted != self._irq_asserted:
+            self._irq_asserted = asserted
+            if self.irq is not None:
+                self.irq(self, asserted)
+
+    def read(self, offset: int) -> int:
+        cycle = self.synced_cycle
+        if offset == ORB:
+            return (self.orb & self.ddrb) | (self.pins_b & ~self.ddrb & 0xFF)
+        if offset == ORA or offset == ORA_NO_HANDSHAKE:
+            return (self.ora & self.ddra) | (self.pins_a & ~self.ddra & 0xFF)
+        if offset == DDRB:
+            return self.ddrb
+        if offset == DDRA:
+            return self.ddra
+        if offset == T1C_L:
+            self._clear_flags(IFR_T1)
+            return self.t1_counter(cycle) & 0xFF
+        if offset == T1C_H:
+            return self.t1_counter(cycle) >> 8
+        if offset == T1L_L:
+            return self.t1_latch & 0xFF
+        if offset == T1L_H:
+            return self.t1_latch >> 8
+        if offset == T2C_L:
+            self._clear_flags(IFR_T2)
+            return self.t2_counter(cycle) & 0xFF
+        if offset == T2C_H:
+            return self.t2_counter(cycle) >> 8
+        if offset == SR:
+            return self.sr
+        if offset == ACR:
+            return self.acr
+        if offset == PCR:
+            return self.pcr
+        if offset == IFR:
+            return self.ifr | (IFR_IRQ if self.ifr & self.ier & 0x7F else 0)
+        # IER, bit 7 always reads as set.
+        return self.ier | 0x80
+
+    def write(self, offset: int, value: int):
+        # The counter starts counting down on the cycle after the write.
+        cycle = self.synced_cycle + 1
+        if offset == ORB:
+            self.orb = value
+            self._output_b()
+        elif offset == ORA or offset == ORA_NO_HANDSHAKE:
+            self.ora = value
+            self._output_a()
+        elif offset == DDRB:
+            self.ddrb = value
+            self._output_b()
+        elif offset == DDRA:
+            self.ddra = value
+            self._output_a()
+        elif offset == T1C_L or offset == T1L_L:
+            self.t1_latch = (self.t1_latch & 0xFF00) | value
+        elif offset == T1C_H:
+            self.t1_latch = (value << 8) | (self.t1_latch & 0xFF)
+            self.t1_value = self.t1_latch
+            self.t1_start = cycle
+            self.t1_armed = True
+            self._clear_flags(IFR_T1)
+        elif offset == T1L_H:
+            if self.acr & ACR_T1_FREE_RUN:
+                # Keep the current count, only later periods pick up the new latch.
+                self.t1_value = self.t1_counter(self.synced_cycle)
+                self.t1_start = self.synced_cycle
+            self.t1_latch = (value << 8) | (self.t1_latch & 0xFF)
+            self._clear_flags(IFR_T1)
+        elif offset == T2C_L:
+            self.t2_latch_low = value
+        elif offset == T2C_H:
+            self.t2_value = (value << 8) | self.t2_latch_low
+            self.t2_start = cycle
+            self.t2_armed = True
+            self._clear_flags(IFR_T2)
+        elif offset == SR:
+            self.sr = value
+        elif offset == ACR:
+            # Re-anchor the counters so a mode change only affects counting from now on.
+            self.t1_value = self.t1_counter(self.synced_cycle)
+            self.t1_start = self.synced_cycle
+            self.t2_value = self.t2_counter(self.synced_cycle)
+            self.t2_start = self.synced_cycle
+            self.acr = value
+        elif offset == PCR:
+            self.pcr = value
+        elif offset == IFR:
+            self._clear_flags(value & 0x7F)
+        else:
+            if value & 0x80:
+                self.ier |= value & 0x7F
+            else:
+                self.ier &= ~value & 0x7F
+            self._update_irq()
+        self._reschedule()
+
+    def _clear_flags(self, flags: int):
+        if self.ifr & flags:
+            self.ifr &= ~flags & 0x7F
+            self._update_irq()
+            self._reschedule()
+
+    def _output_a(self):
+        if self.output_a is not None:
+            self.output_a(self.ora & self.ddra)
+
+    def _output_b(self):
+        if self.output_b is not None:
+            self.output_b(self.orb & self.ddrb)